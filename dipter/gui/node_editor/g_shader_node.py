@@ -14,6 +14,7 @@ from dipter.gui.node_editor.g_edge import GEdge
 from dipter.gui.node_editor.g_node_socket import GNodeSocket
 from dipter.gui.node_editor.layouts import GraphicsGridLayout
 from dipter.gui.node_editor.node_scene import NodeScene
+from dipter.gui.node_editor.shader_compiler import ShaderCompiler
 from dipter.gui.widgets.node_input.array_input import ArrayInput
 from dipter.gui.widgets.node_input.color_input import ColorInput
 from dipter.gui.widgets.node_input.int_choice_input import IntChoiceInput
@@ -24,6 +25,7 @@ from dipter.node_graph.data_type import DataType
 from dipter.node_graph.edge import Edge
 from dipter.node_graph.node import ShaderNode
 from dipter.node_graph.node_socket import NodeSocket
+from dipter.opengl.uniform_batch import UniformBatch
 from dipter.shaders.shader_super import Shader
 from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
 
@@ -418,6 +420,10 @@ class GMaterialOutputNode(GShaderNode):
         self._program = self.get_shader().get_program()
         self._io_mapping = {}  # node.id() -> (uniform name, modified uniform name)
         self._connected_node = None
+        self._tracked_nodes = set()  # Nodes whose signals are connected to this node
+        self._uniforms = UniformBatch(self._program)
+        self._compiler = ShaderCompiler(self.get_shader(), self)
+        self._compiler.compiled.connect(self._handle_program_compiled)
 
     def _handle_socket_connection(self, socket: GNodeSocket, edge: Edge):
         # Start tracking the connected node, so that each time it gets connected, the Material Output Node is notified
@@ -425,6 +431,7 @@ class GMaterialOutputNode(GShaderNode):
         self._handle_graph_change()
 
     def _handle_node_deletion(self, node: 'GShaderNode'):
+        self._tracked_nodes.discard(node)
         if node == self._connected_node:
             self._connected_node = None
 
@@ -434,33 +441,48 @@ class GMaterialOutputNode(GShaderNode):
         connected_nodes = [] if self._connected_node is None else self._connected_node.get_ancestor_nodes(add_self=True)
 
         for n in connected_nodes:
-            n.connection_changed.connect(self._handle_graph_change)
-            n.deleted.connect(self._handle_node_deletion)
-            n.input_changed.connect(self._handle_input_changed)
-
-        self._recompile()  # Compile and get new program
-        # self._create_io_mapping(connected_nodes)  # needs to be called after the code has been compiled.
-        for node in connected_nodes:
-            self._handle_input_changed(node)  # send current input from not node_graph to program
+            if n not in self._tracked_nodes:  # Only connect signals once per node
+                n.connection_changed.connect(self._handle_graph_change)
+                n.deleted.connect(self._handle_node_deletion)
+                n.input_changed.connect(self._handle_input_changed)
+                self._tracked_nodes.add(n)
+
+        self._compiler.request_compile()  # Compile in the background, the new program is set when it is ready
+
+    def _handle_program_compiled(self, program: Program):
+        self._program = program
+        self._uniforms.set_program(program)
+        self.push_uniforms()  # send current input from not node_graph to program
         self.graph_changed.emit()  # Notify the material that the node_graph has changed and there's a new program ready
 
-    def _recompile(self):
-        self.get_shader().recompile(self)
-        self._program = self.get_shader().get_program()
-
     def _handle_input_changed(self, node: GShaderNode):
-        set_program_uniforms_from_node(self._program, node)
+        self._uniforms.set_from_node(node)
+
+    def push_uniforms(self):
+        """Queues the uniforms of the Program held by this node from all connected nodes for upload. Programs are shared between materials with
+        the same node graph, so this has to be called before the Program is used after another material has used it."""
+        self._uniforms.invalidate()
+        if self._connected_node is not None:
+            for node in self._connected_node.get_ancestor_nodes(add_self=True):
+                self._uniforms.set_from_node(node)
+
+    def flush_uniforms(self) -> int:
+        """Uploads all changed uniforms to the Program held by this node. Should be called right before the Program is drawn.
+
+        :return: the number of uniforms that were uploaded"""
+        return self._uniforms.flush()
 
     def get_program(self, copy=True, set_input=True) -> Program:
         """
         Gets the full compiled Program of the node tree.
-        :param copy: If True, recompiles the shader and returns a copy of the Program or else returns the instance held by this Node.
+        :param copy: If True, returns a copy of the Program that is not shared with anyone else, or else returns the (possibly shared) instance
+            held by this Node.
         :param set_input: If True, will set the appropriate input to the program from all connected nodes. Only applicable is copy=True.
         :return: a gloo.Program instance.
         """
         if copy:
-            _, _, program = self.get_shader().compile(self)
-            if set_input:
+            program = self.get_shader().copy_program()
+            if set_input and self._connected_node is not None:
                 connected_nodes = self._connected_node.get_ancestor_nodes(add_self=True)
                 for node in connected_nodes:
                     set_program_uniforms_from_node(program, node)
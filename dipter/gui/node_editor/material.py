@@ -101,6 +101,19 @@ class Material(QObject):
     def get_material_output_node(self) -> GMaterialOutputNode:
         return self._mat_output_node
 
+    def push_uniforms(self):
+        """Sets the uniforms of the Program of this material. Needs to be called when this material becomes active, as Programs are shared
+        between materials with the same node graph."""
+        if self._mat_output_node is not None:
+            self._mat_output_node.push_uniforms()
+
+    def flush_uniforms(self) -> int:
+        """Uploads the uniforms that have changed since the last flush to the Program of this material."""
+        if self._mat_output_node is not None:
+            return self._mat_output_node.flush_uniforms()
+
+        return 0
+
     def _handle_graph_change(self):
         self._program = self._mat_output_node.get_program(copy=False)
         self.program_ready.emit(self.program)
@@ -0,0 +1,112 @@
+import logging
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QThread, QCoreApplication, QTimer
+
+from dipter.shaders.shader_super import CompilableShader
+
+_logger = logging.getLogger(__name__)
+
+_thread = None
+
+
+def _compile_thread() -> QThread:
+    """Returns the thread that all ShaderCompilers run on, starting it on first use."""
+    global _thread
+    if _thread is None:
+        _thread = QThread()
+        _thread.setObjectName("ShaderCompilerThread")
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_stop_compile_thread)
+        _thread.start()
+
+    return _thread
+
+
+def _stop_compile_thread():
+    if _thread is not None:
+        _thread.quit()
+        _thread.wait()
+
+
+class ShaderCompiler(QObject):
+    """
+    Compiles the node graph of a shader. The GLSL code is generated on the thread that owns the graph, since it walks the live nodes, and the
+    Program is built from the code on a background thread. Compile requests are coalesced, so that a burst of edits only results in a single new
+    Program, compiled from the latest graph.
+    """
+    compiled = pyqtSignal(object)  # The compiled gloo.Program
+
+    def __init__(self, shader: CompilableShader, node: 'GShaderNode'):
+        super().__init__()
+        self._shader = shader
+        self._node = node
+        self._scheduled = False
+        self._builder = _ProgramBuilder(shader)
+        self._builder.built.connect(self._handle_built)
+
+    def request_compile(self):
+        """Requests a new compilation of the node graph. Has to be called from the thread that owns the node graph."""
+        if self._scheduled:
+            return  # The code is generated once control returns to the event loop, and will see the latest graph
+        self._scheduled = True
+        QTimer.singleShot(0, self._generate_code)
+
+    def _generate_code(self):
+        self._scheduled = False
+        try:
+            vertex_code, fragment_code = self._shader.generate_code(self._node)
+        except Exception as e:
+            _logger.exception("Failed to generate the code of {}: {}".format(self._shader.get_name(), e))
+            return
+
+        self._builder.request_build(vertex_code, fragment_code)
+
+    def _handle_built(self, vertex_code: str, fragment_code: str, shaders: tuple):
+        self._shader.set_compiled(vertex_code, fragment_code, shaders)
+        self.compiled.emit(shaders[2])
+
+
+class _ProgramBuilder(QObject):
+    """Builds Programs from GLSL code on the compile thread. Only the Program of the latest code is reported if several builds are requested
+    while one is running."""
+    built = pyqtSignal(str, str, object)  # Vertex code, fragment code and the (VertexShader, FragmentShader, Program) built from them
+    _requested = pyqtSignal()
+
+    def __init__(self, shader: CompilableShader):
+        super().__init__()
+        self._shader = shader
+        self._code = None  # The latest code that has not been built yet
+        self._lock = threading.Lock()
+
+        self.moveToThread(_compile_thread())
+        self._requested.connect(self._build)
+
+    def request_build(self, vertex_code: str, fragment_code: str):
+        """Requests a Program to be built from the given code. Can be called from any thread."""
+        with self._lock:
+            queued = self._code is not None
+            self._code = (vertex_code, fragment_code)
+        if not queued:
+            self._requested.emit()
+
+    @pyqtSlot()
+    def _build(self):
+        result = None
+        while True:
+            with self._lock:
+                if self._code is None:
+                    break
+                vertex_code, fragment_code = self._code
+                self._code = None
+
+            try:
+                # Cached, since materials with the same node graph can share a Program: they are all drawn in the node editor's view
+                result = (vertex_code, fragment_code, self._shader.build(vertex_code, fragment_code, use_cache=True))
+            except Exception as e:
+                _logger.exception("Failed to build the program of {}: {}".format(self._shader.get_name(), e))
+                result = None
+
+        if result is not None:
+            self.built.emit(*result)
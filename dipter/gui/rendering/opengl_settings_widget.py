@@ -1,7 +1,7 @@
 import types
 
 from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QWidget, QComboBox, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QMessageBox
+from PyQt5.QtWidgets import QWidget, QComboBox, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QMessageBox, QCheckBox
 from dipter.gui.texture_matching.texture_matcher import TextureMatcher
 from dipter.gui.node_editor.control_center import ControlCenter
 from dipter.gui.rendering.opengl_widget import OpenGLWidget
@@ -47,6 +47,8 @@ class OpenGLSettingsWidget(QWidget):
         self._reset_view_button = QPushButton("Reset Scene View")
         self._match_texture_button = QPushButton("Match Texture")
         self._randomize_button = QPushButton("Randomize Parameters")
+        self._continuous_checkbox = QCheckBox("Render continuously")
+        self._frame_time_label = QLabel("Frame time: - ms")
         self._matcher = None
 
         # Define data variables
@@ -78,6 +80,13 @@ class OpenGLSettingsWidget(QWidget):
         self._randomize_button.clicked.connect(self._randomize_shader_model)
         self._layout.addWidget(self._randomize_button)
 
+        # Setup render mode and frame time display
+        self._continuous_checkbox.setChecked(self._open_gl_widget.continuous_rendering)
+        self._continuous_checkbox.stateChanged.connect(self._handle_continuous_rendering_change)
+        self._layout.addWidget(self._continuous_checkbox)
+        self._open_gl_widget.frame_rendered.connect(self._update_frame_time)
+        self._layout.addWidget(self._frame_time_label)
+
         self._layout.setAlignment(Qt.AlignTop)
         self.setLayout(self._layout)
         self.show()
@@ -85,6 +94,12 @@ class OpenGLSettingsWidget(QWidget):
     def _reset_view(self):
         self._open_gl_widget.reset_view()
 
+    def _handle_continuous_rendering_change(self, state: int):
+        self._open_gl_widget.continuous_rendering = state == Qt.Checked
+
+    def _update_frame_time(self, frame_time: float):
+        self._frame_time_label.setText("Frame time: {:.2f} ms".format(frame_time))
+
     def _send_defaults_to_gl(self):
         self._handle_object_vertices_list_change(self.OBJECT_VERTICES_DEFAULT)
 
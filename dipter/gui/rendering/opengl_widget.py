@@ -24,6 +24,7 @@ class OpenGLWidget(QOpenGLWidget):
     TEXTURE_RENDER_MODE = 0
     FREE_RENDER_MODE = 1
     init_done = pyqtSignal()
+    frame_rendered = pyqtSignal(float)  # Time in milliseconds that it took to render the frame
 
     def __init__(self, width: int=100, height: int=100, cc: ControlCenter = None, render_mode: int = FREE_RENDER_MODE):
         super().__init__()
@@ -33,6 +34,7 @@ class OpenGLWidget(QOpenGLWidget):
         self._render_mode = render_mode
         self._program = None
         self._default_program = None
+        self._material = None
         self._shader = None
         self._timer = None
         self._I = None
@@ -41,6 +43,8 @@ class OpenGLWidget(QOpenGLWidget):
         # Define variables for settings
         self._clear_color = np.array((0.4, 0.4, 0.4, 1.0), dtype=np.float32)
         self._frame_rate = 60
+        self._continuous_rendering = False
+        self._frame_time = 0.0
         self._far_clip_z = 100.0
         self._near_clip_z = 0.5
 
@@ -70,8 +74,29 @@ class OpenGLWidget(QOpenGLWidget):
     @frame_rate.setter
     def frame_rate(self, value: int):
         assert value <= 1000, "Frame rate can not be set higher than 1000 fps"
-        self.frame_rate = value
-        self._timer.setInterval(int(1000 / self.frame_rate))
+        self._frame_rate = value
+        if self._timer is not None:
+            self._timer.setInterval(int(1000 / self.frame_rate))
+
+    @property
+    def continuous_rendering(self) -> bool:
+        return self._continuous_rendering
+
+    @continuous_rendering.setter
+    def continuous_rendering(self, value: bool):
+        """If True, the scene is rendered continuously at the frame rate, which is needed for animated shaders. Otherwise, the scene is only
+        rendered when something has changed."""
+        self._continuous_rendering = value
+        if self._timer is not None:
+            if value:
+                self._timer.start()
+            else:
+                self._timer.stop()
+
+    @property
+    def frame_time(self) -> float:
+        """Returns the time in milliseconds that it took to render the last frame."""
+        return self._frame_time
 
     def initializeGL(self):
         gl.glEnable(gl.GL_DEPTH_TEST)
@@ -86,20 +111,27 @@ class OpenGLWidget(QOpenGLWidget):
         if self.cc:
             self.cc.active_material_changed.connect(self._active_material_changed)
 
-        # Start an update timer to refresh rendering
+        # Create an update timer that refreshes rendering continuously, only used in continuous rendering mode
         self._timer = QTimer()
         self._timer.setInterval(int(1000 / self._frame_rate))
         self._timer.timeout.connect(self.update)
-        self._timer.start()
+        self.continuous_rendering = self._continuous_rendering
         self.init_done.emit()
 
     def _active_material_changed(self, material: Material):
+        if self._material is not None:
+            self._material.program_ready.disconnect(self.set_program)
+            self._material.changed.disconnect(self.update)
+        self._material = material
+
         if material.program is not None:
+            material.push_uniforms()  # The program might have been used by another material with the same node graph
             self.set_program(material.program)
         else:
             self.set_program(self._default_program)
 
         material.program_ready.connect(self.set_program)
+        material.changed.connect(self.update)  # Node inputs or the node graph changed, render the new material
 
     def set_program(self, program: Program):
         self._program = program
@@ -123,7 +155,11 @@ class OpenGLWidget(QOpenGLWidget):
         _logger.info("Done initializing default shader.")
 
     def paintGL(self):
+        start = time.perf_counter()
         gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        if self._material is not None:
+            self._material.flush_uniforms()  # Upload all uniform changes since the last frame at once
+
         if self._program is not None:
             # Send the updated transformation matrices to the shader
             self._program[OBJECT_MATRIX_NAME] = self._object_to_world
@@ -134,6 +170,9 @@ class OpenGLWidget(QOpenGLWidget):
 
             self._program.draw(gl.GL_TRIANGLES, self._I)
 
+        self._frame_time = (time.perf_counter() - start) * 1000
+        self.frame_rendered.emit(self._frame_time)
+
     def resizeGL(self, w: int, h: int):
         if self._render_mode == self.FREE_RENDER_MODE:
             self._set_perspective_projection(w, h)
@@ -152,11 +191,14 @@ class OpenGLWidget(QOpenGLWidget):
         if self._program is not None:
             self._program.bind(self._V)
 
+        self.update()
+
     def reset_view(self):
         """Resets the rotation and scaling of the rendered object."""
         self._world_to_view = np.eye(4, dtype=np.float32)
         self._object_to_world = np.eye(4, dtype=np.float32)
         self._init_camera()
+        self.update()
 
     def _set_perspective_projection(self, w: int, h: int):
         ratio = w / float(h)
@@ -217,6 +259,7 @@ class OpenGLWidget(QOpenGLWidget):
 
         distance_speedup = np.clip(abs(view_y) / 4.0, 1.0, 10.0)
         glm.translate(self._world_to_view, 0, 0, scroll_steps * self._scroll_speed * distance_speedup)
+        self.update()
 
     def mouseMoveEvent(self, mouse_event):
         if self._render_mode == self.TEXTURE_RENDER_MODE:
@@ -241,6 +284,7 @@ class OpenGLWidget(QOpenGLWidget):
 
             glm.rotate(self._object_to_world, x_angle, 1, 0, 0)
             glm.rotate(self._object_to_world, y_angle, 0, 1, 0)
+            self.update()
 
     def mouseReleaseEvent(self, mouse_event: QMouseEvent):
         # if a right click occurred, open context menu
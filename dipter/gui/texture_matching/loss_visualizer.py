@@ -2,7 +2,6 @@ import logging
 import typing
 
 import numpy as np
-import torch
 from PIL.Image import Image
 from PyQt5.QtCore import QThread, Qt
 from PyQt5.QtGui import QBrush, QColor
@@ -18,6 +17,7 @@ from dipter.misc import image_funcs
 from dipter.misc.fifo_queue import FIFOQueue
 from dipter.node_graph.parameter import Parameter
 from dipter.optimization.gradient_descent import GradientDescentSettings, GradientDescent
+from dipter.optimization.loss_surface import LossSurface, SurfaceAxis
 
 _logger = logging.getLogger(__name__)
 
@@ -76,6 +76,12 @@ class LossVisualizer(QWidget):
         self._hist_p2 = []
         self._plot_line3d = None
         self._progress_dialog = None
+        self._surface = None
+        self._surface_thread = None
+        self._loss_surface = None
+        self._plotted_rows = 0
+        self._P1 = None
+        self._P2 = None
 
         self._init()
         self._list_parameters()
@@ -187,13 +193,12 @@ class LossVisualizer(QWidget):
 
         W, H = self._settings.render_width, self._settings.render_height
         R1, R2 = self._p1_res.get_gl_value(), self._p2_res.get_gl_value()
-        progress_dialog = QProgressDialog("Calculating loss surface...", "Cancel", 0, R1 - 1, self)
-        progress_dialog.setWindowTitle("Calculating")
-        progress_dialog.setWindowModality(Qt.WindowModal)
-        progress_dialog.setMinimumDuration(1)
+        self._progress_dialog = QProgressDialog("Calculating loss surface...", "Cancel", 0, R1 * R2, self)
+        self._progress_dialog.setWindowTitle("Calculating")
+        self._progress_dialog.setWindowModality(Qt.WindowModal)
+        self._progress_dialog.setMinimumDuration(1)
 
         self._target_matrix = image_funcs.image_to_tensor(self._target_image, (W, H))
-        loss_surface = np.empty((R1, R2))
         loss_f = self._settings.loss_func(**self._settings.loss_args)
         checked_items = self._checked_items()
 
@@ -202,58 +207,71 @@ class LossVisualizer(QWidget):
         item1_max = checked_items[0][2].get_gl_value()
         self._fig_ax.set_xlabel(item1.label)
         self._p1: Parameter = item1.content["param"]
-        p1_index = item1.content["index"]
-        self._p1.save_value()
-        p1_values = torch.from_numpy(np.linspace(item1_min, item1_max, num=R1, endpoint=True))
+        axis1 = SurfaceAxis(self._p1, item1.content["index"], np.linspace(item1_min, item1_max, num=R1, endpoint=True))
 
         item2 = checked_items[1][0]
         item2_min = checked_items[1][1].get_gl_value()
         item2_max = checked_items[1][2].get_gl_value()
         self._fig_ax.set_ylabel(item2.label)
         self._p2: Parameter = item2.content["param"]
-        p2_index = item2.content["index"]
-        self._p2.save_value()
-        p2_values = torch.from_numpy(np.linspace(item2_min, item2_max, num=R2, endpoint=True))
-
-        min_loss = np.finfo(np.float32).max
-        min_loss_p1 = None
-        min_loss_p2 = None
-
-        for i in range(R1):
-            self._p1.set_value(p1_values[i], index=p1_index)
-            progress_dialog.setValue(i)
-
-            if progress_dialog.wasCanceled():
-                return
-
-            for j in range(R2):
-                self._p2.set_value(p2_values[j], index=p2_index)
-                r, _ = self._mat_out_node.get_backend_node().render(W, H, retain_graph=True)
-                loss = loss_f(r, self._target_matrix).detach().clone().cpu().numpy()
-
-                if loss < min_loss:
-                    min_loss = loss
-                    min_loss_p1 = self._p1.get_value(p1_index)
-                    min_loss_p2 = self._p2.get_value(p2_index)
-
-                loss_surface[i, j] = loss
-
-            _logger.info("{:.2f}% complete...".format((i + 1) / R1 * 100))
+        axis2 = SurfaceAxis(self._p2, item2.content["index"], np.linspace(item2_min, item2_max, num=R2, endpoint=True))
+
+        self._P1, self._P2 = np.meshgrid(axis1.values.numpy(), axis2.values.numpy(), indexing="ij")
+        self._loss_surface = np.full((R1, R2), np.nan, dtype=np.float32)
+        self._plotted_rows = 0
+
+        self._surface = LossSurface(self._mat_out_node.get_backend_node(), self._target_matrix, W, H, loss_f, axis1, axis2)
+        self._surface_thread = QThread()
+        self._surface.moveToThread(self._surface_thread)
+        self._surface.chunk_done.connect(self._surface_chunk_done)
+        self._surface.finished.connect(self._surface_finished)
+        self._progress_dialog.canceled.connect(self._surface.stop)
+        self._surface_thread.started.connect(self._surface.run)
+        self._plot_button.setEnabled(False)
+        self._surface_thread.start()
+
+    def _surface_chunk_done(self, start: int, losses: np.ndarray):
+        flat = self._loss_surface.reshape(-1)
+        flat[start:start + len(losses)] = losses
+        self._progress_dialog.setValue(start + len(losses))
+
+        # Only complete rows can be drawn as a surface
+        rows = (start + len(losses)) // self._loss_surface.shape[1]
+        if rows >= 2 and rows > self._plotted_rows:
+            self._plotted_rows = rows
+            self._draw_surface(rows)
+
+    def _surface_finished(self, loss_surface: np.ndarray):
+        self._surface_thread.quit()
+        self._surface_thread.wait()
+        self._plot_button.setEnabled(True)
+        self._progress_dialog.setValue(self._progress_dialog.maximum())
 
-        P1, P2 = torch.meshgrid([p1_values, p2_values])
-        self._p1.restore_value()
-        self._p2.restore_value()
+        if np.isnan(loss_surface).any():  # Calculation was canceled
+            return
 
-        self._fig_ax.plot_surface(P1, P2, loss_surface, cmap=plt.cm.viridis)
-        self._fig_ax.set_zlim(bottom=0)
+        self._loss_surface = loss_surface
+        self._draw_surface(loss_surface.shape[0])
 
         # Add min value marker
-        self._fig_ax.plot([min_loss_p1], [min_loss_p2], [min_loss], marker='+', color="#ff00ff", markersize=14, markeredgewidth=2.5)
-        # self._fig_ax.text(min_loss_p1, min_loss_p2, min_loss * 1.1, "Minimum Loss = {:.4f}".format(float(min_loss)), color='#ff00ff')
+        i, j = np.unravel_index(np.argmin(loss_surface), loss_surface.shape)
+        self._fig_ax.plot([self._P1[i, j]], [self._P2[i, j]], [loss_surface[i, j]], marker='+', color="#ff00ff", markersize=14,
+                          markeredgewidth=2.5)
 
         self._canvas.draw()
         self._start_gd_button.setEnabled(True)
 
+    def _draw_surface(self, rows: int):
+        xlabel, ylabel = self._fig_ax.get_xlabel(), self._fig_ax.get_ylabel()
+        self._fig_ax.clear()
+        self._fig_ax.set_title("Loss Surface")
+        self._fig_ax.set_xlabel(xlabel)
+        self._fig_ax.set_ylabel(ylabel)
+        self._fig_ax.set_zlabel("Loss Value")
+        self._fig_ax.plot_surface(self._P1[:rows], self._P2[:rows], self._loss_surface[:rows], cmap=plt.cm.viridis)
+        self._fig_ax.set_zlim(bottom=0)
+        self._canvas.draw()
+
     def _start_gd(self):
         self._hist_p2 = np.empty(self._settings.max_iter)
         self._hist_p1 = np.empty(self._settings.max_iter)
@@ -28,6 +28,7 @@ from dipter.node_graph.parameter import Parameter
 from dipter.optimization import losses
 from dipter.optimization.gradient_descent import GradientDescent, GradientDescentSettings, run_in_thread
 from dipter.optimization.losses import Loss
+from dipter.optimization.texture_matching import save_hdf5
 
 sns.set()
 
@@ -511,23 +512,14 @@ class TextureMatcher(QWidget):
                 _logger.error("Uniform {} does not exist in program!".format(uniform_key))
                 raise e
 
+        self._openGL.update()  # The view only repaints on demand, and the uniforms of this program are not tracked by a material
+
     def _open_loss_viz_window(self):
         self._loss_visualizer.open(self._settings_panel.settings(), self._target_image, self._out_node)
 
     def _save_data(self, filename: str):
         mat_name = self.cc.active_material.name
-        settings = self._settings_panel.settings().to_dict()
-        f = h5py.File(filename, "w")
-        dset = f.create_dataset("data", data=self._loss_hist, dtype="f")
-
-        for key, value in settings.items():
-            try:
-                dset.attrs[key] = value
-            except TypeError:
-                dset.attrs[key] = str(value)
-        dset.attrs["material_name"] = mat_name
-        dset.attrs["target_filename"] = self._target_filename
-        f.close()
+        save_hdf5(filename, self._settings_panel.settings(), self._loss_hist, {"material_name": mat_name, "target_filename": self._target_filename})
         _logger.info("Saved data to {}".format(filename))
 
     def _restore_best_params(self):
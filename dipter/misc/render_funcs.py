@@ -1,3 +1,4 @@
+import functools
 import logging
 import typing
 import warnings
@@ -38,3 +39,16 @@ def generate_frag_pos(width: int, height: int) -> torch.Tensor:
     x_pos, y_pos = torch.meshgrid(*get_coordinates(width, height))
     frag_pos = torch.stack([x_pos, y_pos, torch.zeros_like(x_pos)], dim=2)
     return frag_pos.float()
+
+
+@functools.lru_cache(maxsize=8)
+def get_frag_pos(width: int, height: int, device=device, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """Returns a cached fragment coordinate grid of the given size. The returned Tensor is shared and must not be modified in-place."""
+    return generate_frag_pos(width, height).to(device=device, dtype=dtype)
+
+
+@functools.lru_cache(maxsize=64)
+def get_constant(values: typing.Tuple[float, ...], width: int, height: int, device=device, dtype: torch.dtype = torch.float32) -> torch.Tensor:
+    """Returns a cached matrix of shape [width, height, len(values)] where every element is 'values'. The returned Tensor is shared and must not
+    be modified in-place."""
+    return torch.tensor(values, dtype=dtype, device=device).repeat(width, height, 1)
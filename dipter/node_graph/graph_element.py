@@ -4,6 +4,7 @@ import uuid
 
 class GraphElement:
     """Basic class for all elements in a node graph."""
+    _graph_version = 0
 
     def __init__(self, container: typing.Any = None):
         """
@@ -20,6 +21,16 @@ class GraphElement:
         if self._container is None:
             self._container = container
 
+    @staticmethod
+    def graph_version() -> int:
+        """Returns a number that is incremented every time the structure of any node graph changes, e.g. when sockets are connected."""
+        return GraphElement._graph_version
+
+    @staticmethod
+    def notify_graph_changed():
+        """Marks all node graphs as structurally changed, invalidating anything compiled from them."""
+        GraphElement._graph_version += 1
+
     def id(self) -> uuid.UUID:
         return self._id
 
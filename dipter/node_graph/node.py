@@ -7,6 +7,9 @@ from dipter.node_graph.data_type import DataType
 from dipter.node_graph.graph_element import GraphElement
 from dipter.node_graph.parameter import Parameter
 from dipter.node_graph.node_socket import NodeSocket, SocketType
+from dipter.node_graph.render_plan import RenderPlan
+from dipter.shaders.render_context import RenderContext
+from dipter.shaders.shader_io import ShaderInputParameter
 from dipter.shaders.shader_super import Shader
 from torch import Tensor
 
@@ -41,6 +44,7 @@ class Node(GraphElement):
 
     def set_num(self, num: int):
         self._num = num
+        self.notify_graph_changed()  # Modified argument names depend on the node number
 
     def delete(self):
         """Deletes this node from the graph."""
@@ -139,13 +143,42 @@ class Node(GraphElement):
         if add_self:
             out.add(self)
 
-        for socket in self.get_input_sockets():
+        self._collect_ancestor_nodes(out)
+        return out
+
+    def _collect_ancestor_nodes(self, out: IndexedSet):
+        for socket in self._in_sockets:
             if socket.is_connected():
-                for node in [n for n in socket.get_connected_nodes()]:
-                    out.update(node.get_ancestor_nodes(add_self=True))
+                for node in socket.get_connected_nodes():
+                    if node not in out:  # Nodes shared by several paths only need to be visited once
+                        out.add(node)
+                        node._collect_ancestor_nodes(out)
+
+    def get_sorted_ancestor_nodes(self, add_self: bool = False) -> typing.List['Node']:
+        """
+        Returns a list of all connected ancestors of this node in topological order, meaning that each node comes after all nodes that are
+        connected to its inputs.
+        :param add_self: if True, adds this node as the last element of the returned list.
+        :return: a topologically sorted list of nodes that are ancestors of this node.
+        """
+        ordered = IndexedSet()
+        self._sort_ancestor_nodes(ordered)
+
+        out = list(ordered)
+        if not add_self:
+            out.pop()
 
         return out
 
+    def _sort_ancestor_nodes(self, ordered: IndexedSet):
+        for socket in self._in_sockets:
+            if socket.is_connected():
+                for node in socket.get_connected_nodes():
+                    if node not in ordered:
+                        node._sort_ancestor_nodes(ordered)
+
+        ordered.add(self)
+
     def get_output_target_nodes(self) -> IndexedSet:
         """Returns a set of all nodes connected to this nodes output socket."""
         out = IndexedSet()
@@ -217,6 +250,7 @@ class ShaderNode(Node):
 
         self._shader = shader
         self._render_parameters = dict()
+        self._render_plan = None
 
         self._init()
 
@@ -242,55 +276,64 @@ class ShaderNode(Node):
         for i, inp in enumerate(self._shader.get_inputs()):
             self._in_sockets[i].set_value(inp.get_default())
 
-    def render(self, width: int, height: int, retain_graph: bool = False) -> typing.Tuple[Tensor, dict]:
+    def get_render_plan(self) -> RenderPlan:
+        """Returns a RenderPlan compiled from the node graph ending in this node. The plan is only recompiled if the graph has changed."""
+        if self._render_plan is None or not self._render_plan.is_valid():
+            self._render_plan = RenderPlan(self)
+
+        return self._render_plan
+
+    def fetch_parameter(self, socket: NodeSocket, shader_input: ShaderInputParameter, retain_graph: bool) -> Parameter:
         """
-        Renders an image from this node graph.
+        Returns a Parameter holding the value of an unconnected input socket of this node.
+
+        :param socket: the unconnected input socket
+        :param shader_input: the shader input that corresponds to the socket
+        :param retain_graph: If True, the Parameter fetched by a previous render is returned if there is one, otherwise a new Parameter is
+            created from the current value of the socket.
+        """
+        arg = socket.label()
+        if retain_graph and arg in self._render_parameters:  # Argument is already fetched, get saved reference
+            return self._render_parameters[arg]
+
+        value = socket.value()
+        if isinstance(value, torch.Tensor):
+            t = value.clone().detach()
+        else:
+            t = torch.tensor(value, dtype=torch.float32).unsqueeze(0)
+        p = Parameter(shader_input, t)
+        self._render_parameters[arg] = p
+        return p
+
+    def render(self, width: int, height: int, retain_graph: bool = False, context: RenderContext = None) -> typing.Tuple[Tensor, dict]:
+        """
+        Renders an image from this node graph. Every node in the graph is shaded exactly once, even if its output is connected to several
+        other nodes.
 
         :param width: pixel width of rendered image
         :param height: pixel height of rendered image
         :param retain_graph: If True, updated socket values will not be fetched, instead, saved tensor values will be used. If using
             backpropagation that updates the returned tensor parameters in-place, set this to True, otherwise set to False so that parameter values
             are fetched from input Sockets.
+        :param context: the RenderContext to render in. If None, the current RenderContext of the calling thread is used.
         :return: a Tensor containing the rendered image and a dictionary of modified argument names mapped to parameter Tensors (one for each
             unconnected graph input)
         """
-        Shader.set_render_size(width, height)
-        shader_inputs = self.get_shader().get_inputs()
-        assert len(shader_inputs) == len(self._in_sockets)
-
-        complete_params_dict = {}
-        arguments = {}
+        return self.get_render_plan().execute(width, height, retain_graph=retain_graph, context=context)
 
-        for i, socket in enumerate(self._in_sockets):
-            arg = socket.label()
-            inp = self._shader.get_input_by_arg(arg)
-            mod_arg = self.get_shader().get_parsed_code().get_modified_arg_name(arg, self.get_num())
-
-            if socket.is_connected():
-                nodes = socket.get_connected_nodes()
-                assert len(nodes) == 1  # It should be an input node, so it should only be able to have 1 connected node
-                con_socket_i = socket.get_connected_sockets().pop().get_index()
-                con_node = nodes[0]
-                res, ad = con_node.render(width, height, retain_graph=retain_graph)
-                if isinstance(res, (list, tuple)):
-                    t = res[con_socket_i]  # Pick out appropriate value, as some shaders have multiple outputs
-                else:
-                    t = res
-                complete_params_dict.update(ad)
-                p = Parameter(inp, t)
-            else:
-                if arg in self._render_parameters and retain_graph:  # Argument is already fetched, get saved reference
-                    p = self._render_parameters[arg]
-                else:
-                    value = socket.value()
-                    if isinstance(value, torch.Tensor):
-                        t = value.clone().detach()
-                    else:
-                        t = torch.tensor(value, dtype=torch.float32).unsqueeze(0)
-                    p = Parameter(inp, t)
-                    self._render_parameters[arg] = p
-                complete_params_dict[mod_arg] = p
-
-            arguments[arg] = p
-
-        return self.get_shader().shade(arguments), complete_params_dict
+    def render_batch(self, width: int, height: int, batch_params: typing.Dict[str, Tensor],
+                     retain_graph: bool = False, context: RenderContext = None) -> typing.Tuple[Tensor, dict]:
+        """
+        Renders a batch of N images from this node graph in a single vectorized pass, one image for each set of values in batch_params.
+
+        :param width: pixel width of rendered images
+        :param height: pixel height of rendered images
+        :param batch_params: a dictionary of modified argument names mapped to Tensors of shape [N] (Float inputs) or [N, C] (vector inputs).
+            Unconnected inputs that are not in this dictionary use their current socket value for all images.
+        :param retain_graph: See render(). Only applies to the inputs that are not in batch_params.
+        :param context: See render().
+        :return: a Tensor of shape [N, W, H, C] containing the rendered images and a dictionary of modified argument names mapped to the
+            parameters that were used (batched Tensors for the inputs in batch_params, Parameters for the rest)
+        """
+        return self.get_render_plan().execute(width, height, retain_graph=retain_graph, batch_params=batch_params,
+                                                context=context)
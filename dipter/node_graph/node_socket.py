@@ -61,6 +61,7 @@ class NodeSocket(GraphElement):
         other_socket._connected_sockets.add(self)
         self._connected = True
         other_socket._connected = True
+        self.notify_graph_changed()
 
         return edge
 
@@ -88,6 +89,7 @@ class NodeSocket(GraphElement):
 
             self._connected = False
             other_socket._connected = False
+            self.notify_graph_changed()
         else:
             raise RuntimeError("Sockets are indicated as connected but could not find their connecting Edge. The Node Graph is corrupt!")
 
@@ -0,0 +1,188 @@
+import typing
+
+from torch import Tensor
+
+from dipter.node_graph.graph_element import GraphElement
+from dipter.node_graph.node_socket import NodeSocket
+from dipter.node_graph.parameter import Parameter
+from dipter.shaders.shader_io import ShaderInputParameter
+from dipter.shaders import render_context
+from dipter.shaders.render_context import RenderContext
+from dipter.shaders.shader_super import Shader
+
+
+class _LeafSlot:
+    """An unconnected input of a node. Its value is a Parameter that is fetched from the input socket."""
+
+    def __init__(self, node: 'ShaderNode', socket: NodeSocket, shader_input: ShaderInputParameter, mod_arg: str):
+        self.node = node
+        self.socket = socket
+        self.shader_input = shader_input
+        self.mod_arg = mod_arg
+
+    def parameter(self, retain_graph: bool) -> Parameter:
+        return self.node.fetch_parameter(self.socket, self.shader_input, retain_graph)
+
+
+class _ConnectedSlot:
+    """A connected input of a node. Its value is (one of) the output(s) of a previous step in the plan."""
+
+    def __init__(self, step_index: int, output_index: int):
+        self.step_index = step_index
+        self.output_index = output_index
+
+
+class _RenderStep:
+    """A single shader call in a RenderPlan, with all of its argument slots resolved."""
+
+    def __init__(self, shader: Shader):
+        self.shader = shader
+        self.connected = []  # list of (argument, _ConnectedSlot)
+        self.leaves = []  # list of (argument, _LeafSlot)
+
+
+class RenderPlan:
+    """
+    A node graph compiled into an ordered list of shader calls. Compiling resolves the order of the nodes, which inputs are connected to which
+    outputs and the modified argument names of all unconnected inputs once, so that repeated renders of the same graph only have to run the
+    shaders. A plan becomes invalid as soon as the structure of the node graph changes.
+
+    The graph version is shared by all node graphs, so when it changes, the structure of this graph is compared to the structure it was compiled
+    from, so that editing one graph does not invalidate the plans of all others.
+    """
+
+    def __init__(self, root: 'ShaderNode'):
+        self._root = root
+        self._version = GraphElement.graph_version()
+        self._structure = self._get_structure()
+        self._steps = []
+
+        self._compile()
+
+    def _get_structure(self) -> tuple:
+        """Returns a description of the nodes of the graph, their numbers and shaders, and which sockets are connected to which."""
+        return tuple((node.id(), node.get_num(), type(node.get_shader()),
+                      tuple((s.label(), tuple((c.get_parent_node().id(), c.get_index()) for c in s.get_connected_sockets()))
+                            for s in node.get_input_sockets()))
+                     for node in self._root.get_sorted_ancestor_nodes(add_self=True))
+
+    def _compile(self):
+        nodes = self._root.get_sorted_ancestor_nodes(add_self=True)
+        step_indices = {node: i for i, node in enumerate(nodes)}
+
+        for node in nodes:
+            shader = node.get_shader()
+            code = shader.get_parsed_code()
+            step = _RenderStep(shader)
+            assert len(shader.get_inputs()) == node.num_input_sockets()
+
+            for socket in node.get_input_sockets():
+                arg = socket.label()
+
+                if socket.is_connected():
+                    connected_nodes = socket.get_connected_nodes()
+                    assert len(connected_nodes) == 1  # It should be an input node, so it should only be able to have 1 connected node
+                    con_socket_i = socket.get_connected_sockets()[0].get_index()
+                    step.connected.append((arg, _ConnectedSlot(step_indices[connected_nodes[0]], con_socket_i)))
+                else:
+                    inp = shader.get_input_by_arg(arg)
+                    mod_arg = code.get_modified_arg_name(arg, node.get_num())
+                    step.leaves.append((arg, _LeafSlot(node, socket, inp, mod_arg)))
+
+            self._steps.append(step)
+
+    def is_valid(self) -> bool:
+        """Returns True if the node graph has not changed structurally since this plan was compiled."""
+        if self._version == GraphElement.graph_version():
+            return True
+
+        if self._get_structure() == self._structure:  # Another node graph changed
+            self._version = GraphElement.graph_version()
+            return True
+
+        return False
+
+    def get_modified_args(self) -> typing.List[str]:
+        """Returns the modified argument names of all unconnected inputs of the compiled graph."""
+        return [leaf.mod_arg for step in self._steps for _, leaf in step.leaves]
+
+    def get_leaf_sockets(self) -> typing.Dict[str, NodeSocket]:
+        """Returns a dictionary of the modified argument names of all unconnected inputs of the compiled graph mapped to their input sockets."""
+        return {leaf.mod_arg: leaf.socket for step in self._steps for _, leaf in step.leaves}
+
+    def execute(self, width: int, height: int, retain_graph: bool = False, batch_params: typing.Dict[str, Tensor] = None,
+                context: RenderContext = None) -> typing.Tuple[Tensor, dict]:
+        """
+        Renders an image by running all shader calls in this plan.
+
+        :param width: pixel width of rendered image
+        :param height: pixel height of rendered image
+        :param retain_graph: See ShaderNode.render()
+        :param batch_params: See ShaderNode.render_batch()
+        :param context: See ShaderNode.render()
+        :return: a Tensor containing the rendered image (a tuple of Tensors if the root shader has several outputs) and a dictionary of modified
+            argument names mapped to parameter Tensors (one for each unconnected graph input)
+        """
+        if context is None:
+            context = render_context.current()
+
+        with context:
+            context.set_render_size(width, height)
+            return self._execute(retain_graph, batch_params)
+
+    def _execute(self, retain_graph: bool, batch_params: typing.Dict[str, Tensor]) -> typing.Tuple[Tensor, dict]:
+        batch_size = self._check_batch_params(batch_params)
+
+        results = [None] * len(self._steps)
+        params_dict = {}
+
+        for i, step in enumerate(self._steps):
+            arguments = {}
+
+            for arg, slot in step.connected:
+                res = results[slot.step_index]
+                if isinstance(res, (list, tuple)):
+                    res = res[slot.output_index]  # Pick out appropriate value, as some shaders have multiple outputs
+                arguments[arg] = res
+
+            for arg, leaf in step.leaves:
+                if batch_size and leaf.mod_arg in batch_params:
+                    t = batch_params[leaf.mod_arg]
+                    params_dict[leaf.mod_arg] = t
+                    arguments[arg] = t.reshape(batch_size, 1, 1, -1)
+                else:
+                    p = leaf.parameter(retain_graph)
+                    params_dict[leaf.mod_arg] = p
+                    arguments[arg] = p
+
+            results[i] = step.shader.shade(arguments)
+
+        out = results[-1]
+        if isinstance(out, (list, tuple)):  # The root shader has multiple outputs
+            return tuple(self._expand_output(t, batch_size) for t in out), params_dict
+
+        return self._expand_output(out, batch_size), params_dict
+
+    @staticmethod
+    def _expand_output(t: Tensor, batch_size: int) -> Tensor:
+        # Parameters are only broadcast during shading, so an output may not have the full render size (or batch size) yet
+        out_shape = [batch_size] if batch_size else []
+        out_shape += [*Shader.render_size(), t.shape[-1]]
+        return t.expand(*out_shape)
+
+    def _check_batch_params(self, batch_params: typing.Dict[str, Tensor]) -> int:
+        if not batch_params:
+            return 0
+
+        sizes = {t.shape[0] for t in batch_params.values()}
+        if len(sizes) != 1:
+            raise ValueError("All batched parameters must have the same batch size, got sizes {}.".format(sorted(sizes)))
+
+        leaves = {leaf.mod_arg: leaf for step in self._steps for _, leaf in step.leaves}
+        for mod_arg in batch_params:
+            if mod_arg not in leaves:
+                raise ValueError("'{}' is not an unconnected input of the node graph.".format(mod_arg))
+            if leaves[mod_arg].shader_input.is_scalar():
+                raise ValueError("Input '{}' is forced to be a scalar and can not be batched.".format(mod_arg))
+
+        return sizes.pop()
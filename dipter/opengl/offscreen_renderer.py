@@ -0,0 +1,174 @@
+import logging
+import typing
+
+import numpy as np
+import torch
+from PyQt5.QtGui import QOffscreenSurface, QOpenGLContext, QOpenGLFramebufferObject, QOpenGLFramebufferObjectFormat, QSurfaceFormat, \
+    QGuiApplication
+from glumpy import gl, gloo
+from glumpy.gloo import Program
+from torch import Tensor
+
+from dipter.node_graph.node import ShaderNode
+from dipter.opengl import object_vertices
+from dipter.opengl.object_vertices import VERTEX_COORD_MAXES, VERTEX_COORD_MINS
+from dipter.shaders import OBJECT_MATRIX_NAME, VIEW_MATRIX_NAME, PROJECTION_MATRIX_NAME, UNIFORM_VERTEX_MAXES, UNIFORM_VERTEX_MINS
+
+_logger = logging.getLogger(__name__)
+
+GL_RGBA32F = 0x8814
+
+
+def set_program_uniforms_from_graph(program: Program, node: ShaderNode):
+    """
+    Sets the uniforms of a Program to the values of all unconnected input sockets in the node graph ending in 'node'. This is the GUI-free
+    counterpart of g_shader_node.set_program_uniforms_from_node(), and requires that the Program was compiled from the same node graph.
+    """
+    for n in node.get_ancestor_nodes(add_self=True):
+        function = n.get_shader().get_parsed_code().primary_function
+        for socket in n.get_input_sockets():
+            if socket.is_connected():
+                continue
+
+            value = socket.value()
+            if isinstance(value, Tensor):
+                value = value.detach().cpu().numpy()
+            program[function.get_argument(socket.label()).get_modified_name()] = value
+
+
+def program_from_graph(node: ShaderNode) -> Program:
+    """
+    Compiles a new Program from the node graph ending in 'node', without going through the node editor, and sets its uniforms to the current
+    socket values of the graph.
+
+    :param node: a ShaderNode holding a CompilableShader, for example a MaterialOutputShader
+    :return: a Program that is not shared with anyone else
+    """
+    _, _, program = node.get_shader().compile(node, use_cache=False)
+    set_program_uniforms_from_graph(program, node)
+    return program
+
+
+class OffscreenRenderer:
+    """
+    Renders Programs to an offscreen floating point framebuffer and reads the rendered pixels back, without showing a widget. A QGuiApplication
+    has to exist before a renderer is created. On machines without a display, run with the environment variable QT_QPA_PLATFORM=offscreen and a
+    software OpenGL implementation such as Mesa, whose driver has to support compatibility profile contexts of the requested version.
+
+    Programs hold OpenGL objects that belong to the context they were first drawn in, so only draw Programs that are not drawn anywhere else,
+    for example copies from GMaterialOutputNode.get_program(copy=True).
+    """
+
+    def __init__(self, width: int, height: int, glsl_version: typing.Tuple[int, int] = (4, 3)):
+        """
+        :param width: pixel width of rendered images
+        :param height: pixel height of rendered images
+        :param glsl_version: the OpenGL version to request for the context
+        """
+        if QGuiApplication.instance() is None:
+            raise RuntimeError("A QGuiApplication has to be created before an OffscreenRenderer!")
+
+        self._width = width
+        self._height = height
+
+        surface_format = QSurfaceFormat()
+        surface_format.setVersion(*glsl_version)
+        # glumpy draws Programs without a vertex array object, which core profile contexts reject, so the editor's widgets use the default
+        # compatibility profile as well
+        surface_format.setProfile(QSurfaceFormat.CompatibilityProfile)
+
+        self._context = QOpenGLContext()
+        self._context.setFormat(surface_format)
+        if not self._context.create():
+            raise RuntimeError("Could not create an OpenGL {}.{} context.".format(*glsl_version))
+
+        self._surface = QOffscreenSurface()
+        self._surface.setFormat(self._context.format())
+        self._surface.create()
+        self._make_current()
+
+        fbo_format = QOpenGLFramebufferObjectFormat()
+        fbo_format.setAttachment(QOpenGLFramebufferObject.Depth)
+        fbo_format.setInternalTextureFormat(GL_RGBA32F)  # Read back unclamped floats instead of 8 bit colors
+        self._fbo = QOpenGLFramebufferObject(width, height, fbo_format)
+
+        V, I = object_vertices.get_2d_plane()
+        self._V = V.view(gloo.VertexBuffer)
+        self._I = I.view(gloo.IndexBuffer)
+        self._identity = np.eye(4, dtype=np.float32)
+
+    def _make_current(self):
+        if not self._context.makeCurrent(self._surface):
+            raise RuntimeError("Could not make the offscreen OpenGL context current.")
+
+    def render(self, program: Program) -> np.ndarray:
+        """
+        Renders a Program to a 2D plane that fills the whole image.
+
+        :param program: the Program to render. Its uniforms should already be set.
+        :return: a float32 array on the format WxHx3 that is **column major**, just as the Tensors returned by image_funcs.image_to_tensor().
+            Note that ShaderNode.render(width, height) returns images on the format HxWx3, as the render context swaps the two, so a
+            non-square render of this renderer corresponds to ShaderNode.render(height, width).
+        """
+        self._make_current()
+        self._fbo.bind()
+
+        try:
+            gl.glViewport(0, 0, self._width, self._height)
+            gl.glDisable(gl.GL_BLEND)
+            gl.glClearColor(0., 0., 0., 1.)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+            program.bind(self._V)
+            program[OBJECT_MATRIX_NAME] = self._identity
+            program[VIEW_MATRIX_NAME] = self._identity
+            program[PROJECTION_MATRIX_NAME] = self._identity
+            program[UNIFORM_VERTEX_MAXES] = VERTEX_COORD_MAXES
+            program[UNIFORM_VERTEX_MINS] = VERTEX_COORD_MINS
+            program.draw(gl.GL_TRIANGLES, self._I)
+
+            gl.glFinish()
+            pixels = gl.glReadPixels(0, 0, self._width, self._height, gl.GL_RGB, gl.GL_FLOAT)
+        finally:
+            self._fbo.release()
+
+        # OpenGL returns rows from the bottom up, which is the same order as the column major format used for rendered Tensors
+        image = np.frombuffer(pixels, dtype=np.float32).reshape(self._height, self._width, 3)
+        return image.transpose(1, 0, 2).copy()
+
+    def render_tensor(self, program: Program) -> torch.Tensor:
+        """Same as render(), but returns a torch Tensor."""
+        return torch.from_numpy(self.render(program))
+
+    def render_graph(self, node: ShaderNode) -> torch.Tensor:
+        """
+        Compiles and renders the node graph ending in 'node' with the current socket values. The result can be compared directly to the image
+        returned by node.render(height, width), see render().
+        """
+        return self.render_tensor(program_from_graph(node))
+
+    def render_batch(self, program: Program, uniforms: typing.List[typing.Dict[str, typing.Any]]) -> np.ndarray:
+        """
+        Renders a Program once for each set of uniform values.
+
+        :param program: the Program to render
+        :param uniforms: a list of dictionaries of uniform names mapped to values, one dictionary for each image
+        :return: a float32 array on the format NxWxHx3
+        """
+        images = np.empty((len(uniforms), self._width, self._height, 3), dtype=np.float32)
+        for i, values in enumerate(uniforms):
+            for name, value in values.items():
+                program[name] = value
+            images[i] = self.render(program)
+
+        return images
+
+    def size(self) -> typing.Tuple[int, int]:
+        return self._width, self._height
+
+    def close(self):
+        """Releases the framebuffer and the OpenGL context."""
+        self._make_current()
+        self._fbo = None
+        self._context.doneCurrent()
+        self._surface.destroy()
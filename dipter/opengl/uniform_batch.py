@@ -0,0 +1,65 @@
+import typing
+
+import numpy as np
+from glumpy.gloo import Program
+
+
+class UniformBatch:
+    """
+    Collects uniform updates for a Program and uploads them all at once when flushed. Only uniforms whose value differs from the value that was
+    last uploaded are written to the Program, and several updates of the same uniform between two flushes only result in a single upload.
+    """
+
+    def __init__(self, program: Program = None):
+        self._program = program
+        self._pending = {}  # uniform name -> value to upload on next flush
+        self._uploaded = {}  # uniform name -> last uploaded value
+
+    def set_program(self, program: Program):
+        """Sets the Program to upload uniforms to. Queued values are dropped, as the new Program may not have their uniforms, so all uniforms have
+        to be set again."""
+        if program is not self._program:
+            self._program = program
+            self._pending.clear()
+            self.invalidate()
+
+    def invalidate(self):
+        """Forgets which values have been uploaded, so that all uniforms set after this are uploaded on the next flush."""
+        self._uploaded.clear()
+
+    def set(self, name: str, value: typing.Any):
+        """Queues a uniform value for upload. Does nothing if the value is the same as the one that was last uploaded."""
+        value = np.array(value, copy=True)
+        uploaded = self._uploaded.get(name)
+        if uploaded is not None and np.array_equal(uploaded, value):
+            self._pending.pop(name, None)
+        else:
+            self._pending[name] = value
+
+    def set_from_node(self, node: 'GShaderNode'):
+        """Queues the values of all unconnected inputs of a node for upload."""
+        for _, mod_arg, value in node.get_input(exclude_connected=True):
+            self.set(mod_arg, value)
+
+    def is_dirty(self) -> bool:
+        return len(self._pending) > 0
+
+    def flush(self) -> int:
+        """
+        Uploads all queued uniform values to the Program.
+
+        :return: the number of uniforms that were uploaded
+        """
+        if self._program is None:
+            return 0
+
+        num_uploaded = 0
+        while self._pending:
+            # Removed before uploading, so that a uniform the Program does not have is not uploaded again on every flush
+            name = next(iter(self._pending))
+            value = self._pending.pop(name)
+            self._program[name] = value
+            self._uploaded[name] = value
+            num_uploaded += 1
+
+        return num_uploaded
@@ -0,0 +1,136 @@
+"""
+Matches a set of materials against every texture in a directory, distributing the jobs over a pool of worker processes. The results of all jobs
+are appended to a single JSON lines file as they finish. Can be run from the command line:
+
+    python -m dipter.optimization.batch_matching brick.json cloud.json --targets textures/ --store results.jsonl --workers 8
+"""
+import argparse
+import json
+import logging
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import torch
+
+from dipter.misc import material_serializer
+from dipter.optimization.texture_matching import GradientDescentSettings, add_settings_arguments, settings_from_args, match_texture
+
+_logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class MatchingJob(typing.NamedTuple):
+    material: str
+    target: str
+    settings: GradientDescentSettings
+
+    def key(self) -> typing.Tuple[str, str]:
+        return self.material, self.target
+
+
+def find_targets(directory: str) -> typing.List[str]:
+    """Returns the sorted paths of all images in a directory."""
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def create_jobs(materials: typing.List[str], targets: typing.List[str], settings: GradientDescentSettings) -> typing.List[MatchingJob]:
+    """Creates one job for each combination of material and target."""
+    return [MatchingJob(m, t, settings) for m in materials for t in targets]
+
+
+class ResultStore:
+    """
+    A JSON lines file with the result of one job on each line. Lines are appended and flushed as soon as a job is done, so the results of
+    finished jobs are kept if a batch is interrupted, and the batch can be resumed by skipping the jobs that are already in the store.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+
+    def load(self) -> typing.List[dict]:
+        if not os.path.exists(self._filename):
+            return []
+
+        with open(self._filename, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def finished_keys(self) -> typing.Set[typing.Tuple[str, str]]:
+        """Returns the (material, target) pairs of all jobs that finished without an error."""
+        return {(r["material"], r["target"]) for r in self.load() if "error" not in r}
+
+    def append(self, result: dict):
+        with open(self._filename, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, cls=material_serializer.Serializer) + "\n")
+
+
+def run_job(job: MatchingJob, num_threads: int = 1) -> dict:
+    """Runs a single job. Errors are returned in the result instead of being raised, so that one failing job does not stop the batch."""
+    torch.set_num_threads(num_threads)  # Workers would otherwise compete for the same cores
+    try:
+        _, result = match_texture(job.material, job.target, job.settings)
+        return result
+    except Exception as e:
+        _logger.exception("Matching {} against {} failed.".format(job.material, job.target))
+        return {"material": job.material, "target": job.target, "error": repr(e)}
+
+
+def run_batch(jobs: typing.List[MatchingJob], store: ResultStore, workers: int = None, threads_per_worker: int = 1,
+              resume: bool = True) -> int:
+    """
+    Runs jobs in a pool of worker processes and appends their results to a ResultStore.
+
+    :param jobs: the jobs to run
+    :param store: the store to append the results to
+    :param workers: the number of worker processes. Defaults to the number of CPUs divided by 'threads_per_worker'
+    :param threads_per_worker: the number of threads PyTorch may use in each worker
+    :param resume: If True, jobs that already have a result without errors in the store are skipped
+    :return: the number of jobs that were run
+    """
+    if resume:
+        finished = store.finished_keys()
+        jobs = [j for j in jobs if j.key() not in finished]
+
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+    _logger.info("Running {} jobs in {} worker processes.".format(len(jobs), workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_job, job, threads_per_worker) for job in jobs]
+        for i, future in enumerate(as_completed(futures)):
+            result = future.result()
+            store.append(result)
+            if "error" in result:
+                _logger.error("[{}/{}] {} - {}: {}".format(i + 1, len(jobs), result["material"], result["target"], result["error"]))
+            else:
+                _logger.info("[{}/{}] {} - {}: min loss {:.6f}".format(i + 1, len(jobs), result["material"], result["target"], result["min_loss"]))
+
+    return len(jobs)
+
+
+def _parse_args(argv: typing.List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Match a set of materials against all textures in a directory.")
+    parser.add_argument("materials", nargs="+", help="paths to material .json files saved by the node editor")
+    parser.add_argument("--targets", required=True, help="directory of target images")
+    parser.add_argument("--store", required=True, help="JSON lines file to append the results to")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="number of threads PyTorch may use in each worker")
+    parser.add_argument("--no-resume", action="store_true", help="run all jobs, even those that already have a result in the store")
+    add_settings_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.checkpoint or args.resume:  # All jobs would write to and resume from the same file
+        parser.error("--checkpoint and --resume can not be used for batches, resume a batch from its store instead")
+    return args
+
+
+def main(argv: typing.List[str] = None):
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    jobs = create_jobs(args.materials, find_targets(args.targets), settings_from_args(args))
+    run_batch(jobs, ResultStore(args.store), args.workers, args.threads_per_worker, resume=not args.no_resume)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""
+Gradient-free parameter estimation. Inputs such as the number of octaves of a noise or the operation of a math node change the render in discrete
+steps and have no useful gradient, so gradient descent can not fit them. The optimizers in this module only need the loss of each candidate, and
+propose whole populations of candidates at a time so that they can be evaluated in parallel, see ProcessEvaluator.
+
+All optimizers work in the unit hypercube, where each coordinate is one value of a Parameter scaled to its limits, see SearchSpace.
+"""
+import functools
+import math
+import os
+import shutil
+import tempfile
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from dipter.misc import material_serializer
+from dipter.node_graph.data_type import DataType
+from dipter.node_graph.node import ShaderNode
+from dipter.node_graph.parameter import Parameter
+from dipter.shaders.render_context import RenderContext
+
+INTEGER_TYPES = (DataType.Int, DataType.Int_Choice)
+
+
+class SearchSpace:
+    """
+    Maps the values of a dictionary of Parameters to points in the unit hypercube and back. Values of Int and Int_Choice Parameters are rounded
+    to the closest integer when a point is decoded.
+    """
+
+    def __init__(self, params: typing.Dict[str, Parameter]):
+        self._params = params
+        self._shapes = [tuple(p.shape()) for p in params.values()]
+        self._sizes = [int(np.prod(s)) for s in self._shapes]
+        self._low = np.concatenate([np.full(size, p.get_min(), dtype=np.float64) for p, size in zip(params.values(), self._sizes)])
+        high = np.concatenate([np.full(size, p.get_max(), dtype=np.float64) for p, size in zip(params.values(), self._sizes)])
+        self._range = np.where(high > self._low, high - self._low, 1.)
+        self._integer = np.concatenate([np.full(size, p.dtype() in INTEGER_TYPES) for p, size in zip(params.values(), self._sizes)])
+
+    @property
+    def dim(self) -> int:
+        return len(self._low)
+
+    def encode(self, values: typing.Dict[str, typing.Any] = None) -> np.ndarray:
+        """Returns the point of a dictionary of modified argument names mapped to values, or of the current values of the Parameters if None."""
+        if values is None:
+            values = {k: p.get_value() for k, p in self._params.items()}
+
+        x = np.concatenate([np.asarray(values[k], dtype=np.float64).reshape(-1) for k in self._params])
+        return np.clip((x - self._low) / self._range, 0., 1.)
+
+    def decode(self, x: np.ndarray) -> typing.Dict[str, np.ndarray]:
+        """Returns a dictionary of modified argument names mapped to the values of a point. Points outside of the hypercube are clipped."""
+        values = self._low + np.clip(x, 0., 1.) * self._range
+        values = np.where(self._integer, np.round(values), values).astype(np.float32)
+        splits = np.split(values, np.cumsum(self._sizes)[:-1])
+        return {k: v.reshape(shape) for k, v, shape in zip(self._params, splits, self._shapes)}
+
+    def steps(self) -> np.ndarray:
+        """Returns the smallest change of each coordinate that changes the value of its Parameter. Zero for continuous coordinates."""
+        return np.where(self._integer, 1. / self._range, 0.)
+
+    @staticmethod
+    def penalty(xs: np.ndarray) -> np.ndarray:
+        """Returns the squared distance of each point in 'xs' to the hypercube. Added to the losses of candidates so that clipped points are
+        ranked below the points on the boundary they are clipped to."""
+        return np.sum((xs - np.clip(xs, 0., 1.)) ** 2, axis=-1)
+
+
+class GradientFreeOptimizer:
+    """
+    Base class of all gradient-free optimizers. Optimizers are used through an ask-and-tell interface: ask() returns a population of candidate
+    points, and tell() is called with the losses of all of them before the next population is asked for.
+    """
+
+    def __init__(self, x0: np.ndarray, steps: np.ndarray = None, seed: int = None):
+        """
+        :param x0: the starting point
+        :param steps: the smallest change of each coordinate that makes a difference, see SearchSpace.steps()
+        :param seed: seed of the random number generator of the optimizer
+        """
+        self._x0 = np.asarray(x0, dtype=np.float64)
+        self._steps = np.zeros_like(self._x0) if steps is None else np.asarray(steps, dtype=np.float64)
+        self._rng = np.random.RandomState(seed)
+
+    def ask(self) -> np.ndarray:
+        """Returns an array of shape [N, dim] of candidate points to evaluate."""
+        raise NotImplementedError
+
+    def tell(self, xs: np.ndarray, losses: np.ndarray):
+        """Updates the optimizer with the losses of the candidates returned by the last call to ask()."""
+        raise NotImplementedError
+
+
+class CMAES(GradientFreeOptimizer):
+    """
+    Covariance Matrix Adaptation Evolution Strategy. Samples each population from a multivariate normal distribution, and moves its mean and
+    adapts its covariance towards the best half of the population.
+
+    The standard deviation of the sampled values of integer coordinates is kept above their step, so that the search does not get stuck on the
+    plateaus of the loss between two integers.
+    """
+
+    def __init__(self, x0: np.ndarray, steps: np.ndarray = None, seed: int = None, sigma: float = 0.3, population_size: int = None):
+        """
+        :param sigma: the initial step size, as a fraction of the limits of the Parameters
+        :param population_size: the number of candidates of each population. Defaults to 4 + 3 * ln(dim)
+        """
+        super().__init__(x0, steps, seed)
+        n = len(self._x0)
+        self.population_size = population_size or 4 + int(3 * math.log(n))
+        self._mu = self.population_size // 2
+        weights = math.log(self._mu + 0.5) - np.log(np.arange(1, self._mu + 1))
+        self._weights = weights / weights.sum()
+        self._mueff = 1. / np.sum(self._weights ** 2)
+
+        self._cc = (4 + self._mueff / n) / (n + 4 + 2 * self._mueff / n)
+        self._cs = (self._mueff + 2) / (n + self._mueff + 5)
+        self._c1 = 2 / ((n + 1.3) ** 2 + self._mueff)
+        self._cmu = min(1 - self._c1, 2 * (self._mueff - 2 + 1 / self._mueff) / ((n + 2) ** 2 + self._mueff))
+        self._damps = 1 + 2 * max(0., math.sqrt((self._mueff - 1) / (n + 1)) - 1) + self._cs
+        self._chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        self.mean = self._x0.copy()
+        self.sigma = sigma
+        self._C = np.eye(n)
+        self._B = np.eye(n)
+        self._D = np.ones(n)
+        self._pc = np.zeros(n)
+        self._ps = np.zeros(n)
+        self._generation = 0
+
+    def ask(self) -> np.ndarray:
+        z = self._rng.standard_normal((self.population_size, len(self.mean)))
+        y = (self._D * z) @ self._B.T
+        # Add independent noise to coordinates whose standard deviation has shrunk below their step
+        extra_std = np.sqrt(np.maximum(0., (self._steps / self.sigma) ** 2 - np.diag(self._C)))
+        y += self._rng.standard_normal(y.shape) * extra_std
+        return self.mean + self.sigma * y
+
+    def tell(self, xs: np.ndarray, losses: np.ndarray):
+        n = len(self.mean)
+        self._generation += 1
+        y = (xs[np.argsort(losses)[:self._mu]] - self.mean) / self.sigma
+        y_w = self._weights @ y
+        self.mean = self.mean + self.sigma * y_w
+
+        inv_sqrt_c = self._B @ np.diag(1 / self._D) @ self._B.T
+        self._ps = (1 - self._cs) * self._ps + math.sqrt(self._cs * (2 - self._cs) * self._mueff) * inv_sqrt_c @ y_w
+        ps_norm = np.linalg.norm(self._ps)
+        h_sig = ps_norm / math.sqrt(1 - (1 - self._cs) ** (2 * self._generation)) / self._chi_n < 1.4 + 2 / (n + 1)
+        self._pc = (1 - self._cc) * self._pc + h_sig * math.sqrt(self._cc * (2 - self._cc) * self._mueff) * y_w
+
+        rank_one = np.outer(self._pc, self._pc) + (1 - h_sig) * self._cc * (2 - self._cc) * self._C
+        rank_mu = (y.T * self._weights) @ y
+        self._C = (1 - self._c1 - self._cmu) * self._C + self._c1 * rank_one + self._cmu * rank_mu
+        self.sigma *= math.exp((self._cs / self._damps) * (ps_norm / self._chi_n - 1))
+
+        self._C = np.triu(self._C) + np.triu(self._C, 1).T
+        eigenvalues, self._B = np.linalg.eigh(self._C)
+        self._D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+
+class NelderMead(GradientFreeOptimizer):
+    """
+    The Nelder-Mead simplex method. Instead of trying the reflection, expansion and contraction points of a step one after the other, all four
+    are evaluated as one population, so that they can be evaluated in parallel. A shrink step evaluates the dim new vertices as one population.
+    """
+
+    def __init__(self, x0: np.ndarray, steps: np.ndarray = None, seed: int = None, step: float = 0.1):
+        """
+        :param step: the size of the initial simplex, as a fraction of the limits of the Parameters. Integer coordinates use at least their step
+        """
+        super().__init__(x0, steps, seed)
+        self._initial_step = np.maximum(step, self._steps)
+        self._simplex = None
+        self._losses = None
+        self._shrinking = False
+
+    def ask(self) -> np.ndarray:
+        if self._simplex is None:
+            # Step in the direction that stays within the hypercube
+            directions = np.where(self._x0 + self._initial_step <= 1., self._initial_step, -self._initial_step)
+            return np.vstack([self._x0, self._x0 + np.diag(directions)])
+
+        best = self._simplex[0]
+        if self._shrinking:
+            return best + 0.5 * (self._simplex[1:] - best)
+
+        worst = self._simplex[-1]
+        centroid = np.mean(self._simplex[:-1], axis=0)
+        return np.vstack([centroid + (centroid - worst),  # Reflection
+                          centroid + 2 * (centroid - worst),  # Expansion
+                          centroid + 0.5 * (centroid - worst),  # Outside contraction
+                          centroid - 0.5 * (centroid - worst)])  # Inside contraction
+
+    def tell(self, xs: np.ndarray, losses: np.ndarray):
+        if self._simplex is None:
+            self._simplex, self._losses = np.array(xs, dtype=np.float64), np.array(losses, dtype=np.float64)
+        elif self._shrinking:
+            self._simplex[1:], self._losses[1:] = xs, losses
+            self._shrinking = False
+        else:
+            l_reflect, l_expand, l_outside, l_inside = losses
+            replacement = None
+            if l_reflect < self._losses[0]:
+                replacement = 1 if l_expand < l_reflect else 0
+            elif l_reflect < self._losses[-2]:
+                replacement = 0
+            elif l_reflect < self._losses[-1]:
+                replacement = 2 if l_outside <= l_reflect else None
+            elif l_inside < self._losses[-1]:
+                replacement = 3
+
+            if replacement is None:
+                self._shrinking = True
+            else:
+                self._simplex[-1], self._losses[-1] = xs[replacement], losses[replacement]
+
+        order = np.argsort(self._losses, kind="stable")
+        self._simplex, self._losses = self._simplex[order], self._losses[order]
+
+
+class RandomSearch(GradientFreeOptimizer):
+    """
+    Samples each population uniformly in a box around the best candidate so far, starting with a box that covers all of the hypercube. The box is
+    shrunk every time a population does not improve the best candidate, but never below the step of integer coordinates.
+    """
+
+    def __init__(self, x0: np.ndarray, steps: np.ndarray = None, seed: int = None, population_size: int = 16, radius: float = 1.,
+                 shrink: float = 0.5):
+        """
+        :param population_size: the number of candidates of each population
+        :param radius: the initial half side of the box, as a fraction of the limits of the Parameters
+        :param shrink: the factor the box is shrunk by when a population does not improve the best candidate
+        """
+        super().__init__(x0, steps, seed)
+        self.population_size = population_size
+        self.radius = radius
+        self._shrink = shrink
+        self._best = self._x0.copy()
+        self._best_loss = np.inf
+        self._first = True
+
+    def ask(self) -> np.ndarray:
+        radius = np.maximum(self.radius, self._steps)
+        xs = self._rng.uniform(np.clip(self._best - radius, 0., 1.), np.clip(self._best + radius, 0., 1.),
+                               size=(self.population_size, len(self._best)))
+        if self._first:
+            xs[0] = self._x0  # Always evaluate the starting point
+            self._first = False
+        return xs
+
+    def tell(self, xs: np.ndarray, losses: np.ndarray):
+        best = int(np.argmin(losses))
+        if losses[best] < self._best_loss:
+            self._best, self._best_loss = xs[best].copy(), losses[best]
+        else:
+            self.radius *= self._shrink
+
+
+class GraphEvaluator:
+    """Evaluates candidates one after the other, by rendering the node graph in the current process."""
+
+    def __init__(self, out_node: ShaderNode, params: typing.Dict[str, Parameter], target: torch.Tensor, loss_func: typing.Callable,
+                 width: int, height: int, context: RenderContext = None):
+        """
+        :param params: the Parameters of the last render of the node graph that the candidates are values of
+        """
+        self._out_node = out_node
+        self._params = params
+        self._target = target
+        self._loss_func = loss_func
+        self._size = (width, height)
+        self._context = context
+
+    def __call__(self, candidates: typing.List[typing.Dict[str, np.ndarray]]) -> np.ndarray:
+        """Returns the loss of each candidate, given as a dictionary of modified argument names mapped to values."""
+        losses = np.empty(len(candidates))
+        with torch.no_grad():
+            for i, values in enumerate(candidates):
+                set_parameter_values(self._params, values)
+                render, _ = self._out_node.render(*self._size, retain_graph=True, context=self._context)
+                losses[i] = float(self._loss_func(render, self._target))
+
+        return losses
+
+    def close(self):
+        pass
+
+
+class ProcessEvaluator:
+    """
+    Evaluates candidates in parallel in a pool of worker processes. The node graph is saved as a material that each worker loads once, so
+    'out_node' has to be a material output node. Candidates are sent to the workers with the node ids and labels of their sockets as keys, since
+    the modified argument names depend on the numbering of the nodes in each process.
+    """
+
+    def __init__(self, out_node: ShaderNode, params: typing.Dict[str, Parameter], target: torch.Tensor, loss_func: type, loss_args: dict,
+                 width: int, height: int, workers: int, threads_per_worker: int = 1):
+        """
+        :param loss_func: the class of the loss function, instantiated with 'loss_args' in each worker
+        :param workers: the number of worker processes
+        :param threads_per_worker: the number of threads PyTorch may use in each worker
+        """
+        keys = socket_keys(out_node)
+        self._socket_keys = {k: keys[k] for k in params}
+
+        self._directory = save_worker_files(out_node, target)
+        self._worker_args = (self._directory, loss_func, loss_args, width, height, threads_per_worker)
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def __call__(self, candidates: typing.List[typing.Dict[str, np.ndarray]]) -> np.ndarray:
+        """Returns the loss of each candidate, given as a dictionary of modified argument names mapped to values."""
+        jobs = [(self._worker_args, {self._socket_keys[k]: v for k, v in values.items()}) for values in candidates]
+        return np.array(list(self._executor.map(_evaluate_in_worker, jobs)))
+
+    def close(self):
+        self._executor.shutdown()
+        shutil.rmtree(self._directory)
+
+
+def save_worker_files(out_node: ShaderNode, target: torch.Tensor) -> str:
+    """Saves a node graph as a material and the target to a new temporary directory, from which worker processes load their own copies. Returns
+    the path of the directory, which the caller removes when the workers are done."""
+    directory = tempfile.mkdtemp(prefix="dipter_")
+    material_serializer.save_material(out_node, os.path.join(directory, "material.json"))
+    torch.save(target, os.path.join(directory, "target.pt"))
+    return directory
+
+
+def load_worker_files(directory: str) -> typing.Tuple[ShaderNode, torch.Tensor]:
+    """Loads the material output node and target saved by save_worker_files."""
+    out_node, _ = material_serializer.load_material(os.path.join(directory, "material.json"))
+    return out_node, torch.load(os.path.join(directory, "target.pt"))
+
+
+# The state of each worker process, keyed by the directory of the worker files it was loaded from
+_worker_state = {}
+
+
+def worker_state(directory: str, setup: typing.Callable[[ShaderNode, torch.Tensor], dict], num_threads: int = 1) -> dict:
+    """
+    Returns the state that this worker process keeps for the worker files in 'directory', see save_worker_files(). The first call in each
+    process loads the files and passes the material output node and target to 'setup', which returns the state. Pools set up their workers this
+    way instead of with an initializer, which ProcessPoolExecutor only supports from Python 3.7.
+
+    :param num_threads: the number of threads PyTorch may use in this process
+    """
+    if directory not in _worker_state:
+        torch.set_num_threads(num_threads)  # Workers would otherwise compete for the same cores
+        _worker_state[directory] = setup(*load_worker_files(directory))
+    return _worker_state[directory]
+
+
+def _setup_evaluation(out_node: ShaderNode, target: torch.Tensor, loss_func: type, loss_args: dict, width: int, height: int) -> dict:
+    sockets = out_node.get_render_plan().get_leaf_sockets()
+    return {
+        "out_node": out_node,
+        "sockets": {key: sockets[k] for k, key in socket_keys(out_node).items()},
+        "target": target,
+        "loss_func": loss_func(**loss_args),
+        "size": (width, height),
+    }
+
+
+def _evaluate_in_worker(job: typing.Tuple[tuple, typing.Dict[typing.Tuple[str, str], np.ndarray]]) -> float:
+    (directory, loss_func, loss_args, width, height, num_threads), values = job
+    state = worker_state(directory, functools.partial(_setup_evaluation, loss_func=loss_func, loss_args=loss_args, width=width, height=height),
+                         num_threads)
+    for key, value in values.items():
+        state["sockets"][key].set_value(torch.as_tensor(value, dtype=torch.float32))
+
+    with torch.no_grad():
+        render, _ = state["out_node"].render(*state["size"], retain_graph=False)
+        return float(state["loss_func"](render, state["target"]))
+
+
+def socket_keys(out_node: ShaderNode) -> typing.Dict[str, typing.Tuple[str, str]]:
+    """Returns the modified argument names of the unconnected inputs of a node graph mapped to the node id and label of their sockets, which
+    identify the same input in a copy of the graph loaded from a saved material."""
+    sockets = out_node.get_render_plan().get_leaf_sockets()
+    return {k: (s.get_parent_node().id().hex, s.label()) for k, s in sockets.items()}
+
+
+def set_parameter_values(params: typing.Dict[str, Parameter], values: typing.Dict[str, typing.Any]):
+    """Sets the values of a dictionary of Parameters, given a dictionary of modified argument names mapped to values."""
+    for k, value in values.items():
+        params[k].set_value(torch.as_tensor(value, dtype=torch.float32))
@@ -0,0 +1,146 @@
+import logging
+import typing
+
+import numpy as np
+import torch
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from torch import Tensor
+
+from dipter.node_graph.node import ShaderNode
+from dipter.node_graph.parameter import Parameter
+from dipter.optimization.losses import Loss
+from dipter.shaders.render_context import RenderContext
+
+_logger = logging.getLogger(__name__)
+
+# Rough number of float32 [W,H,3] tensors that are alive at the same time for each image while rendering a batch
+_TENSORS_PER_IMAGE = 16
+
+
+class SurfaceAxis:
+    """One axis of a loss surface: a single element of a Parameter and the values it should take."""
+
+    def __init__(self, param: Parameter, index: int, values: np.ndarray):
+        """
+        :param param: the Parameter to vary. Its modified argument has to be set.
+        :param index: index of the element to vary if the Parameter is a vector, or -1 for scalar Parameters.
+        :param values: the values that the element takes along this axis.
+        """
+        self.param = param
+        self.index = max(index, 0)
+        self.values = torch.as_tensor(values, dtype=torch.float32)
+
+    def mod_arg(self) -> str:
+        return self.param.get_modified_arg()
+
+    def __len__(self):
+        return len(self.values)
+
+
+class LossSurface(QObject):
+    """
+    Calculates the loss for every point in a 2D grid of parameter values. Grid points are rendered in batches, as many at a time as fits in the
+    memory budget, and the losses of each batch are emitted as soon as they are available. Inputs that are forced to be scalars can not be
+    batched, so grid points along them are rendered one at a time. Intended to be run in a QThread.
+    """
+    chunk_done = pyqtSignal(int, np.ndarray)  # Flat index of first grid point in chunk, losses of chunk
+    finished = pyqtSignal(np.ndarray)  # Loss surface of shape [R1, R2]
+
+    def __init__(self, out_node: ShaderNode, target: Tensor, width: int, height: int, loss_func: Loss, axis1: SurfaceAxis, axis2: SurfaceAxis,
+                 memory_budget: int = 256 * 1024 ** 2):
+        """
+        :param out_node: the node to render from
+        :param target: the target image, with the same size as the renders
+        :param width: pixel width of rendered images
+        :param height: pixel height of rendered images
+        :param loss_func: the loss function to evaluate
+        :param axis1: the parameter element that varies along the first axis of the surface
+        :param axis2: the parameter element that varies along the second axis of the surface
+        :param memory_budget: approximate number of bytes that a single batch of renders is allowed to use
+        """
+        super().__init__()
+        self._out_node = out_node
+        self._target = target
+        self._width = width
+        self._height = height
+        self._loss_func = loss_func
+        self._axis1 = axis1
+        self._axis2 = axis2
+        self._memory_budget = memory_budget
+        self._stop = False
+
+    def stop(self):
+        self._stop = True
+
+    def chunk_size(self) -> int:
+        """Returns the number of grid points that are rendered in a single batch."""
+        bytes_per_image = self._width * self._height * 3 * 4 * _TENSORS_PER_IMAGE
+        return max(1, self._memory_budget // bytes_per_image)
+
+    def _batch_params(self, start: int, end: int) -> typing.Dict[str, Tensor]:
+        flat = torch.arange(start, end)
+        r2 = len(self._axis2)
+        batch_params = {}
+
+        for axis, values in ((self._axis1, self._axis1.values[flat // r2]), (self._axis2, self._axis2.values[flat % r2])):
+            mod_arg = axis.mod_arg()
+            if mod_arg not in batch_params:  # Both axes may be elements of the same vector Parameter
+                base = axis.param.tensor().detach().reshape(-1).float()
+                batch_params[mod_arg] = base.repeat(end - start, 1)
+            batch_params[mod_arg][:, axis.index] = values
+
+        return batch_params
+
+    def _render_points(self, batch_params: typing.Dict[str, Tensor], context: RenderContext) -> Tensor:
+        """Renders the grid points of a chunk one at a time, by setting the values of the Parameters of the axes in turn."""
+        params = {axis.mod_arg(): axis.param for axis in (self._axis1, self._axis2)}
+        saved = {k: p.tensor().detach().clone() for k, p in params.items()}
+        renders = []
+        try:
+            for i in range(next(iter(batch_params.values())).shape[0]):
+                for k, p in params.items():
+                    p.set_value(batch_params[k][i].reshape(p.shape()))
+                render, _ = self._out_node.render(self._width, self._height, retain_graph=True, context=context)
+                renders.append(render)
+        finally:
+            for k, p in params.items():
+                p.set_value(saved[k])
+
+        return torch.stack(renders)
+
+    @pyqtSlot(name='run')
+    def run(self) -> np.ndarray:
+        """Calculates the loss surface. 'finished' is always emitted, with NaN for the grid points that were not calculated if the calculation
+        was stopped or failed."""
+        width, height = self._width, self._height
+        r1, r2 = len(self._axis1), len(self._axis2)
+        num_points = r1 * r2
+        chunk = self.chunk_size()
+        losses = np.full(num_points, np.nan, dtype=np.float32)
+        context = RenderContext(width, height)
+        batched = not (self._axis1.param.is_scalar() or self._axis2.param.is_scalar())
+
+        _logger.debug("Calculating {}x{} loss surface in chunks of {} renders.".format(r1, r2, chunk))
+
+        try:
+            with torch.no_grad():
+                for start in range(0, num_points, chunk):
+                    if self._stop:
+                        break
+
+                    end = min(start + chunk, num_points)
+                    batch_params = self._batch_params(start, end)
+                    if batched:
+                        renders, _ = self._out_node.render_batch(width, height, batch_params, retain_graph=True, context=context)
+                    else:
+                        renders = self._render_points(batch_params, context)
+                    chunk_losses = self._loss_func.forward_batch(renders, self._target).cpu().numpy()
+                    losses[start:end] = chunk_losses
+                    self.chunk_done.emit(start, chunk_losses)
+        except Exception:
+            _logger.exception("Calculating the loss surface failed.")
+        finally:
+            surface = losses.reshape(r1, r2)
+            self.finished.emit(surface)
+
+        return surface
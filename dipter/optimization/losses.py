@@ -1,16 +1,20 @@
 import abc
+import copy
+import functools
+import os
 import typing
 
 import torch
 from torch import Tensor
 from torch.nn import Module, MSELoss
-from torchvision import models, transforms as T
+from torchvision import models
 
 mse_loss = MSELoss(reduction="mean")
 sse_loss = MSELoss(reduction="sum")
 
 
 class Loss(Module):
+    INPUT_SIZE = None  # (W, H) of the only image size the loss accepts, or None if it accepts any size
 
     def __init__(self):
         super().__init__()
@@ -22,15 +26,116 @@ class Loss(Module):
         target = torch.clamp(target, 0.0, 1.0)
         return self._loss(x, target)
 
+    def forward_batch(self, x: Tensor, target: Tensor) -> Tensor:
+        """
+        Calculates the loss of each image in a batch against the same target.
+
+        :param x: a batch of images of shape [N,W,H,3]
+        :param target: a single target image of shape [W,H,3]
+        :return: a Tensor of shape [N] containing the loss of each image
+        """
+        assert x.shape[1:] == target.shape
+        x = torch.clamp(x, 0.0, 1.0)
+        target = torch.clamp(target, 0.0, 1.0)
+        return self._loss_batch(x, target)
+
     @abc.abstractmethod
     def _loss(self, x: Tensor, target: Tensor):
         pass
 
+    def _loss_batch(self, x: Tensor, target: Tensor) -> Tensor:
+        # Losses that can not be vectorized over the batch dimension fall back to one call per image
+        return torch.stack([self._loss(img, target) for img in x])
 
-class NeuralLoss(Loss):
 
-    def __init__(self, layers: typing.Iterable[int] = None, layer_weights: typing.Iterable[float] = None):
+VGG19_WEIGHTS_ENV = "DIPTER_VGG19_WEIGHTS"  # Environment variable with the path to a local state dict of VGG19, for machines without internet
+
+
+@functools.lru_cache(maxsize=1)
+def vgg19_feature_layers() -> typing.Tuple[Module, ...]:
+    """
+    Returns the layers of the feature extractor of a pretrained VGG19, with max pooling replaced by average pooling. The network is only loaded
+    once per process, from the file in the environment variable DIPTER_VGG19_WEIGHTS if it is set, otherwise from the torchvision cache. The
+    layers are shared and frozen, and must not be modified.
+    """
+    weights_path = os.environ.get(VGG19_WEIGHTS_ENV)
+    if weights_path:
+        vgg = models.vgg19(pretrained=False)
+        vgg.load_state_dict(torch.load(weights_path, map_location="cpu"))
+    else:
+        vgg = models.vgg19(pretrained=True, progress=True)
+
+    layers = list(vgg.features.children())
+    for i, mod in enumerate(layers):
+        if hasattr(mod, "inplace"):
+            mod.inplace = False
+
+        if isinstance(mod, torch.nn.MaxPool2d):
+            layers[i] = torch.nn.AvgPool2d(kernel_size=mod.kernel_size, stride=mod.stride, padding=mod.padding, ceil_mode=mod.ceil_mode)
+
+    for mod in layers:
+        mod.eval()
+        mod.requires_grad_(False)
+
+    return tuple(layers)
+
+
+class _FeatureExtractor(Module):
+    """
+    Runs images through a list of layers and returns the activations of the requested layers. The layers may be shared with other extractors,
+    so they are kept out of the module tree, and copied the first time the extractor is converted with for example .to() or .half().
+    """
+
+    def __init__(self, layers: typing.List[Module], indices: typing.Iterable[int], shared: bool = True):
+        super().__init__()
+        self.layers = tuple(layers)  # Not a ModuleList, so .train() and .eval() leave them as they are
+        self.indices = set(indices)
+        self._shared = shared
+
+    def _apply(self, fn):
+        if self._shared:
+            self.layers = tuple(copy.deepcopy(layer) for layer in self.layers)
+            self._shared = False
+        for layer in self.layers:
+            layer._apply(fn)
+        return super()._apply(fn)
+
+    def forward(self, x: Tensor) -> typing.Tuple[Tensor, ...]:
+        features = []
+        for i, layer in enumerate(self.layers):
+            x = layer(x)
+            if i in self.indices:
+                features.append(x)
+
+        return tuple(features)
+
+
+class NeuralLoss(Loss):
+    INPUT_SIZE = (224, 224)
+    PRECISIONS = ("float32", "bfloat16")
+    FEATURE_EXTRACTORS = ("eager", "trace", "compile")
+
+    def __init__(self, layers: typing.Iterable[int] = None, layer_weights: typing.Iterable[float] = None, precision: str = "float32",
+                 channels_last: bool = False, feature_extractor: str = "eager"):
+        """
+        :param layers: indices of the VGG19 feature layers to compare the Gram matrices of
+        :param layer_weights: the weight of each layer in the loss
+        :param precision: "float32", or "bfloat16" to run VGG19 with bfloat16 autocast on the CPU. Gram matrices are always computed in float32
+        :param channels_last: If True, images and weights use the channels last memory format, which is faster for convolutions on most CPUs
+        :param feature_extractor: "eager", or "trace" to run a TorchScript trace of the network, or "compile" to use torch.compile
+        """
         super().__init__()
+        if precision not in self.PRECISIONS:
+            raise ValueError("Precision must be one of {}, got '{}'.".format(self.PRECISIONS, precision))
+        if feature_extractor not in self.FEATURE_EXTRACTORS:
+            raise ValueError("Feature extractor must be one of {}, got '{}'.".format(self.FEATURE_EXTRACTORS, feature_extractor))
+        if precision == "bfloat16" and not hasattr(getattr(torch, "cpu", None), "amp"):
+            raise ValueError("Precision 'bfloat16' needs CPU autocast (torch.cpu.amp), which is not available in PyTorch {}.".format(
+                torch.__version__))
+        if feature_extractor == "compile" and not hasattr(torch, "compile"):
+            raise ValueError("Feature extractor 'compile' needs torch.compile, which is only available from PyTorch 2.0, got {}.".format(
+                torch.__version__))
+
         if layers is None or layers == []:
             layers = [0]
         if layer_weights is None or layer_weights == []:
@@ -39,55 +144,86 @@ class NeuralLoss(Loss):
         self._layer_indices = layers
         self._layer_weights = torch.tensor(layer_weights)[0:len(layers)]
 
-        self.vgg = models.vgg19(pretrained=True, progress=True)
-        self.modulelist = list(self.vgg.features.modules())
-
-        for i, mod in enumerate(self.modulelist):
-            if hasattr(mod, "inplace"):
-                mod.inplace = False
-
-            if isinstance(mod, torch.nn.MaxPool2d):
-                self.modulelist[i] = torch.nn.AvgPool2d(kernel_size=mod.kernel_size, stride=mod.stride, padding=mod.padding, ceil_mode=mod.ceil_mode)
-
-        self._normalize = T.Compose([
-            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        # Layers after the deepest requested layer do not contribute to the loss
+        self.modulelist = list(vgg19_feature_layers()[:max(self._layer_indices) + 1])
+        self._precision = precision
+        self._channels_last = channels_last
+        self._feature_extractor = feature_extractor
+        if channels_last:  # Converts a copy, since the layers are shared by all instances
+            self.modulelist = [copy.deepcopy(layer).to(memory_format=torch.channels_last) for layer in self.modulelist]
+        self._extractor = _FeatureExtractor(self.modulelist, self._layer_indices, shared=not channels_last)
+        self._traced_extractor = None
+        if feature_extractor == "compile":
+            self._extractor = torch.compile(self._extractor)
+
+        # Shaped to broadcast over batches of [N,C,H,W] images, which torchvision's Normalize does not accept
+        self.register_buffer("_mean", torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1))
+        self.register_buffer("_std", torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1))
+
+        self._target = None
+        self._target_grams = None
 
     def __str__(self):
         return "Neural Loss (\n\tlayers:\n {}, \n\tweights: {}\n)".format(self._layer_indices, self._layer_weights)
 
     def _preprocess(self, x: Tensor):
-        # Swap axes to get image on CxHxW form, which is required for Models in PyTorch, then Normalize to comply with VGG19 and add batch dimension
-        return self._normalize(x.permute(2, 1, 0)).unsqueeze(0)
+        # Swap axes to get images on NxCxHxW form, which is required for Models in PyTorch, then Normalize to comply with VGG19
+        return (x.permute(0, 3, 2, 1) - self._mean) / self._std
+
+    def _features(self, x: Tensor) -> typing.Tuple[Tensor, ...]:
+        x_ = self._preprocess(x)
+        if self._channels_last:
+            x_ = x_.contiguous(memory_format=torch.channels_last)
 
-    def _gram_matrix(self, activation: Tensor, N: int, M: int):
-        feature_map = activation.view(N, M)
-        G = torch.mm(feature_map, feature_map.t())
-        return G
+        if self._precision == "bfloat16":
+            with torch.cpu.amp.autocast(dtype=torch.bfloat16):
+                return self._run_extractor(x_)
 
-    def _loss(self, x: Tensor, target: Tensor):
-        assert x.shape == target.shape
-        assert list(x.shape) == [224, 224, 3]
+        return self._run_extractor(x_)
 
-        x_ = self._preprocess(x)
-        target_ = self._preprocess(target)
-        E = []
+    def _run_extractor(self, x: Tensor) -> typing.Tuple[Tensor, ...]:
+        if self._feature_extractor == "trace":
+            if self._traced_extractor is None:
+                # Traced inside the autocast context (if any), so that the casts to bfloat16 are part of the trace
+                self._traced_extractor = torch.jit.trace(self._extractor, x.detach(), check_trace=False)
+            return self._traced_extractor(x)
+
+        return self._extractor(x)
 
-        for i, layer in enumerate(self.modulelist[1:]):
-            x_ = layer(x_)
-            target_ = layer(target_)
-            if i > self._layer_indices[-1]:
-                break
-            if i in self._layer_indices:
-                N = x_.shape[1]
-                M = x_.shape[2] * x_.shape[3]
-                G1 = self._gram_matrix(x_, N, M)
-                G2 = self._gram_matrix(target_, N, M)
+    def _gram_matrices(self, x: Tensor) -> typing.List[Tensor]:
+        """Returns the normalized Gram matrices of the requested layers for a batch of images of shape [B,W,H,3], each of shape [B,N,N]."""
+        grams = []
 
-                E.append(sse_loss(G1, G2) * (1 / (4. * (N ** 2) * (M ** 2))))
+        for features in self._features(x):
+            N = features.shape[1]
+            M = features.shape[2] * features.shape[3]
+            feature_map = features.float().reshape(features.shape[0], N, M)
+            # Scaled so that the squared error of two Gram matrices is normalized by 1 / (4 * N^2 * M^2)
+            grams.append(torch.bmm(feature_map, feature_map.transpose(1, 2)) / (2. * N * M))
 
-        L_tot = torch.sum(torch.stack(E) * self._layer_weights)
-        return L_tot
+        return grams
+
+    def _get_target_grams(self, target: Tensor) -> typing.List[Tensor]:
+        """Returns the Gram matrices of the target, which are only computed again if the target changes."""
+        # Compared by value, as forward() passes a new clamped copy of the target on every call
+        if self._target is None or self._target.shape != target.shape or not torch.equal(self._target, target):
+            with torch.no_grad():
+                self._target_grams = self._gram_matrices(target.unsqueeze(0))
+            self._target = target.detach().clone()
+
+        return self._target_grams
+
+    def _loss(self, x: Tensor, target: Tensor):
+        return self._loss_batch(x.unsqueeze(0), target)[0]
+
+    def _loss_batch(self, x: Tensor, target: Tensor) -> Tensor:
+        assert list(x.shape[1:]) == [*self.INPUT_SIZE, 3]
+
+        E = []
+        for G1, G2 in zip(self._gram_matrices(x), self._get_target_grams(target)):
+            E.append(torch.sum((G1 - G2) ** 2, dim=(1, 2)))
+
+        return torch.sum(torch.stack(E, dim=1) * self._layer_weights, dim=1)
 
 
 class XSELoss(Loss):
@@ -95,10 +231,20 @@ class XSELoss(Loss):
     def __init__(self, reduction: str = 'mean'):
         super().__init__()
         self.loss_func = MSELoss(reduction=reduction)
+        self._reduction = reduction
 
     def _loss(self, x: Tensor, target: Tensor):
         return self.loss_func(x, target)
 
+    def _loss_batch(self, x: Tensor, target: Tensor) -> Tensor:
+        se = (x - target) ** 2
+        if self._reduction == "sum":
+            return torch.sum(se, dim=(1, 2, 3))
+        elif self._reduction == "mean":
+            return torch.mean(se, dim=(1, 2, 3))
+
+        return super()._loss_batch(x, target)
+
 
 class SquaredBinLoss(Loss):
 
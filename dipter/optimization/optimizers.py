@@ -20,6 +20,39 @@ def dist_to_lim(t: torch.Tensor, p_min: typing.Iterable, p_max: typing.Iterable)
     return torch.max(torch.min(low, zeros), high)
 
 
+class _FlatGroup:
+    """
+    The values of the Parameters of a group in one contiguous buffer, which the tensors of the Parameters are made views into, so that updating
+    the buffer in-place updates all Parameters at once. Also holds the flattened limits of the Parameters.
+    """
+
+    def __init__(self, params: List[Parameter]):
+        tensors = [p.tensor() for p in params]
+        self.buffer = torch.cat([t.detach().reshape(-1) for t in tensors])
+        self.sizes = torch.tensor([t.numel() for t in tensors], device=self.buffer.device)
+
+        offset = 0
+        mins, maxs = [], []
+        for p, t in zip(params, tensors):
+            t.data = self.buffer[offset:offset + t.numel()].view_as(t)
+            offset += t.numel()
+            p_min, p_max = p.get_limits()
+            mins.append(torch.as_tensor(p_min, dtype=t.dtype, device=t.device).expand_as(t).reshape(-1))
+            maxs.append(torch.as_tensor(p_max, dtype=t.dtype, device=t.device).expand_as(t).reshape(-1))
+        self._data_ptrs = [t.data_ptr() for t in tensors]
+        self.p_min, self.p_max = torch.cat(mins), torch.cat(maxs)
+        self.p_mid = (self.p_max - self.p_min) / 2
+
+    def is_valid(self, tensors: List[torch.Tensor]) -> bool:
+        """Returns False if the data of any tensor has been replaced since, for example by Parameter.set_value() or restore_value()."""
+        return len(tensors) == len(self._data_ptrs) and all(t.data_ptr() == ptr for t, ptr in zip(tensors, self._data_ptrs))
+
+    def has_grad(self, tensors: List[torch.Tensor]) -> torch.Tensor:
+        """Returns a flat mask of the elements of the tensors that have gradients."""
+        flags = torch.tensor([t.grad is not None for t in tensors], device=self.buffer.device)
+        return flags.repeat_interleave(self.sizes)
+
+
 class _RequiredParameter(object):
     """Singleton class representing a required parameter for an Optimizer."""
 
@@ -48,6 +81,8 @@ class ParameterOptimizer:
     def __init__(self, params, defaults):
         torch._C._log_api_usage_once("python.optimizer")
         self.defaults = defaults
+        self._limits = {}  # id of param group -> (Parameters, flat min limits, flat max limits, flat half ranges)
+        self._flat_groups = {}  # id of param group -> _FlatGroup, see _flat_group()
 
         if not isinstance(params, typing.Iterable):
             raise TypeError("params argument given to the optimizer should be "
@@ -197,6 +232,71 @@ class ParameterOptimizer:
         """
         raise NotImplementedError
 
+    def _flat_limits(self, group: dict) -> typing.Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Returns the min and max limits and half the range of all elements of the Parameters of a group, flattened and concatenated in the
+        same order as the Parameters."""
+        params = group['params']
+        cached = self._limits.get(id(group))
+        if cached is None or len(cached[0]) != len(params) or any(a is not b for a, b in zip(cached[0], params)):
+            mins, maxs = [], []
+            for p in params:
+                t = p.tensor()
+                p_min, p_max = p.get_limits()
+                mins.append(torch.as_tensor(p_min, dtype=t.dtype, device=t.device).expand_as(t).reshape(-1))
+                maxs.append(torch.as_tensor(p_max, dtype=t.dtype, device=t.device).expand_as(t).reshape(-1))
+            p_min, p_max = torch.cat(mins), torch.cat(maxs)
+            cached = (list(params), p_min, p_max, (p_max - p_min) / 2)
+            self._limits[id(group)] = cached
+
+        return cached[1], cached[2], cached[3]
+
+    def _flat_group(self, group: dict, tensors: List[torch.Tensor]) -> _FlatGroup:
+        """Returns the persistent flat buffer of a group, which is only built again if the data of its Parameters has been replaced."""
+        flat = self._flat_groups.get(id(group))
+        if flat is None or not flat.is_valid(tensors):
+            flat = _FlatGroup(group['params'])
+            self._flat_groups[id(group)] = flat
+
+        return flat
+
+    @staticmethod
+    def _flat_values(tensors: List[torch.Tensor]) -> torch.Tensor:
+        return torch.cat([t.detach().reshape(-1) for t in tensors])
+
+    @staticmethod
+    def _flat_grads(tensors: List[torch.Tensor]) -> torch.Tensor:
+        """Returns the gradients of all tensors flattened and concatenated, with zeros for tensors without gradients."""
+        return torch.cat([(t.grad if t.grad is not None else torch.zeros_like(t)).reshape(-1) for t in tensors])
+
+    @staticmethod
+    def _flat_has_grad(tensors: List[torch.Tensor]) -> torch.Tensor:
+        return torch.cat([torch.full((t.numel(),), t.grad is not None, dtype=torch.bool, device=t.device) for t in tensors])
+
+    @staticmethod
+    def _add_flat(tensors: List[torch.Tensor], update: torch.Tensor):
+        """Adds a flat update to the tensors it was flattened from."""
+        for t, u in zip(tensors, update.split([t.numel() for t in tensors])):
+            t.add_(u.view_as(t))
+
+    @staticmethod
+    def _set_flat(tensors: List[torch.Tensor], values: torch.Tensor):
+        for t, v in zip(tensors, values.split([t.numel() for t in tensors])):
+            t.copy_(v.view_as(t))
+
+    @staticmethod
+    def _set_flat_grads(tensors: List[torch.Tensor], grads: torch.Tensor):
+        for t, g in zip(tensors, grads.split([t.numel() for t in tensors])):
+            if t.grad is None:
+                t.grad = g.view_as(t).clone()
+            else:
+                t.grad.copy_(g.view_as(t))
+
+    def _project(self, group: dict, tensors: List[torch.Tensor]):
+        """Clamps the values of all tensors of a group to the limits of their Parameters."""
+        p_min, p_max, _ = self._flat_limits(group)
+        x = self._flat_values(tensors)
+        self._set_flat(tensors, torch.max(torch.min(x, p_max), p_min))
+
     def add_param_group(self, param_group):
         r"""Add a param group to the :class:`Optimizer` s `param_groups`.
 
@@ -269,6 +369,10 @@ class AdamL(ParameterOptimizer):
     def step(self, closure=None) -> torch.Tensor:
         """Performs a single optimization step. Built upon code from PyTorch implementation of Adam.
 
+        The values and moments of all Parameters in a group are kept in persistent contiguous buffers, which the tensors of the Parameters are
+        views into, so that the whole group is updated with a few vectorized operations regardless of the number of Parameters. Gradients are
+        allocated by autograd for each tensor, so they are concatenated once per step.
+
         Arguments:
             closure (callable, optional): A closure that reevaluates the model
                 and returns the loss.
@@ -278,66 +382,279 @@ class AdamL(ParameterOptimizer):
             with torch.enable_grad():
                 loss = closure()
 
-        for group in self.param_groups:
-            for p in group['params']:
-                p_min = p.get_limits()[0]
-                p_max = p.get_limits()[1]
-                p_mid = (p_max - p_min) / 2
-                t = p.tensor()
-                if t.grad is None:
-                    continue
-                grad = t.grad
-                if grad.is_sparse:
-                    raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
-                amsgrad = group['amsgrad']
-
-                state = self.state[p]
-
-                # Check limits and multiply grad by closeness to limit and clamp values
-                dist = dist_to_lim(t, p_min, p_max)
-                multiplier = torch.clamp(torch.sign(dist) * torch.pow(torch.abs(dist / p_mid), 1 / 5), -1, 1)
-                multiplier = (multiplier + 1) * -1 if multiplier != 0 else multiplier + 1  # Change sign and add 1 so range is [1,2]
-                # t.clamp_(p_min, p_max)
-                old_grad = grad.clone()
-                grad.mul_(multiplier)
-                print("{} : {}".format(p.get_argument(), t))
-
-                # State initialization
-                if len(state) == 0:
-                    state['step'] = 0
-                    # Exponential moving average of gradient values
-                    state['exp_avg'] = torch.zeros_like(t, memory_format=torch.preserve_format)
-                    # Exponential moving average of squared gradient values
-                    state['exp_avg_sq'] = torch.zeros_like(t, memory_format=torch.preserve_format)
-                    if amsgrad:
-                        # Maintains max of all exp. moving avg. of sq. grad. values
-                        state['max_exp_avg_sq'] = torch.zeros_like(t, memory_format=torch.preserve_format)
-
-                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+        for i, group in enumerate(self.param_groups):
+            tensors = [p.tensor() for p in group['params']]
+            if all(t.grad is None for t in tensors):
+                continue
+            if any(t.grad is not None and t.grad.is_sparse for t in tensors):
+                raise RuntimeError('Adam does not support sparse gradients, please consider SparseAdam instead')
+
+            amsgrad = group['amsgrad']
+            beta1, beta2 = group['betas']
+            flat = self._flat_group(group, tensors)
+            x = flat.buffer
+            grad = self._flat_grads(tensors)
+            has_grad = flat.has_grad(tensors)
+
+            state = self.state["group_{}".format(i)]
+            # State initialization
+            if len(state) == 0:
+                state['step'] = torch.zeros_like(x)
+                # Exponential moving average of gradient values
+                state['exp_avg'] = torch.zeros_like(x)
+                # Exponential moving average of squared gradient values
+                state['exp_avg_sq'] = torch.zeros_like(x)
                 if amsgrad:
-                    max_exp_avg_sq = state['max_exp_avg_sq']
-                beta1, beta2 = group['betas']
+                    # Maintains max of all exp. moving avg. of sq. grad. values
+                    state['max_exp_avg_sq'] = torch.zeros_like(x)
+
+            # Check limits and multiply grad by closeness to limit. Inside the limits, the multiplier is 1. Above the maximum it is in the range
+            # [-2,-1), and below the minimum, where the distance is negative, it is in the range (-1,0]
+            dist = dist_to_lim(x, flat.p_min, flat.p_max)
+            multiplier = torch.clamp(torch.sign(dist) * torch.pow(torch.abs(dist / flat.p_mid), 1 / 5), -1, 1)
+            multiplier = torch.where(multiplier != 0, (multiplier + 1) * -1, torch.ones_like(multiplier))
+            grad = grad * multiplier
+
+            if group['weight_decay'] != 0:
+                grad = grad.add(x, alpha=group['weight_decay'])
+
+            # Parameters without gradients keep their values and moments
+            step = torch.where(has_grad, state['step'] + 1, state['step'])
+            state['step'] = step
+            bias_correction1 = 1 - beta1 ** step.clamp(min=1)
+            bias_correction2 = 1 - beta2 ** step.clamp(min=1)
+
+            # Decay the first and second moment running average coefficient
+            exp_avg = torch.where(has_grad, state['exp_avg'] * beta1 + grad * (1 - beta1), state['exp_avg'])
+            exp_avg_sq = torch.where(has_grad, state['exp_avg_sq'] * beta2 + grad * grad * (1 - beta2), state['exp_avg_sq'])
+            state['exp_avg'], state['exp_avg_sq'] = exp_avg, exp_avg_sq
+            if amsgrad:
+                # Maintains the maximum of all 2nd moment running avg. till now, and uses it for normalizing running avg. of gradient
+                state['max_exp_avg_sq'] = torch.max(state['max_exp_avg_sq'], exp_avg_sq)
+                denom = (state['max_exp_avg_sq'].sqrt() / bias_correction2.sqrt()).add_(group['eps'])
+            else:
+                denom = (exp_avg_sq.sqrt() / bias_correction2.sqrt()).add_(group['eps'])
+
+            step_size = group['lr'] / bias_correction1
+            x.add_(torch.where(has_grad, -step_size * exp_avg / denom, torch.zeros_like(x)))
 
-                state['step'] += 1
-                bias_correction1 = 1 - beta1 ** state['step']
-                bias_correction2 = 1 - beta2 ** state['step']
+        return loss
 
-                if group['weight_decay'] != 0:
-                    grad = grad.add(t, alpha=group['weight_decay'])
 
-                # Decay the first and second moment running average coefficient
-                exp_avg.mul_(beta1).add_(grad, alpha=1 - beta1)
-                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
-                if amsgrad:
-                    # Maintains the maximum of all 2nd moment running avg. till now
-                    torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
-                    # Use the max. for normalizing running avg. of gradient
-                    denom = (max_exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+class SGDL(ParameterOptimizer):
+    """Stochastic gradient descent with (optionally Nesterov) momentum, that projects Parameters back within their limits after each step."""
+
+    def __init__(self, params: List[Parameter], lr=1e-2, momentum=0.9, dampening=0, nesterov=False):
+        if not 0.0 <= lr:
+            raise ValueError("Invalid learning rate: {}".format(lr))
+        if not 0.0 <= momentum:
+            raise ValueError("Invalid momentum value: {}".format(momentum))
+        if nesterov and (momentum <= 0 or dampening != 0):
+            raise ValueError("Nesterov momentum requires a momentum and zero dampening")
+        defaults = dict(lr=lr, momentum=momentum, dampening=dampening, nesterov=nesterov)
+        super().__init__(params, defaults)
+
+    @torch.no_grad()
+    def step(self, closure=None) -> torch.Tensor:
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for i, group in enumerate(self.param_groups):
+            tensors = [p.tensor() for p in group['params']]
+            if all(t.grad is None for t in tensors):
+                continue
+
+            grad = self._flat_grads(tensors)
+            has_grad = self._flat_has_grad(tensors)
+            momentum = group['momentum']
+
+            if momentum != 0:
+                state = self.state["group_{}".format(i)]
+                if 'momentum_buffer' not in state:
+                    buf = grad.clone()
                 else:
-                    denom = (exp_avg_sq.sqrt() / math.sqrt(bias_correction2)).add_(group['eps'])
+                    buf = state['momentum_buffer'] * momentum + grad * (1 - group['dampening'])
+                    buf = torch.where(has_grad, buf, state['momentum_buffer'])
+                state['momentum_buffer'] = buf
+                grad = grad + buf * momentum if group['nesterov'] else buf
+
+            self._add_flat(tensors, torch.where(has_grad, -group['lr'] * grad, torch.zeros_like(grad)))
+            self._project(group, tensors)
+
+        return loss
+
+
+class RMSpropL(ParameterOptimizer):
+    """RMSprop that projects Parameters back within their limits after each step."""
+
+    def __init__(self, params: List[Parameter], lr=1e-2, alpha=0.99, eps=1e-8, momentum=0, centered=False):
+        if not 0.0 <= lr:
+            raise ValueError("Invalid learning rate: {}".format(lr))
+        if not 0.0 <= eps:
+            raise ValueError("Invalid epsilon value: {}".format(eps))
+        if not 0.0 <= alpha:
+            raise ValueError("Invalid alpha value: {}".format(alpha))
+        defaults = dict(lr=lr, alpha=alpha, eps=eps, momentum=momentum, centered=centered)
+        super().__init__(params, defaults)
 
-                step_size = group['lr'] / bias_correction1
+    @torch.no_grad()
+    def step(self, closure=None) -> torch.Tensor:
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for i, group in enumerate(self.param_groups):
+            tensors = [p.tensor() for p in group['params']]
+            if all(t.grad is None for t in tensors):
+                continue
+
+            grad = self._flat_grads(tensors)
+            has_grad = self._flat_has_grad(tensors)
+            alpha = group['alpha']
+
+            state = self.state["group_{}".format(i)]
+            if len(state) == 0:
+                state['square_avg'] = torch.zeros_like(grad)
+                state['grad_avg'] = torch.zeros_like(grad)
+                state['momentum_buffer'] = torch.zeros_like(grad)
+
+            square_avg = torch.where(has_grad, state['square_avg'] * alpha + grad * grad * (1 - alpha), state['square_avg'])
+            state['square_avg'] = square_avg
+            if group['centered']:
+                grad_avg = torch.where(has_grad, state['grad_avg'] * alpha + grad * (1 - alpha), state['grad_avg'])
+                state['grad_avg'] = grad_avg
+                avg = (square_avg - grad_avg * grad_avg).sqrt().add_(group['eps'])
+            else:
+                avg = square_avg.sqrt().add_(group['eps'])
+
+            if group['momentum'] > 0:
+                buf = torch.where(has_grad, state['momentum_buffer'] * group['momentum'] + grad / avg, state['momentum_buffer'])
+                state['momentum_buffer'] = buf
+                update = -group['lr'] * buf
+            else:
+                update = -group['lr'] * grad / avg
 
-                t.addcdiv_(exp_avg, denom, value=-step_size)
+            self._add_flat(tensors, torch.where(has_grad, update, torch.zeros_like(update)))
+            self._project(group, tensors)
 
         return loss
+
+
+class LBFGSL(ParameterOptimizer):
+    """
+    Limited memory BFGS that keeps Parameters within their limits, similar to L-BFGS-B. Parameters that are at a limit and whose gradient
+    points out of the valid range are held fixed, the search direction is computed from the curvature pairs of the free Parameters, and a
+    backtracking line search is done along the projection of the search direction onto the limits.
+
+    Every step evaluates the closure several times, so the closure has to render, compute the loss, call backward() and return the loss.
+    """
+    requires_closure = True
+
+    def __init__(self, params: List[Parameter], lr=1, max_iter=5, history_size=10, line_search_steps=10, tolerance_grad=1e-7,
+                 tolerance_change=1e-9):
+        if not 0.0 < lr:
+            raise ValueError("Invalid learning rate: {}".format(lr))
+        defaults = dict(lr=lr, max_iter=max_iter, history_size=history_size, line_search_steps=line_search_steps,
+                        tolerance_grad=tolerance_grad, tolerance_change=tolerance_change)
+        super().__init__(params, defaults)
+
+        if len(self.param_groups) != 1:
+            raise ValueError("LBFGSL doesn't support per-parameter options (parameter groups)")
+
+    def _projected_grad(self, x: torch.Tensor, grad: torch.Tensor, p_min: torch.Tensor, p_max: torch.Tensor) -> torch.Tensor:
+        """Returns the gradient with the elements that would move Parameters out of their limits set to zero."""
+        active = ((x <= p_min) & (grad > 0)) | ((x >= p_max) & (grad < 0))
+        return torch.where(active, torch.zeros_like(grad), grad)
+
+    def _direction(self, grad: torch.Tensor, free: torch.Tensor, state: dict) -> torch.Tensor:
+        """Computes the L-BFGS search direction with the two-loop recursion, restricted to the free Parameters."""
+        q = grad.clone()
+        pairs = [(s * free, y * free) for s, y in zip(state['old_stps'], state['old_dirs'])]
+        pairs = [(s, y) for s, y in pairs if y.dot(s) > 1e-10]  # Pairs can lose their positive curvature when restricted to the free Parameters
+        alphas = []
+        for s, y in reversed(pairs):
+            rho = 1. / y.dot(s)
+            a = rho * s.dot(q)
+            q.sub_(y * a)
+            alphas.append((rho, a))
+
+        if pairs:
+            s, y = pairs[-1]
+            q.mul_(s.dot(y) / y.dot(y))
+
+        for (s, y), (rho, a) in zip(pairs, reversed(alphas)):
+            b = rho * y.dot(q)
+            q.add_(s * (a - b))
+
+        return -q * free
+
+    @torch.no_grad()
+    def step(self, closure) -> torch.Tensor:
+        """
+        Performs up to 'max_iter' L-BFGS iterations.
+
+        :param closure: A closure that reevaluates the model and returns the loss.
+        :return: the loss before the step
+        """
+        if closure is None:
+            raise RuntimeError("LBFGSL requires a closure that reevaluates the loss")
+        closure = torch.enable_grad()(closure)
+
+        group = self.param_groups[0]
+        tensors = [p.tensor() for p in group['params']]
+        p_min, p_max, _ = self._flat_limits(group)
+        state = self.state["group_0"]
+        state.setdefault('old_stps', [])
+        state.setdefault('old_dirs', [])
+
+        self._project(group, tensors)
+        orig_loss = closure()
+        loss = float(orig_loss)
+        x = self._flat_values(tensors)
+        grad = self._flat_grads(tensors)
+
+        for _ in range(group['max_iter']):
+            pg = self._projected_grad(x, grad, p_min, p_max)
+            if pg.abs().max() <= group['tolerance_grad']:
+                break
+
+            free = (pg != 0).to(grad.dtype)
+            d = self._direction(pg, free, state)
+            if d.dot(pg) >= 0:  # Not a descent direction, fall back to steepest descent
+                state['old_stps'].clear()
+                state['old_dirs'].clear()
+                d = -pg
+
+            # The first step is scaled, as there is no curvature information to scale the direction with yet
+            t = group['lr'] if state['old_stps'] else min(1., 1. / float(pg.abs().sum())) * group['lr']
+            for _ in range(group['line_search_steps']):
+                x_new = torch.max(torch.min(x + t * d, p_max), p_min)
+                self._set_flat(tensors, x_new)
+                new_loss = float(closure())
+                if new_loss <= loss + 1e-4 * float(pg.dot(x_new - x)):  # Armijo condition
+                    break
+                t *= 0.5
+            else:
+                # No decrease was found. Go back to the accepted point and its gradient, and leave the history untouched
+                self._set_flat(tensors, x)
+                self._set_flat_grads(tensors, grad)
+                break
+
+            new_grad = self._flat_grads(tensors)
+            s, y = x_new - x, new_grad - grad
+            if y.dot(s) > 1e-10:
+                if len(state['old_stps']) == group['history_size']:
+                    state['old_stps'].pop(0)
+                    state['old_dirs'].pop(0)
+                state['old_stps'].append(s)
+                state['old_dirs'].append(y)
+
+            converged = abs(new_loss - loss) < group['tolerance_change']
+            x, grad, loss = x_new, new_grad, new_loss
+            if converged:
+                break
+
+        return orig_loss
@@ -0,0 +1,941 @@
+"""
+Parameter estimation of a procedural material against a target texture, without any dependency on Qt. Can be run from the command line:
+
+    python -m dipter.optimization.texture_matching material.json target.png --output result.json
+"""
+import argparse
+import ast
+import copy
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import pickle
+import pydoc
+import shutil
+import time
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image as PILImage
+from PIL.Image import Image
+from torch import optim
+
+from dipter.misc import image_funcs, string_funcs, number_funcs, material_serializer
+from dipter.node_graph.node import ShaderNode
+from dipter.node_graph.parameter import Parameter
+from dipter.optimization import optimizers, losses, gradient_free
+from dipter.shaders.render_context import RenderContext
+
+_logger = logging.getLogger(__name__)
+
+LOSS_FUNCTIONS = {l.__name__: l for l in [losses.XSELoss, losses.SquaredBinLoss, losses.VerticalBinLoss, losses.NeuralLoss]}
+CHECKPOINT_GROUP = "checkpoint"
+RUN_OPTIONS = ("checkpoint_path", "resume")  # Settings of a single run, which are neither saved to nor loaded from .hdf5 files
+OPTIMIZERS = {o.__name__: o for o in [optimizers.AdamL, optimizers.SGDL, optimizers.RMSpropL, optimizers.LBFGSL, optim.Adam, optim.AdamW,
+                                      optim.Adagrad, optim.RMSprop, gradient_free.CMAES, gradient_free.NelderMead,
+                                      gradient_free.RandomSearch]}
+
+
+class GradientDescentSettings:
+
+    def __init__(self):
+        self.loss_func = None
+        self.loss_args = {}
+        self.optimizer = None
+        self.optimizer_args = {}
+        self.render_width = 200
+        self.render_height = 200
+        self.max_iter = 100
+        self.early_stopping_thresh = 0.01
+        self.num_starts = 1  # Number of starting points that are optimized at the same time, see TextureMatching._run_multi_start()
+        self.centered_starts = False  # If True, starting points are sampled around the default values instead of uniformly within the limits
+        self.halving_interval = 10  # Number of iterations between each time the worst half of the starting points are discarded. 0 disables it
+        self.pyramid_levels = 1  # Number of resolutions to optimize at, halving the render size for each level below the last one
+        self.evaluation_workers = 0  # Number of worker processes that evaluate candidates of gradient-free optimizers or the discrete search
+        self.discrete_candidates = 0  # Maximum number of assignments of Int inputs to search over, see TextureMatching._run_discrete_search()
+        self.checkpoint_path = ""  # .hdf5 file that gradient descent with a single starting point writes checkpoints to, see save_hdf5()
+        self.checkpoint_interval = 0  # Number of iterations between checkpoints. 0 only writes a checkpoint when the matching is stopped
+        self.resume = False  # If True, gradient descent continues from the checkpoint in 'checkpoint_path'
+
+    def to_dict(self) -> dict:
+        return vars(self)
+
+    def load_from_hdf5(self, f, close_hdf5=True):
+        attrs = dict(f.get("data").attrs)
+        for att in attrs:
+            if att in RUN_OPTIONS:
+                continue
+            saved_att = attrs[att]
+            try:
+                current_att = getattr(self, att)
+                if current_att is None and att in ["loss_func", "optimizer"]:
+                    type_att = type
+                else:
+                    type_att = type(current_att)
+                if not isinstance(saved_att, type_att):
+                    if type_att == dict:
+                        saved_att = ast.literal_eval(saved_att)
+                    elif type_att == type:
+                        import_string = string_funcs.type_to_import_string(saved_att)
+                        if att == "optimizer" and import_string.split(".")[-1] in OPTIMIZERS:
+                            saved_att = OPTIMIZERS[import_string.split(".")[-1]]
+                        elif att == "optimizer":  # Optimizers are weird when it comes to importing them, handle them separately
+                            cls_name = import_string.split(".")[-1]
+                            saved_att = pydoc.locate("torch.optim." + cls_name)
+                        else:
+                            saved_att = pydoc.locate(import_string)
+                    else:
+                        saved_att = type_att(saved_att)
+
+                if number_funcs.is_float(saved_att):
+                    saved_att = number_funcs.round_significant(saved_att, 3)
+                elif isinstance(saved_att, dict):
+                    for key, val in saved_att.items():
+                        if number_funcs.is_float(val):
+                            saved_att[key] = number_funcs.round_significant(val, 3)
+                elif isinstance(saved_att, (list, np.ndarray)):
+                    for i, val in enumerate(saved_att):
+                        if number_funcs.is_float(val):
+                            saved_att[i] = number_funcs.round_significant(val, 3)
+
+                setattr(self, att, saved_att)
+            except AttributeError as e:
+                _logger.debug("Attribute {} not found in settings. Skipping...".format(att))
+        if close_hdf5:
+            f.close()
+
+
+class TextureMatching:
+    """
+    Estimates the parameters of the node graph ending in 'out_node' that makes its render match a target image, using gradient descent. Progress
+    is reported through optional callbacks instead of Qt signals, so that matching can run on machines without a display.
+    """
+
+    def __init__(self, image_to_match: Image, out_node: ShaderNode, settings: GradientDescentSettings,
+                 iteration_done_callback: typing.Callable[[dict], None] = None):
+        """
+        :param image_to_match: the target image
+        :param out_node: the output node of the material to match
+        :param settings: the settings of the optimization
+        :param iteration_done_callback: called after each iteration with a dictionary of the iteration number, loss, loss history, parameter
+            values, iteration time and render
+        """
+        self.out_node = out_node
+        self.settings = settings
+        self.target = image_to_match
+        self._target_image = image_to_match
+        self.iteration_done_callback = iteration_done_callback
+        self._stop = False
+        self._last_params = None
+        self._active_parameters = None
+
+    def stop(self):
+        """Stops a running optimization after the current iteration. Safe to call from another thread."""
+        self._stop = True
+
+    def set_active_parameters(self, params: typing.Dict[str, Parameter]):
+        """Given a dictionary of Parameters, these will be the only ones updated each optimization step."""
+        self._active_parameters = params
+
+    def run(self) -> typing.Tuple[dict, np.ndarray, dict]:
+        """
+        Runs the optimization until 'max_iter' iterations are done, the loss is below the early stopping threshold or stop() is called.
+
+        :return: a tuple of a dictionary of modified argument names mapped to the optimized Parameters, the loss history and a dictionary with
+            the minimum loss ("min_loss") and the parameter values that gave it ("min_params")
+        """
+        if isinstance(self.target, Image):
+            self._target_image = self.target
+            self.target = image_funcs.image_to_tensor(self.target, (self.settings.render_width, self.settings.render_height))
+        if self.settings.resume and (self.settings.discrete_candidates > 0 or self.settings.num_starts > 1 or
+                                     issubclass(self.settings.optimizer, gradient_free.GradientFreeOptimizer)):
+            raise ValueError("Only gradient descent with a single starting point can be resumed from a checkpoint!")
+
+        if self.settings.discrete_candidates > 0:
+            params, loss_hist, info = self._run_discrete_search()
+        elif issubclass(self.settings.optimizer, gradient_free.GradientFreeOptimizer):
+            params, loss_hist, info = self._run_gradient_free()
+        elif self.settings.num_starts > 1:
+            params, loss_hist, info = self._run_multi_start()
+        else:
+            params, loss_hist, info = self._run_gd()
+        self._last_params = params
+        return params, loss_hist, info
+
+    def restore_params(self):
+        for key in self._last_params:
+            self._last_params[key].restore_value()
+
+    def _iteration_done(self, props: dict):
+        if self.iteration_done_callback:
+            self.iteration_done_callback(props)
+
+    def _resolution_schedule(self) -> typing.List[typing.Tuple[int, int, int]]:
+        """
+        Returns the (width, height, first iteration) of each resolution level. The render size is halved for each level below the last one, and
+        the iterations are split evenly between the levels, with any remainder given to the last level.
+        """
+        levels = max(1, min(self.settings.pyramid_levels, self.settings.max_iter))  # Every level needs at least one iteration
+        width, height = self.settings.render_width, self.settings.render_height
+        level_iter = self.settings.max_iter // levels
+        schedule = []
+        for level in range(levels):
+            scale = 2 ** (levels - 1 - level)
+            schedule.append((max(1, width // scale), max(1, height // scale), level * level_iter))
+
+        return schedule
+
+    def _level_target(self, width: int, height: int) -> torch.Tensor:
+        """Returns the target resized to the given render size."""
+        if (width, height) == tuple(self.target.shape[:2]):
+            return self.target
+        elif isinstance(self._target_image, Image):
+            return image_funcs.image_to_tensor(self._target_image, (width, height))
+        else:  # Target was given as a Tensor on the format [W,H,C]
+            return F.interpolate(self.target.permute(2, 0, 1).unsqueeze(0), size=(width, height), mode="area").squeeze(0).permute(1, 2, 0)
+
+    @staticmethod
+    def _loss_input(images: torch.Tensor, loss_func: losses.Loss) -> torch.Tensor:
+        """Resizes images on the format [W,H,C] or [N,W,H,C] to the input size of the loss function, for losses that only accept one size,
+        such as NeuralLoss. Lower resolution levels are upsampled, so that they still render faster."""
+        if loss_func.INPUT_SIZE is None or tuple(images.shape[-3:-1]) == loss_func.INPUT_SIZE:
+            return images
+
+        x = images if images.dim() == 4 else images.unsqueeze(0)
+        x = F.interpolate(x.permute(0, 3, 1, 2), size=loss_func.INPUT_SIZE, mode="bilinear", align_corners=False).permute(0, 2, 3, 1)
+        return x if images.dim() == 4 else x.squeeze(0)
+
+    def _run_gd(self) -> typing.Tuple[dict, np.ndarray, dict]:
+        max_iter = self.settings.max_iter
+        early_stopping_thresh = self.settings.early_stopping_thresh
+        loss_func = self.settings.loss_func(**self.settings.loss_args)
+        schedule = self._resolution_schedule()
+        level = 0
+        width, height, _ = schedule[level]
+        target = self._loss_input(self._level_target(width, height), loss_func)
+        min_loss = np.finfo(np.float32).max
+        min_params = {}
+        context = RenderContext(width, height)  # Renders of this run should not interfere with renders on other threads
+
+        if self._active_parameters is None:
+            _, params_dict = self.out_node.render(width, height, retain_graph=False, context=context)
+        else:
+            params_dict = self._active_parameters
+
+        for _, p in params_dict.items():
+            p.save_value()
+
+        args_list = [params_dict[k].tensor() for k in params_dict]
+
+        for t in args_list:
+            t.requires_grad = True
+
+        loss_hist = np.empty(max_iter, dtype=np.float32)
+        if issubclass(self.settings.optimizer, optimizers.ParameterOptimizer):  # Limit-aware optimizers work on Parameters
+            optimizer = self.settings.optimizer(list(params_dict.values()), **self.settings.optimizer_args)
+        else:
+            optimizer = self.settings.optimizer(args_list, **self.settings.optimizer_args)
+
+        i = 0
+        if self.settings.resume:
+            i, min_loss, min_params = self._restore_checkpoint(params_dict, optimizer, loss_hist)
+            level = max(l for l, (_, _, first_iter) in enumerate(schedule) if first_iter <= i)
+            width, height, _ = schedule[level]
+            target = self._loss_input(self._level_target(width, height), loss_func)
+
+        evaluations = []  # (loss, render, parameter values) of each evaluation of the closure during one step
+
+        def closure():
+            # Optimizers like LBFGSL evaluate the loss several times per step, and every evaluation is a candidate for the minimum loss
+            nonlocal min_loss, min_params
+            optimizer.zero_grad()
+            render, _ = self.out_node.render(width, height, retain_graph=True, context=context)
+            loss = loss_func(self._loss_input(render, loss_func), target)
+            loss.backward()
+            loss_np = loss.detach().clone().cpu().numpy()
+            values = {k: v.get_value() for k, v in params_dict.items()}
+            if loss_np < min_loss:
+                min_loss = loss_np
+                min_params = values
+            evaluations.append((loss_np, render.detach(), values))
+            return loss
+
+        while i < max_iter:
+            if self._stop:
+                self._checkpoint(i, params_dict, optimizer, loss_hist, min_loss, min_params, force=True)
+                return params_dict, loss_hist, {"min_loss": min_loss, "min_params": min_params}
+
+            if level + 1 < len(schedule) and i == schedule[level + 1][2]:
+                # Optimizer state carries over to the next level, but losses at different resolutions can not be compared
+                level += 1
+                width, height, _ = schedule[level]
+                target = self._loss_input(self._level_target(width, height), loss_func)
+                min_loss = np.finfo(np.float32).max
+                min_params = {}
+
+            if getattr(optimizer, "requires_closure", False):
+                start = time.time()
+                evaluations.clear()
+                optimizer.step(closure)
+                # The parameters are left at the last point the step accepted, which is not always the evaluation with the lowest loss
+                current = {k: params_dict[k].get_value() for k in params_dict}
+                accepted = [e for e in evaluations if all(np.array_equal(e[2][k], v) for k, v in current.items())]
+                new_loss_np, render, _ = accepted[-1] if accepted else evaluations[-1]
+                loss_hist[i] = new_loss_np
+                props = {'iter': i, 'loss': new_loss_np, 'loss_hist': loss_hist[:i + 1], 'params': current,
+                         'iter_time': time.time() - start, 'render': render, 'render_size': (width, height)}
+                self._iteration_done(props)
+
+                if new_loss_np <= early_stopping_thresh and level == len(schedule) - 1:
+                    break
+                i += 1
+                self._checkpoint(i, params_dict, optimizer, loss_hist, min_loss, min_params)
+                continue
+
+            # for p in params_dict.values():  # Normalize values before each step. Un-normalization is automatically performed during rendering.
+            #     p.normalize()
+
+            with torch.autograd.set_detect_anomaly(True):
+                optimizer.zero_grad()
+                start = time.time()
+                render, _ = self.out_node.render(width, height, retain_graph=True, context=context)
+                loss = loss_func(self._loss_input(render, loss_func), target)
+                new_loss_np = loss.detach().clone().cpu().numpy()
+
+                if new_loss_np < min_loss:
+                    _logger.debug("Better loss found from {} -> {}".format(min_loss, new_loss_np))
+                    min_loss = new_loss_np
+                    for k,v in params_dict.items():
+                        min_params[k] = v.get_value()
+
+                loss_hist[i] = new_loss_np
+                props = {'iter': i, 'loss': new_loss_np, 'loss_hist': loss_hist[:i + 1],
+                         'params': {k: params_dict[k].get_value() for k in params_dict}, 'iter_time': 0.0, 'render': render,
+                         'render_size': (width, height)}
+
+                # We need to break here, otherwise the parameters will change when we call optimizer.step()
+                if loss <= early_stopping_thresh and level == len(schedule) - 1:
+                    self._iteration_done(props)
+                    break
+
+                loss.backward(retain_graph=False, create_graph=False)
+
+                optimizer.step()
+
+            props['iter_time'] = time.time() - start
+            self._iteration_done(props)
+
+            i += 1
+            self._checkpoint(i, params_dict, optimizer, loss_hist, min_loss, min_params)
+
+        return params_dict, loss_hist[0:i + 1], {"min_loss": min_loss, "min_params": min_params}
+
+    def _checkpoint(self, num_iter: int, params_dict: dict, optimizer, loss_hist: np.ndarray, min_loss, min_params: dict, force: bool = False):
+        """Writes a checkpoint to 'checkpoint_path' every 'checkpoint_interval' iterations, or if 'force' is True, where 'num_iter' is the number of
+        iterations that are done."""
+        interval = self.settings.checkpoint_interval
+        if not self.settings.checkpoint_path or not (force or (interval > 0 and num_iter % interval == 0)):
+            return
+
+        checkpoint = {
+            "iteration": num_iter,
+            "min_loss": min_loss,
+            "params": {k: p.get_value() for k, p in params_dict.items()},
+            "min_params": min_params,
+            "state": {"optimizer": optimizer.state_dict(), "torch_rng": torch.get_rng_state(), "numpy_rng": np.random.get_state()},
+        }
+        save_hdf5(self.settings.checkpoint_path, self.settings, loss_hist[:num_iter], checkpoint=checkpoint)
+        _logger.debug("Saved checkpoint after {} iterations to {}".format(num_iter, self.settings.checkpoint_path))
+
+    def _restore_checkpoint(self, params_dict: dict, optimizer, loss_hist: np.ndarray) -> typing.Tuple[int, typing.Any, dict]:
+        """Restores the parameter values, optimizer state, loss history and random number generator states of the checkpoint in
+        'checkpoint_path'. Returns the number of iterations that are done, the minimum loss and the parameter values that gave it."""
+        checkpoint = load_checkpoint(self.settings.checkpoint_path)
+        if checkpoint is None:
+            raise ValueError("{} has no checkpoint to resume from!".format(self.settings.checkpoint_path))
+        if set(checkpoint["params"]) != set(params_dict):
+            raise ValueError("The checkpoint in {} does not match the parameters of the node graph!".format(self.settings.checkpoint_path))
+
+        gradient_free.set_parameter_values(params_dict, checkpoint["params"])
+        optimizer.load_state_dict(checkpoint["state"]["optimizer"])
+        torch.set_rng_state(checkpoint["state"]["torch_rng"])
+        np.random.set_state(checkpoint["state"]["numpy_rng"])
+
+        num_iter = min(checkpoint["iteration"], len(loss_hist))
+        loss_hist[:num_iter] = checkpoint["loss_hist"][:num_iter]
+        _logger.info("Resuming from checkpoint after {} iterations with a minimum loss of {}".format(num_iter, checkpoint["min_loss"]))
+        return num_iter, checkpoint["min_loss"], checkpoint["min_params"]
+
+    def _run_multi_start(self) -> typing.Tuple[dict, np.ndarray, dict]:
+        """
+        Optimizes 'num_starts' starting points at the same time, rendering all of them in one batched render each iteration. The current
+        parameter values are always one of the starting points, and the rest are randomly sampled. Every 'halving_interval' iterations, the
+        worst half of the remaining starting points (by their lowest loss so far) are discarded, together with their optimizer state.
+
+        Inputs that are forced to be scalars can not be batched, and keep their current values.
+        """
+        max_iter = self.settings.max_iter
+        early_stopping_thresh = self.settings.early_stopping_thresh
+        num_starts = self.settings.num_starts
+        halving_interval = self.settings.halving_interval
+        loss_func = self.settings.loss_func(**self.settings.loss_args)
+        schedule = self._resolution_schedule()
+        level = 0
+        width, height, _ = schedule[level]
+        target = self._loss_input(self._level_target(width, height), loss_func)
+        context = RenderContext(width, height)
+
+        if issubclass(self.settings.optimizer, optimizers.ParameterOptimizer):
+            raise ValueError("{} can not optimize several starting points at the same time!".format(self.settings.optimizer.__name__))
+
+        _, params_dict = self.out_node.render(width, height, retain_graph=False, context=context)
+        if self._active_parameters is not None:
+            params_dict = self._active_parameters
+
+        for _, p in params_dict.items():
+            p.save_value()
+
+        batch = {k: self._sample_starts(p, num_starts, self.settings.centered_starts).requires_grad_()
+                 for k, p in params_dict.items() if not p.is_scalar()}
+        optimizer = self.settings.optimizer(list(batch.values()), **self.settings.optimizer_args)
+
+        active = torch.arange(num_starts)  # Indices of the starting points that have not been discarded
+        min_losses = torch.full((num_starts,), np.finfo(np.float32).max)
+        min_values = {k: t.detach().clone() for k, t in batch.items()}
+        loss_hist = np.empty(max_iter, dtype=np.float32)
+
+        i = 0
+        while i < max_iter and not self._stop:
+            if level + 1 < len(schedule) and i == schedule[level + 1][2]:
+                level += 1
+                width, height, _ = schedule[level]
+                target = self._loss_input(self._level_target(width, height), loss_func)
+                min_losses[:] = np.finfo(np.float32).max
+
+            optimizer.zero_grad()
+            start = time.time()
+            renders, _ = self.out_node.render_batch(width, height, batch, retain_graph=True, context=context)
+            loss = loss_func.forward_batch(self._loss_input(renders, loss_func), target)
+            loss_np = loss.detach()
+
+            improved = loss_np < min_losses[active]
+            min_losses[active[improved]] = loss_np[improved]
+            for k, t in batch.items():
+                min_values[k][active[improved]] = t.detach()[improved]
+
+            best = int(torch.argmin(loss_np))
+            loss_hist[i] = loss_np[best]
+            props = {'iter': i, 'loss': loss_hist[i], 'loss_hist': loss_hist[:i + 1], 'params': {k: t[best].detach().clone().cpu().numpy()
+                     for k, t in batch.items()}, 'iter_time': 0.0, 'render': renders[best].detach(), 'render_size': (width, height), 'num_starts': len(active)}
+
+            if loss_hist[i] <= early_stopping_thresh and level == len(schedule) - 1:
+                self._iteration_done(props)
+                i += 1
+                break
+
+            torch.sum(loss).backward()  # The loss of each starting point only depends on its own parameters
+            optimizer.step()
+            with torch.no_grad():  # Plain optimizers know nothing about the limits of the Parameters
+                for k, t in batch.items():
+                    t.clamp_(*params_dict[k].get_limits())
+
+            props['iter_time'] = time.time() - start
+            self._iteration_done(props)
+
+            i += 1
+            if halving_interval > 0 and i % halving_interval == 0 and len(active) > 1:
+                keep = torch.argsort(min_losses[active])[:len(active) // 2].sort().values
+                batch = _prune_batch(optimizer, batch, keep)
+                active = active[keep]
+
+        best = int(torch.argmin(min_losses))
+        min_params = {k: v[best].cpu().numpy() for k, v in min_values.items()}
+        for k, value in min_params.items():
+            params_dict[k].set_value(torch.from_numpy(value))
+
+        return params_dict, loss_hist[0:i], {"min_loss": min_losses[best].numpy(), "min_params": min_params,
+                                             "start_losses": min_losses.numpy()}
+
+    def _run_gradient_free(self) -> typing.Tuple[dict, np.ndarray, dict]:
+        """
+        Optimizes the parameters with a gradient-free optimizer, which makes it possible to also match inputs that have no useful gradient, such as
+        integers and choices. Each iteration evaluates one population of candidates, in 'evaluation_workers' worker processes if it is above 0.
+        The loss history holds the lowest loss of each population. Candidates are always rendered at the full render size.
+        """
+        max_iter = self.settings.max_iter
+        early_stopping_thresh = self.settings.early_stopping_thresh
+        width, height = self.settings.render_width, self.settings.render_height
+        context = RenderContext(width, height)
+
+        _, params_dict = self.out_node.render(width, height, retain_graph=False, context=context)
+        if self._active_parameters is not None:
+            params_dict = self._active_parameters
+
+        for _, p in params_dict.items():
+            p.save_value()
+
+        space = gradient_free.SearchSpace(params_dict)
+        optimizer = self.settings.optimizer(space.encode(), space.steps(), **self.settings.optimizer_args)
+        if self.settings.evaluation_workers > 0:
+            evaluate = gradient_free.ProcessEvaluator(self.out_node, params_dict, self.target, self.settings.loss_func, self.settings.loss_args,
+                                                      width, height, self.settings.evaluation_workers)
+        else:
+            evaluate = gradient_free.GraphEvaluator(self.out_node, params_dict, self.target, self.settings.loss_func(**self.settings.loss_args),
+                                                    width, height, context)
+
+        min_loss = np.finfo(np.float32).max
+        min_params = {}
+        loss_hist = np.empty(max_iter, dtype=np.float32)
+        num_evaluations = 0
+
+        i = 0
+        try:
+            while i < max_iter and not self._stop:
+                start = time.time()
+                xs = optimizer.ask()
+                candidates = [space.decode(x) for x in xs]
+                candidate_losses = evaluate(candidates)
+                optimizer.tell(xs, candidate_losses + space.penalty(xs))
+                num_evaluations += len(candidates)
+
+                best = int(np.argmin(candidate_losses))
+                if candidate_losses[best] < min_loss:
+                    _logger.debug("Better loss found from {} -> {}".format(min_loss, candidate_losses[best]))
+                    min_loss = np.float32(candidate_losses[best])
+                    min_params = candidates[best]
+                loss_hist[i] = candidate_losses[best]
+
+                if self.iteration_done_callback:
+                    gradient_free.set_parameter_values(params_dict, candidates[best])
+                    with torch.no_grad():
+                        render, _ = self.out_node.render(width, height, retain_graph=True, context=context)
+                    self._iteration_done({'iter': i, 'loss': loss_hist[i], 'loss_hist': loss_hist[:i + 1], 'params': candidates[best],
+                                          'iter_time': time.time() - start, 'render': render, 'render_size': (width, height),
+                                          'num_candidates': len(candidates)})
+
+                i += 1
+                if min_loss <= early_stopping_thresh:
+                    break
+        finally:
+            evaluate.close()
+
+        gradient_free.set_parameter_values(params_dict, min_params)
+        return params_dict, loss_hist[0:i], {"min_loss": min_loss, "min_params": min_params, "evaluations": num_evaluations}
+
+    def _run_discrete_search(self) -> typing.Tuple[dict, np.ndarray, dict]:
+        """
+        Searches over the values of Int and Int_Choice inputs, which gradient descent keeps fixed. Up to 'discrete_candidates' assignments of
+        integer values are enumerated, or sampled if there are more, and the continuous parameters of each candidate are optimized by gradient
+        descent for 'halving_interval' iterations per round. After each round, the worst half of the candidates (by their lowest loss so far)
+        are discarded, until one candidate is left and has been optimized for 'max_iter' iterations in total. Each round continues from the best
+        continuous values of the previous one, with a new optimizer. Rounds run in 'evaluation_workers' worker processes if it is above 0.
+
+        The loss history holds the lowest loss after each round.
+        """
+        if issubclass(self.settings.optimizer, gradient_free.GradientFreeOptimizer):
+            raise ValueError("Gradient-free optimizers already search over integer inputs, use {} without discrete candidates!".format(
+                self.settings.optimizer.__name__))
+
+        max_iter = self.settings.max_iter
+        round_iter = self.settings.halving_interval if self.settings.halving_interval > 0 else max_iter
+        width, height = self.settings.render_width, self.settings.render_height
+        context = RenderContext(width, height)
+
+        _, params_dict = self.out_node.render(width, height, retain_graph=False, context=context)
+        if self._active_parameters is not None:
+            params_dict = self._active_parameters
+
+        for _, p in params_dict.items():
+            p.save_value()
+        saved_values = {k: p.get_value() for k, p in params_dict.items()}
+
+        discrete = {k: p for k, p in params_dict.items() if p.dtype() in gradient_free.INTEGER_TYPES}
+        if not discrete:
+            raise ValueError("The node graph has no Int or Int_Choice inputs to search over!")
+        continuous = [k for k in params_dict if k not in discrete]
+        start_values = {k: params_dict[k].get_value() for k in continuous}
+        candidates = [{**assignment, **start_values} for assignment in discrete_assignments(discrete, self.settings.discrete_candidates)]
+        min_losses = np.full(len(candidates), np.finfo(np.float32).max, dtype=np.float32)
+
+        if self.settings.evaluation_workers > 0:
+            pool = _CandidatePool(self.out_node, self.target, self.settings, self.settings.evaluation_workers)
+        else:
+            pool = None
+        active = np.arange(len(candidates))  # Indices of the candidates that have not been discarded
+        loss_hist = np.empty(math.ceil(max_iter / round_iter), dtype=np.float32)
+
+        i = 0
+        done_iter = 0
+        try:
+            while done_iter < max_iter and not self._stop:
+                start = time.time()
+                iterations = min(round_iter, max_iter - done_iter)
+                if pool is None:
+                    results = [_optimize_candidate(self.out_node, params_dict, self.target, self.settings, candidates[j], continuous, iterations)
+                               for j in active]
+                else:
+                    results = pool.optimize([candidates[j] for j in active], continuous, iterations)
+
+                for j, (loss, values) in zip(active, results):
+                    if loss < min_losses[j]:
+                        min_losses[j] = loss
+                        candidates[j] = values
+                done_iter += iterations
+
+                best = int(active[np.argmin(min_losses[active])])
+                loss_hist[i] = min_losses[best]
+                _logger.debug("Round {}: {} candidates, min loss {}".format(i, len(active), loss_hist[i]))
+                if self.iteration_done_callback:
+                    gradient_free.set_parameter_values(params_dict, candidates[best])
+                    with torch.no_grad():
+                        render, _ = self.out_node.render(width, height, retain_graph=True, context=context)
+                    self._iteration_done({'iter': i, 'loss': loss_hist[i], 'loss_hist': loss_hist[:i + 1], 'params': candidates[best],
+                                          'iter_time': time.time() - start, 'render': render, 'render_size': (width, height),
+                                          'num_candidates': len(active)})
+
+                i += 1
+                if loss_hist[i - 1] <= self.settings.early_stopping_thresh:
+                    break
+                if len(active) > 1:
+                    active = active[np.sort(np.argsort(min_losses[active], kind="stable")[:len(active) // 2])]
+        finally:
+            if pool is not None:
+                pool.close()
+
+        # The runs of the candidates in this process saved their own starting values, save the values from before the search again
+        gradient_free.set_parameter_values(params_dict, saved_values)
+        for _, p in params_dict.items():
+            p.save_value()
+
+        best = int(np.argmin(min_losses))
+        min_params = candidates[best] if i > 0 else {}
+        gradient_free.set_parameter_values(params_dict, min_params)
+        return params_dict, loss_hist[0:i], {"min_loss": min_losses[best], "min_params": min_params, "candidate_losses": min_losses}
+
+    @staticmethod
+    def _sample_starts(p: Parameter, num_starts: int, centered: bool = False) -> torch.Tensor:
+        """Returns a Tensor of shape [num_starts, *p.shape()] with the current value of 'p' followed by random values within its limits."""
+        values = [p.tensor().detach().clone()]
+        for _ in range(num_starts - 1):
+            value = p.get_centered_random_value() if centered else p.get_random_value()
+            values.append(torch.tensor(value, dtype=torch.float32).reshape(p.shape()))
+
+        return torch.stack(values)
+
+
+def _prune_batch(optimizer: torch.optim.Optimizer, batch: typing.Dict[str, torch.Tensor], keep: torch.Tensor) -> typing.Dict[str, torch.Tensor]:
+    """Keeps the starting points at the indices 'keep' of all batched Tensors, and replaces them in the optimizer together with their state."""
+    pruned = {}
+    for group in optimizer.param_groups:
+        for j, t in enumerate(group['params']):
+            new_t = t.detach()[keep].clone().requires_grad_()
+            state = optimizer.state.pop(t, {})
+            optimizer.state[new_t] = {key: v[keep].clone() if torch.is_tensor(v) and v.dim() > 0 and v.shape[0] == t.shape[0] else v
+                                      for key, v in state.items()}
+            group['params'][j] = new_t
+            pruned.update({k: new_t for k, old in batch.items() if old is t})
+
+    return pruned
+
+
+def discrete_assignments(params: typing.Dict[str, Parameter], max_candidates: int, seed: int = None) -> typing.List[typing.Dict[str, np.ndarray]]:
+    """
+    Returns up to 'max_candidates' assignments of integer values within the limits of a dictionary of Parameters, as dictionaries of modified
+    argument names mapped to values. All assignments are returned if there are few enough, otherwise they are sampled at random without
+    replacement. The rounded current values are always the first assignment.
+    """
+    shapes = [tuple(p.shape()) for p in params.values()]
+    sizes = [int(np.prod(s)) for s in shapes]
+    choices = [np.arange(math.ceil(p.get_min()), math.floor(p.get_max()) + 1) for p, size in zip(params.values(), sizes) for _ in range(size)]
+    current = tuple(np.clip(np.round(np.concatenate([np.ravel(p.get_value()) for p in params.values()])),
+                            [c[0] for c in choices], [c[-1] for c in choices]))
+
+    if np.prod([float(len(c)) for c in choices]) <= max_candidates:
+        assignments = [current] + [a for a in itertools.product(*choices) if a != current]
+    else:
+        rng = np.random.RandomState(seed)
+        assignments = [current]
+        found = {current}
+        while len(assignments) < max_candidates:
+            a = tuple(rng.choice(c) for c in choices)
+            if a not in found:
+                found.add(a)
+                assignments.append(a)
+
+    def to_values(a: tuple) -> typing.Dict[str, np.ndarray]:
+        splits = np.split(np.array(a, dtype=np.float32), np.cumsum(sizes)[:-1])
+        return {k: v.reshape(shape) for k, v, shape in zip(params, splits, shapes)}
+
+    return [to_values(a) for a in assignments[:max_candidates]]
+
+
+def _optimize_candidate(out_node: ShaderNode, params_dict: typing.Dict[str, Parameter], target: torch.Tensor, settings: GradientDescentSettings,
+                        values: dict, continuous: typing.List[str], iterations: int) -> typing.Tuple[float, dict]:
+    """Sets the values of a candidate and optimizes its continuous parameters by gradient descent for a number of iterations. Returns the
+    lowest loss and the values that gave it."""
+    gradient_free.set_parameter_values(params_dict, values)
+    if not continuous:  # Nothing to optimize, only the loss of the assignment is needed
+        with torch.no_grad():
+            render, _ = out_node.render(settings.render_width, settings.render_height, retain_graph=True)
+            return float(settings.loss_func(**settings.loss_args)(render, target)), values
+
+    round_settings = copy.copy(settings)
+    round_settings.max_iter = iterations
+    round_settings.discrete_candidates = 0
+    round_settings.num_starts = 1
+    round_settings.pyramid_levels = 1
+    round_settings.checkpoint_path = ""  # Rounds are short and would all write to the same file
+    round_settings.resume = False
+
+    matching = TextureMatching(target, out_node, round_settings)
+    matching.set_active_parameters({k: params_dict[k] for k in continuous})
+    _, _, info = matching.run()
+    min_params = info["min_params"] if info["min_params"] else {k: params_dict[k].get_value() for k in continuous}
+    return float(info["min_loss"]), {**values, **min_params}
+
+
+class _CandidatePool:
+    """
+    Optimizes candidates of the discrete search in parallel in a pool of worker processes, each with its own copy of the material. Values are
+    sent to the workers with the node ids and labels of their sockets as keys, see gradient_free.socket_keys().
+    """
+
+    def __init__(self, out_node: ShaderNode, target: torch.Tensor, settings: GradientDescentSettings, workers: int):
+        self._keys = gradient_free.socket_keys(out_node)
+        self._mod_args = {key: k for k, key in self._keys.items()}
+
+        self._directory = gradient_free.save_worker_files(out_node, target)
+        self._settings = settings
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def optimize(self, candidates: typing.List[dict], continuous: typing.List[str], iterations: int) -> typing.List[typing.Tuple[float, dict]]:
+        continuous = [self._keys[k] for k in continuous]
+        futures = [self._executor.submit(_optimize_in_worker, self._directory, self._settings,
+                                         {self._keys[k]: v for k, v in values.items()}, continuous, iterations)
+                   for values in candidates]
+        results = [f.result() for f in futures]
+        return [(loss, {self._mod_args[key]: v for key, v in values.items()}) for loss, values in results]
+
+    def close(self):
+        self._executor.shutdown()
+        shutil.rmtree(self._directory)
+
+
+def _setup_candidates(out_node: ShaderNode, target: torch.Tensor, settings: GradientDescentSettings) -> dict:
+    _, params_dict = out_node.render(settings.render_width, settings.render_height, retain_graph=False)
+    keys = gradient_free.socket_keys(out_node)
+    return {"out_node": out_node, "params": {keys[k]: p for k, p in params_dict.items()}, "target": target}
+
+
+def _optimize_in_worker(directory: str, settings: GradientDescentSettings, values: dict, continuous: list,
+                        iterations: int) -> typing.Tuple[float, dict]:
+    state = gradient_free.worker_state(directory, functools.partial(_setup_candidates, settings=settings))
+    return _optimize_candidate(state["out_node"], state["params"], state["target"], settings, values, continuous, iterations)
+
+
+def save_hdf5(filename: str, settings: GradientDescentSettings, loss_hist: np.ndarray, attrs: dict = None, checkpoint: dict = None):
+    """
+    Saves settings and a loss history to an .hdf5 file, that the settings can be loaded from with GradientDescentSettings.load_from_hdf5().
+    The file is written to a temporary file that then replaces 'filename', so that a crash while writing never leaves a corrupt file behind.
+
+    :param attrs: extra attributes to save together with the settings
+    :param checkpoint: a dictionary of the number of iterations done ("iteration"), the minimum loss ("min_loss"), the current and best
+        parameter values ("params" and "min_params") and a picklable state to resume from ("state"), see load_checkpoint()
+    """
+    tmp_filename = filename + ".tmp"
+    with h5py.File(tmp_filename, "w") as f:
+        dset = f.create_dataset("data", data=loss_hist, dtype="f")
+        for key, value in settings.to_dict().items():
+            if key in RUN_OPTIONS:
+                continue
+            try:
+                dset.attrs[key] = value
+            except TypeError:
+                dset.attrs[key] = str(value)
+        for key, value in (attrs or {}).items():
+            dset.attrs[key] = value
+
+        if checkpoint is not None:
+            group = f.create_group(CHECKPOINT_GROUP)
+            group.attrs["iteration"] = checkpoint["iteration"]
+            group.attrs["min_loss"] = checkpoint["min_loss"]
+            for name in ["params", "min_params"]:
+                values = group.create_group(name)
+                for k, v in checkpoint[name].items():
+                    values.create_dataset(k, data=np.asarray(v))
+            group.create_dataset("state", data=np.frombuffer(pickle.dumps(checkpoint["state"]), dtype=np.uint8))
+
+    os.replace(tmp_filename, filename)
+
+
+def load_checkpoint(filename: str) -> typing.Union[dict, None]:
+    """Returns the checkpoint saved by save_hdf5() to an .hdf5 file, together with the saved loss history ("loss_hist"), or None if the file has
+    no checkpoint."""
+    with h5py.File(filename, "r") as f:
+        if CHECKPOINT_GROUP not in f:
+            return None
+
+        group = f[CHECKPOINT_GROUP]
+        return {
+            "iteration": int(group.attrs["iteration"]),
+            "min_loss": np.float32(group.attrs["min_loss"]),
+            "params": {k: v[()] for k, v in group["params"].items()},
+            "min_params": {k: v[()] for k, v in group["min_params"].items()},
+            "state": pickle.loads(group["state"][()].tobytes()),
+            "loss_hist": f["data"][()],
+        }
+
+
+def set_socket_values(out_node: ShaderNode, values: typing.Dict[str, typing.Any]):
+    """Sets the values of the unconnected input sockets of the node graph ending in 'out_node', given a dictionary of modified argument names
+    mapped to values, such as the "min_params" returned by TextureMatching.run()."""
+    sockets = out_node.get_render_plan().get_leaf_sockets()
+    for mod_arg, value in values.items():
+        sockets[mod_arg].set_value(torch.as_tensor(value, dtype=torch.float32))
+
+
+def match_texture(material_path: str, target_path: str, settings: GradientDescentSettings,
+                  iteration_done_callback: typing.Callable[[dict], None] = None) -> typing.Tuple[ShaderNode, dict]:
+    """
+    Loads a material saved by the node editor and matches it against a target image.
+
+    :return: a tuple of the output node of the loaded material, with its sockets set to the best parameters found, and a dictionary of results
+    """
+    out_node, _ = material_serializer.load_material(material_path)
+    target = PILImage.open(target_path)
+
+    start = time.time()
+    matching = TextureMatching(target, out_node, settings, iteration_done_callback)
+    params, loss_hist, info = matching.run()
+    run_time = time.time() - start
+
+    min_params = info["min_params"] if info["min_params"] else {k: p.get_value() for k, p in params.items()}
+    set_socket_values(out_node, min_params)
+
+    result = {
+        "material": material_path,
+        "target": target_path,
+        "loss_func": settings.loss_func.__name__,
+        "loss_args": settings.loss_args,
+        "optimizer": settings.optimizer.__name__,
+        "optimizer_args": settings.optimizer_args,
+        "render_size": (settings.render_width, settings.render_height),
+        "iterations": len(loss_hist),
+        "time": run_time,
+        "min_loss": float(info["min_loss"]),
+        "min_params": {k: np.asarray(v).tolist() for k, v in min_params.items()},
+        "loss_hist": np.asarray(loss_hist).tolist(),
+    }
+    return out_node, result
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    """Adds the command line options that are read by settings_from_args() to a parser."""
+    parser.add_argument("--settings", help="path to a .hdf5 file saved by the texture matcher to load settings from. Other options override it")
+    parser.add_argument("--loss", choices=list(LOSS_FUNCTIONS), help="loss function (default: XSELoss)")
+    parser.add_argument("--loss-args", type=json.loads, help="keyword arguments of the loss function as a JSON object")
+    parser.add_argument("--optimizer", choices=list(OPTIMIZERS), help="optimizer (default: Adam)")
+    parser.add_argument("--optimizer-args", type=json.loads, help="keyword arguments of the optimizer as a JSON object, e.g. '{\"lr\": 0.01}'")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), help="render size")
+    parser.add_argument("--max-iter", type=int, help="maximum number of iterations")
+    parser.add_argument("--early-stopping-thresh", type=float, help="stop when the loss is below this value")
+    parser.add_argument("--num-starts", type=int, help="number of starting points to optimize at the same time")
+    parser.add_argument("--centered-starts", action="store_true", help="sample starting points around the default values")
+    parser.add_argument("--halving-interval", type=int, help="iterations between discarding the worst half of the starting points")
+    parser.add_argument("--pyramid-levels", type=int, help="number of resolutions to optimize at, starting at the lowest")
+    parser.add_argument("--evaluation-workers", type=int, help="number of worker processes evaluating candidates of gradient-free optimizers "
+                                                                "or of the discrete search")
+    parser.add_argument("--discrete-candidates", type=int, help="maximum number of assignments of integer inputs to search over")
+    parser.add_argument("--checkpoint", help="path to an .hdf5 file to write checkpoints of gradient descent to")
+    parser.add_argument("--checkpoint-interval", type=int, help="iterations between checkpoints")
+    parser.add_argument("--resume", help="path to a checkpoint to resume from. Settings are loaded from it and other options override them")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the loss of every iteration")
+
+
+def _parse_args(argv: typing.List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Estimate the parameters of a procedural material so that it matches a target texture.")
+    parser.add_argument("material", help="path to a material .json file saved by the node editor")
+    parser.add_argument("target", help="path to the target image")
+    parser.add_argument("-o", "--output", help="path to write the results to as JSON. Written to stdout if not given")
+    parser.add_argument("--save-material", help="path to save the material with the best parameters found to")
+    add_settings_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def settings_from_args(args: argparse.Namespace) -> GradientDescentSettings:
+    settings = GradientDescentSettings()
+    if args.resume:
+        settings.load_from_hdf5(h5py.File(args.resume, "r"))
+        settings.checkpoint_path = args.resume
+        settings.resume = True
+    elif args.settings:
+        settings.load_from_hdf5(h5py.File(args.settings, "r"))
+
+    if args.loss:
+        settings.loss_func = LOSS_FUNCTIONS[args.loss]
+    elif settings.loss_func is None:
+        settings.loss_func = losses.XSELoss
+    if args.loss_args is not None:
+        settings.loss_args = args.loss_args
+    if args.optimizer:
+        settings.optimizer = OPTIMIZERS[args.optimizer]
+    elif settings.optimizer is None:
+        settings.optimizer = optim.Adam
+    if args.optimizer_args is not None:
+        settings.optimizer_args = args.optimizer_args
+    if args.size:
+        settings.render_width, settings.render_height = args.size
+    if args.max_iter is not None:
+        settings.max_iter = args.max_iter
+    if args.early_stopping_thresh is not None:
+        settings.early_stopping_thresh = args.early_stopping_thresh
+    if args.num_starts is not None:
+        settings.num_starts = args.num_starts
+    if args.centered_starts:
+        settings.centered_starts = True
+    if args.halving_interval is not None:
+        settings.halving_interval = args.halving_interval
+    if args.pyramid_levels is not None:
+        settings.pyramid_levels = args.pyramid_levels
+    if args.evaluation_workers is not None:
+        settings.evaluation_workers = args.evaluation_workers
+    if args.discrete_candidates is not None:
+        settings.discrete_candidates = args.discrete_candidates
+    if args.checkpoint:
+        settings.checkpoint_path = args.checkpoint
+    if args.checkpoint_interval is not None:
+        settings.checkpoint_interval = args.checkpoint_interval
+
+    return settings
+
+
+def main(argv: typing.List[str] = None):
+    args = _parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    settings = settings_from_args(args)
+
+    def log_iteration(props: dict):
+        _logger.debug("{}. loss: {:.6f} ({:.3f}s)".format(props['iter'], float(props['loss']), props['iter_time']))
+
+    out_node, result = match_texture(args.material, args.target, settings, log_iteration)
+    _logger.info("Matching finished after {} iterations with a minimum loss of {:.6f}.".format(result["iterations"], result["min_loss"]))
+
+    if args.save_material:
+        material_serializer.save_material(out_node, args.save_material)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, cls=material_serializer.Serializer)
+    else:
+        print(json.dumps(result, cls=material_serializer.Serializer))
+
+
+if __name__ == "__main__":
+    main()
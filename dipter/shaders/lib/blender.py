@@ -6,8 +6,8 @@ from dipter.shaders.shader_super import TINY_FLOAT
 
 def calc_brick_texture(p, mortar_size, mortar_smooth, bias, brick_width, row_height, offset_amount, offset_frequency, squash_amount,
                        squash_frequency):
-    p_x = p[:, :, 0].unsqueeze(-1)
-    p_y = p[:, :, 1].unsqueeze(-1)
+    p_x = p[..., 0:1]
+    p_y = p[..., 1:2]
 
     rownum = torch.floor(p_y / (row_height + TINY_FLOAT))
 
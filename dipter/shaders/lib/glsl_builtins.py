@@ -40,4 +40,4 @@ def mod(x: Tensor, y: ty.Union[float, Tensor]) -> Tensor:
 
 def dot(x: Tensor, y: Tensor) -> Tensor:
     """dot returns the dot product of two vectors, x and y. i.e., x[0]⋅y[0]+x[1]⋅y[1]+..."""
-    return torch.einsum("abc, abc -> ab", x, y).unsqueeze(-1)
+    return torch.sum(x * y, dim=-1, keepdim=True)
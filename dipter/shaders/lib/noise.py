@@ -9,7 +9,7 @@ def simpleSmoothstep(p: Tensor) -> Tensor:
 
 
 def random(p: Tensor) -> Tensor:
-    return random_float(p[:, :, 0] * 103. + p[:, :, 1] * 85.62)
+    return random_float(p[..., 0] * 103. + p[..., 1] * 85.62)
 
 
 def random_float(p: Tensor) -> Tensor:
@@ -17,21 +17,19 @@ def random_float(p: Tensor) -> Tensor:
 
 
 def smoothNoise2D(p: Tensor) -> Tensor:
-    w = p.shape[0]
-    h = p.shape[1]
     local_uv = simpleSmoothstep(gl.fract(p))
     local_id = torch.floor(p)
 
     # Find the noise value at the four corners of a local box
     bl = random(local_id)
-    br = random(local_id + torch.tensor((1, 0)).repeat(w, h, 1))
-    tl = random(local_id + torch.tensor((0, 1)).repeat(w, h, 1))
-    tr = random(local_id + torch.tensor((1, 1)).repeat(w, h, 1))
+    br = random(local_id + torch.tensor((1., 0.)))
+    tl = random(local_id + torch.tensor((0., 1.)))
+    tr = random(local_id + torch.tensor((1., 1.)))
 
     # Interpolate between bottom, top, and bottom -> top
-    b = gl.mix(bl, br, local_uv[:, :, 0])
-    t = gl.mix(tl, tr, local_uv[:, :, 0])
-    return gl.mix(b, t, local_uv[:, :, 1]).unsqueeze(-1)
+    b = gl.mix(bl, br, local_uv[..., 0])
+    t = gl.mix(tl, tr, local_uv[..., 0])
+    return gl.mix(b, t, local_uv[..., 1]).unsqueeze(-1)
 
 
 def fractalBrownianMotion(p: Tensor, detail: Tensor) -> Tensor:
@@ -42,11 +40,9 @@ def fractalBrownianMotion(p: Tensor, detail: Tensor) -> Tensor:
     :param detail: Integer 2D tensor dictating the number of octaves to add
     :return: A pseudo-random 2D noise Tensor
     """
-    w, h = p.shape[0], p.shape[1]
-
     # Initial values
-    value = torch.tensor((0.0)).repeat(w, h, 1)
-    amplitude = torch.tensor((0.5)).repeat(w, h, 1)
+    value = torch.zeros_like(p[..., 0:1])
+    amplitude = 0.5
 
     # Loop and add octaves of more and more detailed noise
     i = 0
@@ -2,6 +2,7 @@ import torch
 from torch import Tensor
 
 import dipter.shaders.lib.glsl_builtins as gl
+from dipter.shaders.lib import vec
 
 
 def box(coord: Tensor, size: Tensor) -> Tensor:
@@ -9,13 +10,13 @@ def box(coord: Tensor, size: Tensor) -> Tensor:
     size = 0.5 - size * 0.5
     uv = gl.smoothstep(size, size + edge_smooth, coord)
     uv = uv * gl.smoothstep(size, size + edge_smooth, 1.0 - coord)
-    return (uv[:,:,0] * uv[:,:,1]).unsqueeze(-1)
+    return (uv[..., 0] * uv[..., 1]).unsqueeze(-1)
 
 
 def tile(coord: Tensor, scale: Tensor, shift: Tensor):
     tiled = coord * scale
 
-    st = gl.step(1.0, torch.fmod(tiled[:, :, 0:2], 2.0))
-    shifted_xy = tiled[:, :, 0:2] + shift * st.flip(-1)
+    st = gl.step(1.0, torch.fmod(tiled[..., 0:2], 2.0))
+    shifted_xy = tiled[..., 0:2] + shift * st.flip(-1)
 
-    return gl.fract(torch.cat((shifted_xy, tiled[:,:,-1].unsqueeze(-1)), dim=2))
+    return gl.fract(vec.cat(shifted_xy, tiled[..., -1:]))
@@ -1,31 +1,47 @@
 import numbers
+import typing
 
 import torch
 from torch import Tensor
 
+from dipter.misc import render_funcs
 from dipter.shaders.shader_super import Shader
 
 
+def _broadcast_shape(*shapes) -> typing.List[int]:
+    """Returns the shape that all given shapes broadcast to."""
+    n_dims = max(len(shape) for shape in shapes)
+    out = [1] * n_dims
+    for shape in shapes:
+        for i, d in enumerate(shape, start=n_dims - len(shape)):
+            if d != 1:
+                out[i] = d
+
+    return out
+
+
 def cat(*args) -> Tensor:
-    return torch.cat(args, dim=2)
+    """Concatenates Tensors along the last (channel) dimension. All other dimensions, like an optional leading batch dimension, are broadcast."""
+    shape = _broadcast_shape(*[t.shape[:-1] for t in args])
+    return torch.cat([t.expand(*shape, t.shape[-1]) for t in args], dim=-1)
 
 
 # ---- Single element retrieval functions ----
 
 def x(t: Tensor) -> Tensor:
-    return t[:, :, 0].unsqueeze(-1)
+    return t[..., 0:1]
 
 
 def y(t: Tensor) -> Tensor:
-    return t[:, :, 1].unsqueeze(-1)
+    return t[..., 1:2]
 
 
 def z(t: Tensor) -> Tensor:
-    return t[:, :, 2].unsqueeze(-1)
+    return t[..., 2:3]
 
 
 def w(t: Tensor) -> Tensor:
-    return t[:, :, 3].unsqueeze(-1)
+    return t[..., 3:4]
 
 
 # ---- Double element retrieval functions ----
@@ -35,7 +51,7 @@ def xx(t: Tensor) -> Tensor:
 
 
 def xy(t: Tensor) -> Tensor:
-    return t[:, :, 0:2]
+    return t[..., 0:2]
 
 
 def yy(t: Tensor) -> Tensor:
@@ -43,7 +59,7 @@ def yy(t: Tensor) -> Tensor:
 
 
 def yz(t: Tensor) -> Tensor:
-    return t[:, :, 1:3]
+    return t[..., 1:3]
 
 
 def zz(t: Tensor) -> Tensor:
@@ -51,7 +67,7 @@ def zz(t: Tensor) -> Tensor:
 
 
 def zw(t: Tensor) -> Tensor:
-    return t[:, :, 2:4]
+    return t[..., 2:4]
 
 
 # ---- Triple element retrieval functions ----
@@ -75,12 +91,11 @@ def zzzz(t: Tensor) -> Tensor:
 
 
 def rep(val) -> Tensor:
-    """Repeats the input value to create a matrix Tensor of correct render size."""
-    size = [*Shader.frag_pos().shape[0:2], 1]
+    """Creates a Tensor of shape [1, 1, C] from the input value, that broadcasts against matrices of the render size."""
     if isinstance(val, numbers.Number):
-        return torch.full(size, val, dtype=torch.float32, device=Shader.frag_pos().device)
+        return render_funcs.get_constant((float(val),), 1, 1, Shader.frag_pos().device)
     elif isinstance(val, Tensor):
-        return val.repeat(*Shader.render_size(), 1)
+        return val.reshape(1, 1, -1)
 
     raise ValueError("Incorrect Shape or type of arguments!")
 
@@ -98,12 +113,12 @@ def vec4(*args) -> Tensor:
 def _vecn(*args, n: int):
     n_args = len(args)
     frag_pos = Shader.frag_pos()
-    if all([isinstance(el, numbers.Number) for el in args]):  # Only numbers are given, create Tensor and repeat
-        reps = 1 if n_args == n else n
-        return torch.tensor(args, dtype=torch.float32, device=frag_pos.device).repeat(*Shader.render_size(), reps)
+    if all([isinstance(el, numbers.Number) for el in args]):  # Only numbers are given, get a cached constant Tensor that broadcasts
+        values = tuple(float(el) for el in args) * (1 if n_args == n else n)
+        return render_funcs.get_constant(values, 1, 1, frag_pos.device)
     elif all([isinstance(el, Tensor)] for el in args):  # Only Tensors are given, concatenate them
         if n_args == 1:
-            return args[0].repeat(1, 1, n)
+            return torch.cat([args[0]] * n, dim=-1)
         else:
             return cat(*args)
     else:
@@ -1,5 +1,6 @@
 import logging
 import re
+import threading
 import time
 import typing
 from boltons.setutils import IndexedSet
@@ -36,6 +37,31 @@ def is_empty(s: str):
     return len(s.strip()) <= 0
 
 
+# Process wide cache of GLSL source files: path -> (modification time, lines)
+_source_cache = {}
+_source_cache_lock = threading.Lock()
+
+
+def read_source_lines(path: typing.Union[str, Path]) -> typing.List[str]:
+    """
+    Returns the lines of a source file. Files are cached, and are only read from disk again if their modification time has changed.
+
+    :param path: path to the source file
+    :return: a copy of the cached lines, that the caller is free to modify
+    """
+    path = Path(path)
+    mtime = path.stat().st_mtime
+
+    with _source_cache_lock:
+        entry = _source_cache.get(path)
+        if entry is None or entry[0] != mtime:
+            with open(path, 'r') as f:
+                entry = (mtime, f.readlines())
+            _source_cache[path] = entry
+
+    return entry[1].copy()
+
+
 def preprocess_imports(code: typing.List[str]) -> str:
     for i, line in enumerate(code):
         match = REG_GLSL_IMPORT.match(line)
@@ -48,9 +74,7 @@ def preprocess_imports(code: typing.List[str]) -> str:
 
 def get_import_code(import_file: str) -> str:
     lib_path = Path.cwd() / GLSL_IMPORT_DIR
-    with open(lib_path / import_file, 'r') as f:
-        libfile = f.read()
-        return libfile
+    return "".join(read_source_lines(lib_path / import_file))
 
 
 def generate_comment_line(comment: str):
@@ -68,6 +92,9 @@ class GLSLCode:
     def __init__(self, code: typing.List[str], filename: str, primary_function: str):
         self.code = code
         self._generated_code = []
+        self._generated_source = None
+        self._fragments = None
+        self._signature = None
         self._node_num = -1
         self._reset = False
         self.filename = filename
@@ -177,6 +204,9 @@ class GLSLCode:
         """
         self._node_num = node_num
         self._generated_code = []
+        self._generated_source = None
+        self._fragments = None
+        self._signature = None
         self.connected_code = set()
         self._uniforms = []
         for func in self.functions:
@@ -187,6 +217,13 @@ class GLSLCode:
     def get_node_num(self) -> int:
         return self._node_num
 
+    def get_signature(self) -> typing.Union[tuple, None]:
+        """Returns the signature of the node graph that this code was last connected to, or None if it has been reset since."""
+        return self._signature
+
+    def set_signature(self, signature: tuple):
+        self._signature = signature
+
     def get_primary_function(self) -> 'GLSLFunction':
         return self.primary_function
 
@@ -215,6 +252,9 @@ class GLSLCode:
         return self._uniforms
 
     def generate_code(self) -> str:
+        if not self._reset and self._generated_source is not None:  # Nothing has been connected or reset since the code was last generated
+            return self._generated_source
+
         if not self._reset:
             _logger.error("generate_code() called before the code has been reset. Call reset() first.")
             return ""
@@ -234,37 +274,55 @@ class GLSLCode:
         # Step 3, handle imports
         all_imports = IndexedSet([im for n in self.connected_code for im in n.imports])  # Convert to set to remove double imports
         for import_file in all_imports:
-            print("Import File: {}".format(import_file))
+            _logger.debug("Import File: {}".format(import_file))
             libcode = generate_comment_line(import_file) + "\n" + get_import_code(import_file)
             self._generated_code.append(libcode + "\n")
 
         # Step 4, import code from connected nodes
-        var_declarations = []
-        function_calls = []
-        added_function_defs = []
-        _add_calls(self, var_declarations, function_calls, added_function_defs, self._generated_code)
+        function_defs, var_declarations, function_calls = _get_fragments(self)
+        added_function_defs = set()
+        for func_name, func_code in function_defs:
+            if func_name not in added_function_defs:  # We don't want to add duplicate function definitions
+                self._generated_code.append(func_code)
+                added_function_defs.add(func_name)
+
+        var_declarations = list(var_declarations)
+        function_calls = list(function_calls)
 
         # Step 5, generate calls to connected functions in own primary function
         self.primary_function.add_calls(function_calls, var_declarations)
         primary_code = "".join(self.primary_function.generated_code)
         self._generated_code.append(primary_code)
         self._reset = False
-        return "".join(self._generated_code)
+        self._generated_source = "".join(self._generated_code)
+        return self._generated_source
 
 
-def _add_calls(code: 'GLSLCode', declarations: list, calls: list, added_function_defs: list, generated_code: list):
+def _get_fragments(code: 'GLSLCode') -> typing.Tuple[list, list, list]:
+    """
+    Returns the code fragments that are needed to call the functions connected to the primary function of 'code': a list of
+    (function name, function definition) for all connected functions, and lists of variable declarations and function calls. The fragments of
+    each code are cached until it is reset, so unchanged subgraphs are not generated again. The returned lists must not be modified.
+    """
+    if code._fragments is not None:
+        return code._fragments
+
+    function_defs = []
+    declarations = []
+    calls = []
+
     for arg in code.primary_function.arguments:
         if arg.is_connected() and arg.name != "frag_pos" and not arg.is_output():
             connected_code = arg.get_connected_func().get_parent_code()
             for needed_func in connected_code.functions:
                 comment = generate_comment_line("{}.{}".format(connected_code.shader_name, needed_func.function_name))
+                func_code = "\n" + comment + "\n" + "".join(needed_func.generated_code)
+                function_defs.append((needed_func.modified_function_name, func_code + "\n"))
 
-                if needed_func.modified_function_name not in added_function_defs:  # We don't want to add duplicate function definitions
-                    func_code = "\n" + comment + "\n" + "".join(needed_func.generated_code)
-                    generated_code.append(func_code + "\n")
-                    added_function_defs.append(needed_func.modified_function_name)
-
-            _add_calls(connected_code, declarations, calls, added_function_defs, generated_code)
+            sub_defs, sub_declarations, sub_calls = _get_fragments(connected_code)
+            function_defs.extend(sub_defs)
+            declarations.extend(sub_declarations)
+            calls.extend(sub_calls)
 
             # Step 4.1, generate calls to connected functions
             prim_function = connected_code.primary_function
@@ -272,6 +330,9 @@ def _add_calls(code: 'GLSLCode', declarations: list, calls: list, added_function
             declarations.extend(var_declars)
             calls.extend(func_calls)
 
+    code._fragments = (function_defs, declarations, calls)
+    return code._fragments
+
 
 class GLSLFunction:
 
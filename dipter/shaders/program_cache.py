@@ -0,0 +1,90 @@
+import hashlib
+import logging
+import threading
+import typing
+from collections import OrderedDict
+
+from glumpy import gloo
+
+_logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+
+    def __init__(self, vertex_code: str, fragment_code: str, version: str):
+        self.vertex_code = vertex_code
+        self.fragment_code = fragment_code
+        self.version = version
+        self.vertex_shader, self.fragment_shader, self.program = build_program(vertex_code, fragment_code, version)
+
+
+def build_program(vertex_code: str, fragment_code: str, version: str) -> typing.Tuple[gloo.VertexShader, gloo.FragmentShader, gloo.Program]:
+    """Builds a new Program from GLSL source code, without using the cache."""
+    vertex_shader = gloo.VertexShader(vertex_code, version=version)
+    fragment_shader = gloo.FragmentShader(fragment_code, version=version)
+    program = gloo.Program(vertex_shader, fragment_shader, count=0, version=version)
+    return vertex_shader, fragment_shader, program
+
+
+class ProgramCache:
+    """
+    A least recently used cache of compiled Programs, keyed by a hash of their GLSL source code. Programs returned by the cache are shared by
+    everyone that compiled the same source, so uniforms have to be set again before a shared Program is used.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()  # key -> _CacheEntry
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(vertex_code: str, fragment_code: str, version: str) -> str:
+        h = hashlib.sha1()
+        for code in (version, vertex_code, fragment_code):
+            h.update(code.encode("utf-8"))
+            h.update(b"\0")
+
+        return h.hexdigest()
+
+    def get(self, vertex_code: str, fragment_code: str, version: str) -> typing.Tuple[gloo.VertexShader, gloo.FragmentShader, gloo.Program]:
+        """
+        Returns the VertexShader, FragmentShader and Program built from the given source code, building them only if they are not cached.
+
+        :param vertex_code: the full source code of the vertex shader
+        :param fragment_code: the full source code of the fragment shader
+        :param version: the GLSL version to compile for
+        """
+        key = self.key(vertex_code, fragment_code, version)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            else:
+                self.misses += 1
+                entry = _CacheEntry(vertex_code, fragment_code, version)
+                self._entries[key] = entry
+
+                if len(self._entries) > self._maxsize:
+                    self._entries.popitem(last=False)
+
+        return entry.vertex_shader, entry.fragment_shader, entry.program
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return "ProgramCache(size={}/{}, hits={}, misses={})".format(len(self._entries), self._maxsize, self.hits, self.misses)
+
+
+# Process wide cache shared by all shaders
+program_cache = ProgramCache()
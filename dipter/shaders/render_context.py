@@ -0,0 +1,70 @@
+import threading
+import typing
+
+import torch
+from torch import Tensor
+
+from dipter.misc import render_funcs
+
+_local = threading.local()
+
+
+class RenderContext:
+    """
+    Holds the state that is shared by all shaders during a single render: the render size, the fragment coordinate grid and the device to
+    render on. Entering a RenderContext with a 'with' statement makes it the current context of the calling thread, so that renders on
+    different threads never share state.
+    """
+
+    def __init__(self, width: int = 100, height: int = 100, device=render_funcs.device, dtype: torch.dtype = torch.float32):
+        self._device = device
+        self._dtype = dtype
+        self._ren_width = None
+        self._ren_height = None
+        self._frag_pos_matrix = None
+        self.set_render_size(width, height)
+
+    def set_render_size(self, width: int, height: int):
+        # Images are stored column major, so the first dimension of a rendered matrix is the height of the image
+        self._ren_height = int(width)
+        self._ren_width = int(height)
+        self._frag_pos_matrix = render_funcs.get_frag_pos(self._ren_width, self._ren_height, self._device, self._dtype)
+
+    def render_size(self) -> typing.Tuple[int, int]:
+        return self._ren_width, self._ren_height
+
+    def render_width(self) -> int:
+        return self._ren_width
+
+    def render_height(self) -> int:
+        return self._ren_height
+
+    def frag_pos(self) -> Tensor:
+        return self._frag_pos_matrix
+
+    def device(self):
+        return self._device
+
+    def dtype(self) -> torch.dtype:
+        return self._dtype
+
+    def __enter__(self) -> 'RenderContext':
+        _stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        stack = _stack()
+        assert stack and stack[-1] is self, "RenderContexts have to be exited in the reverse order that they were entered!"
+        stack.pop()
+
+
+def _stack() -> typing.List[RenderContext]:
+    if not hasattr(_local, "stack"):
+        _local.stack = [RenderContext()]  # Every thread has its own default context at the bottom of the stack
+
+    return _local.stack
+
+
+def current() -> RenderContext:
+    """Returns the RenderContext that is active on the calling thread."""
+    return _stack()[-1]
@@ -1,3 +1,4 @@
+import copy
 import logging
 import os
 import time
@@ -14,7 +15,9 @@ from dipter.misc import string_funcs, render_funcs
 from dipter.misc.runtime_funcs import get_function_arguments
 from dipter.node_graph.data_type import DataType
 from dipter.node_graph.parameter import Parameter
-from dipter.shaders.parsing.parsing import GLSLCode, preprocess_imports
+from dipter.shaders import render_context
+from dipter.shaders.parsing.parsing import GLSLCode, preprocess_imports, read_source_lines
+from dipter.shaders.program_cache import program_cache, build_program
 from dipter.shaders.shader_io import ShaderOutputParameter, ShaderInputParameter
 
 _logger = logging.getLogger(__name__)
@@ -27,12 +30,14 @@ FLOAT_INTERVAL = (TORCH_FLOAT_FINFO.min, TORCH_FLOAT_FINFO.max)
 # GLSL Shaders Directory
 GLSL_SHADERS_DIR = Path(os.getcwd()) / "res" / "shaders"
 
+# Parsed GLSLCode of each Shader class: shader class -> (source lines, GLSLCode). Instances get their own copy of the parsed code.
+_code_templates = {}
+
 
 def read_glsl_source_file(filename) -> typing.List[str]:
     filepath = GLSL_SHADERS_DIR / filename
     try:
-        with open(filepath, "r") as v:
-            return v.readlines()
+        return read_source_lines(filepath)
     except NotADirectoryError as e:
         _logger.warning("Failed to read GLSL source file at %s", filepath)
         return []
@@ -42,12 +47,46 @@ def read_glsl_source_file(filename) -> typing.List[str]:
         raise IOError("Could not read file at path %s.", filepath)
 
 
-def connect_code(node: 'GShaderNode', code: GLSLCode):
+def graph_signature(node: 'GShaderNode', signatures: dict = None) -> tuple:
+    """
+    Returns a hashable signature of the structure of the node graph ending in 'node'. Two subgraphs with equal signatures generate the same GLSL
+    code.
+    :param node: the last node of the subgraph
+    :param signatures: optional dictionary of already calculated signatures (node -> signature), used when several subgraphs share nodes
+    """
+    if signatures is None:
+        signatures = {}
+
+    if node in signatures:
+        return signatures[node]
+
+    inputs = []
+    for socket in node.get_input_sockets():
+        connected_sockets = socket.get_connected_sockets()
+        if connected_sockets:
+            connected_node = socket.get_connected_nodes()[0]
+            inputs.append((socket.label(), connected_sockets[0].get_index(), graph_signature(connected_node, signatures)))
+
+    signature = (node.get_shader().__class__, node.get_num(), tuple(inputs))
+    signatures[node] = signature
+    return signature
+
+
+def connect_code(node: 'GShaderNode', code: GLSLCode, signatures: dict = None):
     """
-    Recursively connects the other_code to all other connected other_code in the NodeGraph tracked by 'node'.
+    Recursively connects the other_code to all other connected other_code in the NodeGraph tracked by 'node'. Subgraphs whose structure has
+    not changed since they were last connected are left as they are.
     :param node: Node the holds the GLSLCode in 'other_code'
     :param code: The parsed shader code that is held by the Node 'node'
+    :param signatures: See graph_signature()
     """
+    if signatures is None:
+        signatures = {}
+
+    signature = graph_signature(node, signatures)
+    if code.get_signature() == signature:
+        return
+
     code.reset(node.get_num())
     for socket in node.get_input_sockets():
         assert socket.type() == socket.INPUT
@@ -70,17 +109,16 @@ def connect_code(node: 'GShaderNode', code: GLSLCode):
                 connected_arg = shader_output.get_argument()
 
             # Recurse...
-            connect_code(connected_node, connected_code)
+            connect_code(connected_node, connected_code, signatures)
 
             code.connect(socket_arg, connected_code, out_arg=connected_arg)
 
+    code.set_signature(signature)
+
 
 class Shader:
     FRAGMENT_SHADER_FUNCTION = None
     FRAGMENT_SHADER_FILENAME = None
-    _ren_width = 100
-    _ren_height = 100
-    _frag_pos_matrix = torch.empty((_ren_width, _ren_height))
 
     def __init__(self):
         self.code = None
@@ -99,7 +137,13 @@ class Shader:
         except Exception as e:
             _logger.warning("Failed to parse GLSL source file due to an error reading the file: %s", str(e))
 
-        self._parsed_code = GLSLCode(self.code, self.FRAGMENT_SHADER_FILENAME, self.FRAGMENT_SHADER_FUNCTION)
+        cls = self.__class__
+        template = _code_templates.get(cls)
+        if template is None or template[0] != self.code:  # Only parse if the source has changed since the last instance was created
+            template = (self.code, GLSLCode(self.code.copy(), self.FRAGMENT_SHADER_FILENAME, self.FRAGMENT_SHADER_FUNCTION))
+            _code_templates[cls] = template
+
+        self._parsed_code = copy.deepcopy(template[1])
 
     def get_parsed_code(self) -> GLSLCode:
         return self._parsed_code
@@ -113,25 +157,24 @@ class Shader:
 
     @classmethod
     def set_render_size(cls, width: int, height: int):
-        Shader._ren_height = np.int32(width)
-        Shader._ren_width = np.int32(height)
-        Shader._frag_pos_matrix = render_funcs.generate_frag_pos(Shader.render_width(), Shader.render_height())
+        """Sets the render size of the current RenderContext of the calling thread."""
+        render_context.current().set_render_size(width, height)
 
     @classmethod
     def render_size(cls) -> typing.Tuple[int, int]:
-        return Shader._ren_width, Shader._ren_height
+        return render_context.current().render_size()
 
     @classmethod
     def render_width(cls):
-        return Shader._ren_width
+        return render_context.current().render_width()
 
     @classmethod
     def render_height(cls):
-        return Shader._ren_height
+        return render_context.current().render_height()
 
     @classmethod
     def frag_pos(cls):
-        return Shader._frag_pos_matrix
+        return render_context.current().frag_pos()
 
     @abstractmethod
     def get_inputs(self) -> typing.List[ShaderInputParameter]:
@@ -143,17 +186,26 @@ class Shader:
             ShaderOutputParameter("Color", DataType.Vec3_RGB)
         ]
 
-    def shade(self, args: typing.Dict[str, Parameter]) -> Tensor:
-        """Convenience function that converts all connectable arguments to matrix form before returning the rendered image."""
+    def shade(self, args: typing.Dict[str, typing.Union[Parameter, Tensor]]) -> Tensor:
+        """Convenience function that converts all connectable arguments to a form that broadcasts against the render matrices before returning
+        the rendered image. Unconnected arguments are passed as [1, 1, C] views instead of being repeated to the full render size. Arguments that
+        are connected to the output of another shader can be given as plain Tensors. Arguments may have a leading batch dimension of size N,
+        either as parameters of shape [N, 1, 1, C] or as matrices of shape [N, W, H, C], in which case N images are rendered at once."""
         width, height = Shader.render_width(), Shader.render_height()
         mat_args = dict()
 
         for key_arg, param in args.items():
-            t = param.tensor()
-            if (len(t.shape) == 3 and t.shape[0] == width and t.shape[1] == height) or param.is_scalar():
-                mat_args[key_arg] = t.float()
+            if isinstance(param, Parameter):
+                t = param.tensor()
+                is_scalar = param.is_scalar()
+            else:
+                t = param
+                is_scalar = False
+
+            if is_scalar or t.dim() == 4 or (t.dim() == 3 and t.shape[0] in (1, width) and t.shape[1] in (1, height)):
+                mat_args[key_arg] = t.float()  # Already broadcastable against the (optionally batched) render matrices
             else:
-                mat_args[key_arg] = t.repeat(width, height, 1).float()
+                mat_args[key_arg] = t.reshape(1, 1, -1).float()
 
         return self.shade_mat(**mat_args)
 
@@ -166,9 +218,9 @@ class Shader:
         return " ".join(string_funcs.split_on_upper_case(type(self).__name__))
 
     def tensor(self, data) -> Tensor:
-        """Creates a matrix tensor of a shape that matches the rendering size from data. This is shorthand to creating tensors in the shade
-        function."""
-        return torch.tensor(data, dtype=torch.float32).repeat(*Shader.render_size(), 1)
+        """Creates a tensor of shape [1, 1, C] from data, that broadcasts against matrices of the rendering size. This is shorthand to creating
+        tensors in the shade function."""
+        return torch.tensor(data, dtype=torch.float32, device=Shader.frag_pos().device).reshape(1, 1, -1)
 
 
 class FunctionShader(Shader, ABC):
@@ -216,34 +268,47 @@ class CompilableShader(Shader, ABC):
         self._program = None
         self._vertex_shader = None
         self._fragment_shader = None
+        self._vertex_code = None
+        self._fragment_code = None
         self._glsl_version = "430"
 
         self._set_program()
 
-    def compile_vertex_shader(self) -> gloo.VertexShader:
-        """Compiles the vertex shader other_code associated with this shader and returns it in a glumpy VertexShader object."""
-        vertex_code = preprocess_imports(read_glsl_source_file(self.VERTEX_SHADER_FILENAME))
-        return gloo.VertexShader(vertex_code, version=self._glsl_version)
+    def generate_vertex_code(self) -> str:
+        """Returns the full source code of the vertex shader associated with this shader."""
+        return preprocess_imports(read_glsl_source_file(self.VERTEX_SHADER_FILENAME))
 
-    def compile_fragment_shader(self, node: 'GShaderNode') -> gloo.FragmentShader:
+    def generate_fragment_code(self, node: 'GShaderNode') -> str:
         """
-        Constructs the fragment shader other_code from this shader and (optionally) all connected shaders and compiles it.
+        Constructs the fragment shader source code from this shader and (optionally) all connected shaders.
 
-        :param node: The Node object that represents this shader in the node node_graph. If this is not provided, this function will only compile the
-        code belonging to this shader.
-        :return: the compiled FragmentShader
+        :param node: The Node object that represents this shader in the node node_graph. If this is not provided, this function will only return
+        the code belonging to this shader.
+        :return: the fragment shader source code
         """
         assert self.__class__.FRAGMENT_SHADER_FILENAME, "Name of GLSL fragment shader need to be set by subclass"
 
         if not node:
             fragment_code = read_glsl_source_file(self.FRAGMENT_SHADER_FILENAME)
-            fragment_code = preprocess_imports(fragment_code)
-            return gloo.FragmentShader(fragment_code, version=self._glsl_version)
+            return preprocess_imports(fragment_code)
         else:
             output_code = self._parsed_code
             connect_code(node, output_code)
-            generated_code = output_code.generate_code()
-            return gloo.FragmentShader(generated_code, version=self._glsl_version)
+            return output_code.generate_code()
+
+    def compile_vertex_shader(self) -> gloo.VertexShader:
+        """Compiles the vertex shader other_code associated with this shader and returns it in a glumpy VertexShader object."""
+        return gloo.VertexShader(self.generate_vertex_code(), version=self._glsl_version)
+
+    def compile_fragment_shader(self, node: 'GShaderNode') -> gloo.FragmentShader:
+        """
+        Constructs the fragment shader other_code from this shader and (optionally) all connected shaders and compiles it.
+
+        :param node: The Node object that represents this shader in the node node_graph. If this is not provided, this function will only compile the
+        code belonging to this shader.
+        :return: the compiled FragmentShader
+        """
+        return gloo.FragmentShader(self.generate_fragment_code(node), version=self._glsl_version)
 
     def set_input_by_uniform(self, uniform: str, value: typing.Any):
         """
@@ -293,23 +358,50 @@ class CompilableShader(Shader, ABC):
 
         return params
 
-    def compile(self, node: 'GShaderNode' = None) -> typing.Tuple[gloo.VertexShader, gloo.FragmentShader, gloo.Program]:
+    def compile(self, node: 'GShaderNode' = None, use_cache: bool = False) -> typing.Tuple[gloo.VertexShader, gloo.FragmentShader, gloo.Program]:
         """
         Compiles the full program with vertex and fragment shader and returns a tuple with the VertexShader, FragmentShader and compiled
         Program. Does **not** save the new shader program internally.
 
         :param node: The GShaderNode object that contains this Shader.
+        :param use_cache: If True, a Program that has already been compiled from the same source code is returned if there is one. Cached
+            Programs are shared, so their uniforms have to be set before use, and they belong to the GL context they are first drawn in. Only
+            use the cache for Programs that are all drawn in the same widget.
         :return: a tuple with the compiled VertexShader, FragmentShader and Program
         """
         start = time.time()
-        vertex_shader = self.compile_vertex_shader()
-        fragment_shader = self.compile_fragment_shader(node)
-        program = gloo.Program(vertex_shader, fragment_shader, count=0, version=self._glsl_version)
+        vertex_code, fragment_code = self.generate_code(node)
+        self._vertex_code, self._fragment_code = vertex_code, fragment_code
+        shaders = self.build(vertex_code, fragment_code, use_cache)
         compile_time = time.time() - start
 
-        _logger.debug("Compiled {} in {:.6f}ms".format(self.get_name(), compile_time * 1000))
+        _logger.debug("Compiled {} in {:.6f}ms ({})".format(self.get_name(), compile_time * 1000, program_cache))
+
+        return shaders
+
+    def generate_code(self, node: 'GShaderNode' = None) -> typing.Tuple[str, str]:
+        """Returns the source code of the vertex shader and of the fragment shader of this shader and (optionally) all connected shaders. Walks
+        the node graph, so it has to be called from the thread that owns the graph."""
+        return self.generate_vertex_code(), self.generate_fragment_code(node)
+
+    def build(self, vertex_code: str, fragment_code: str,
+              use_cache: bool = False) -> typing.Tuple[gloo.VertexShader, gloo.FragmentShader, gloo.Program]:
+        """Builds a Program from source code returned by generate_code(). Neither the node graph nor this shader are accessed, so it can be
+        called from any thread. See compile() for 'use_cache'."""
+        if use_cache:
+            return program_cache.get(vertex_code, fragment_code, self._glsl_version)
+
+        return build_program(vertex_code, fragment_code, self._glsl_version)
+
+    def set_compiled(self, vertex_code: str, fragment_code: str, shaders: typing.Tuple[gloo.VertexShader, gloo.FragmentShader, gloo.Program]):
+        """Saves a Program built by build() from 'vertex_code' and 'fragment_code' internally, as recompile() does."""
+        self._vertex_code, self._fragment_code = vertex_code, fragment_code
+        self._vertex_shader, self._fragment_shader, self._program = shaders
 
-        return vertex_shader, fragment_shader, program
+    def copy_program(self) -> gloo.Program:
+        """Returns a new Program built from the source code of the last compilation, without generating the source code again. The copy does not
+        share its uniforms with anyone else."""
+        return build_program(self._vertex_code, self._fragment_code, self._glsl_version)[2]
 
     def recompile(self, node: 'Node' = None):
         """
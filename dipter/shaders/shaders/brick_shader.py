@@ -1,5 +1,5 @@
 import dipter.shaders.lib.glsl_builtins as gl
-from dipter.shaders.lib import pattern
+from dipter.shaders.lib import pattern, vec
 from dipter.shaders.shader_super import *
 from dipter.shaders.shader_io import ShaderInputParameter
 
@@ -23,9 +23,9 @@ class BrickShader(FunctionShader):
 
     def shade_mat(self, mortar_scale: Tensor, brick_scale: Tensor, brick_elongate: Tensor, brick_shift: Tensor,
                   color_brick: Tensor, color_mortar: Tensor) -> Tensor:
-        scale = torch.cat([torch.div(brick_scale, brick_elongate + TINY_FLOAT), brick_scale, brick_scale], dim=2)
-        uv3 = pattern.tile(Shader.frag_pos(), scale, torch.cat((brick_shift, torch.zeros_like(brick_shift)), dim=2))
-        b = pattern.box(uv3[:, :, 0:2], torch.cat((mortar_scale, mortar_scale), dim=2))
+        scale = vec.cat(torch.div(brick_scale, brick_elongate + TINY_FLOAT), brick_scale, brick_scale)
+        uv3 = pattern.tile(Shader.frag_pos(), scale, vec.cat(brick_shift, torch.zeros_like(brick_shift)))
+        b = pattern.box(uv3[..., 0:2], vec.cat(mortar_scale, mortar_scale))
         frag_color = gl.mix(color_mortar, color_brick, b)
         return frag_color
 
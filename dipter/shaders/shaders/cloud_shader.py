@@ -1,4 +1,4 @@
-from dipter.shaders.lib import noise
+from dipter.shaders.lib import noise, vec
 from dipter.shaders.shader_super import *
 from dipter.shaders.shader_io import ShaderInputParameter, ShaderOutputParameter
 
@@ -23,11 +23,9 @@ class CloudShader(FunctionShader):
         ]
 
     def shade_mat(self, scale: Tensor, detail: Tensor) -> Tensor:
-        w, h = Shader.render_size()
-        uv = Shader.frag_pos()[:, :, :2]
-        color = torch.tensor((0., 0., 0.)).repeat(w, h, 1)
+        uv = Shader.frag_pos()[..., :2]
 
         fBM = noise.fractalBrownianMotion(uv*scale, detail)
-        color = color + fBM
+        color = vec.vec3(fBM)
 
         return (fBM, color)
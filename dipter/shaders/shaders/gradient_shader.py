@@ -1,3 +1,4 @@
+from dipter.shaders.lib import vec
 from dipter.shaders.shader_super import *
 from dipter.shaders.shader_io import ShaderInputParameter
 
@@ -20,4 +21,4 @@ class GradientShader(FunctionShader):
 
     def shade_mat(self) -> Tensor:
         frag_pos = Shader.frag_pos()
-        return frag_pos[:, :, 0].unsqueeze(-1).repeat(1, 1, 3)
+        return vec.xxx(frag_pos)
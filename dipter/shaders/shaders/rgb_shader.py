@@ -1,3 +1,4 @@
+from dipter.shaders.lib import vec
 from dipter.shaders.shader_super import *
 from dipter.shaders.shader_io import ShaderInputParameter
 
@@ -17,7 +18,7 @@ class RGBShader(FunctionShader):
         ]
 
     def shade_mat(self, red: Tensor, green: Tensor, blue: Tensor) -> Tensor:
-        return torch.cat((red, green, blue), dim=2)
+        return vec.cat(red, green, blue)
 
     def shade_iter(self, frag_pos: Tensor, red: Tensor, green: Tensor, blue: Tensor) -> Tensor:
         return torch.stack((red, green, blue))
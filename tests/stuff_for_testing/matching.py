@@ -0,0 +1,40 @@
+import torch
+from torch import optim
+
+from dipter.misc import material_serializer
+from dipter.node_graph.node import ShaderNode
+from dipter.optimization import losses
+from dipter.optimization.texture_matching import GradientDescentSettings
+from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
+from dipter.shaders.shaders.rgb_shader import RGBShader
+
+TARGET_COLOR = (0.5, 0.25, 0.75)
+
+
+def rgb_material() -> ShaderNode:
+    """Returns the output node of a material with a single RGB node, which texture matching should fit to a solid color."""
+    out = ShaderNode(MaterialOutputShader())
+    ShaderNode(RGBShader()).get_output_socket(0).connect_to(out.get_input_socket(0))
+    return out
+
+
+def save_rgb_material(filename: str):
+    material_serializer.save_material(rgb_material(), filename)
+
+
+def solid_target(size: int, color=TARGET_COLOR) -> torch.Tensor:
+    return torch.tensor(color).repeat(size, size, 1)
+
+
+def matching_settings(size: int = 8, **kwargs) -> GradientDescentSettings:
+    """Returns settings for matching with XSELoss and Adam at a render size of 'size' and without early stopping. Other settings can be
+    overridden with keyword arguments."""
+    settings = GradientDescentSettings()
+    settings.loss_func = losses.XSELoss
+    settings.optimizer = optim.Adam
+    settings.optimizer_args = {"lr": 0.05}
+    settings.render_width = settings.render_height = size
+    settings.early_stopping_thresh = 0.
+    for key, value in kwargs.items():
+        setattr(settings, key, value)
+    return settings
@@ -0,0 +1,9 @@
+import torch
+from dipter.misc import render_funcs
+
+
+def test_get_frag_pos_is_cached():
+    frag_pos = render_funcs.get_frag_pos(12, 8)
+    assert render_funcs.get_frag_pos(12, 8) is frag_pos, "Frag pos grid should only be generated once per size!"
+    assert render_funcs.get_frag_pos(8, 12) is not frag_pos
+    torch.testing.assert_allclose(frag_pos, render_funcs.generate_frag_pos(12, 8))
@@ -0,0 +1,113 @@
+import torch
+from dipter.node_graph.node import ShaderNode
+from dipter.shaders.shaders.brick_shader import BrickShader
+from dipter.shaders.shaders.cloud_shader import CloudShader
+from dipter.shaders.shaders.color_shader import ColorShader
+from dipter.shaders.shaders.mix_shader import MixShader
+
+
+def _count_shade_calls(node: ShaderNode) -> list:
+    calls = []
+    shader = node.get_shader()
+    shade_mat = shader.shade_mat
+
+    def counting_shade_mat(**args):
+        calls.append(1)
+        return shade_mat(**args)
+
+    shader.shade_mat = counting_shade_mat
+    return calls
+
+
+def _diamond_graph():
+    color = ShaderNode(ColorShader())
+    mix = ShaderNode(MixShader())
+    color.get_output_socket(0).connect_to(mix.get_input_socket("x"))
+    color.get_output_socket(0).connect_to(mix.get_input_socket("y"))
+    return color, mix
+
+
+def test_sorted_ancestor_nodes():
+    color, mix = _diamond_graph()
+
+    assert mix.get_sorted_ancestor_nodes(add_self=True) == [color, mix], "Connected nodes should come before the nodes they are connected to!"
+    assert mix.get_sorted_ancestor_nodes() == [color], "Node should not be returned when add_self is False!"
+    assert list(mix.get_ancestor_nodes()) == [color], "Nodes shared by several paths should only be returned once!"
+
+
+def test_shared_node_is_shaded_once():
+    color, mix = _diamond_graph()
+    calls = _count_shade_calls(color)
+
+    img, params = mix.render(10, 10)
+
+    assert len(calls) == 1, "Node connected to two inputs was shaded {} times instead of once!".format(len(calls))
+    assert list(img.shape) == [10, 10, 3]
+    assert len(params) == 2, "Only the unconnected inputs of the graph should be returned as parameters!"
+
+
+def test_render_plan_is_reused_until_graph_changes():
+    color, mix = _diamond_graph()
+    plan = mix.get_render_plan()
+
+    mix.render(10, 10)
+    assert mix.get_render_plan() is plan, "Render plan should be reused when the graph has not changed!"
+
+    color.get_output_socket(0).disconnect_from(mix.get_input_socket("y"))
+    assert mix.get_render_plan() is not plan, "Render plan should be recompiled when the graph has changed!"
+
+    _, params = mix.render(10, 10)
+    assert len(params) == 3, "Disconnected input should be returned as a parameter!"
+
+
+def test_render_plan_survives_changes_to_other_graphs():
+    _, mix = _diamond_graph()
+    plan = mix.get_render_plan()
+
+    other_color, other_mix = _diamond_graph()
+    other_color.get_output_socket(0).disconnect_from(other_mix.get_input_socket("y"))
+
+    assert mix.get_render_plan() is plan, "Render plan should not be recompiled when another graph has changed!"
+
+
+def test_render_multi_output_root():
+    cloud = ShaderNode(CloudShader())
+
+    (factor, color), _ = cloud.render(12, 10)
+
+    assert list(factor.shape) == [10, 12, 1] and list(color.shape) == [10, 12, 3], "All outputs of the root node should be rendered!"
+
+
+def test_render_batch_matches_single_renders():
+    node = ShaderNode(BrickShader())
+    _, params = node.render(12, 8)
+    scale_arg = [arg for arg in params if arg.startswith("brick_scale")][0]
+    color_arg = [arg for arg in params if arg.startswith("color_brick")][0]
+
+    scales = torch.tensor((2.0, 5.0, 10.0))
+    colors = torch.tensor(((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)))
+    imgs, _ = node.render_batch(12, 8, {scale_arg: scales, color_arg: colors})
+    assert list(imgs.shape) == [3, 8, 12, 3]
+
+    for i in range(3):
+        node.get_input_socket("brick_scale").set_value(scales[i].item())
+        node.get_input_socket("color_brick").set_value(colors[i])
+        img, _ = node.render(12, 8)
+        torch.testing.assert_allclose(imgs[i], img)
+
+
+def test_parameters_are_broadcast_instead_of_repeated():
+    node = ShaderNode(ColorShader())
+    shader = node.get_shader()
+    shade_mat = shader.shade_mat
+    arg_shapes = []
+
+    def recording_shade_mat(**args):
+        arg_shapes.extend(list(t.shape) for t in args.values())
+        return shade_mat(**args)
+
+    shader.shade_mat = recording_shade_mat
+    img, _ = node.render(12, 8)
+
+    assert arg_shapes == [[1, 1, 3]], "Unconnected parameters should be passed as broadcastable views!"
+    assert list(img.shape) == [8, 12, 3], "Rendered image should always have the full render size!"
@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+from PyQt5.QtGui import QGuiApplication
+
+from dipter.node_graph.node import ShaderNode
+from dipter.opengl.offscreen_renderer import OffscreenRenderer, program_from_graph
+from dipter.shaders.shaders.brick_shader import BrickShader
+from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
+from tests.stuff_for_testing import funcs
+
+W = H = 64
+PIXEL_TOLERANCE = 1. / 255.
+
+
+class TestOffscreenRenderer:
+
+    @classmethod
+    def setup_class(cls):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        cls.app = QGuiApplication.instance() or QGuiApplication([])
+        cls.renderer = OffscreenRenderer(W, H)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.renderer.close()
+
+    def test_glsl_matches_python(self):
+        out = ShaderNode(MaterialOutputShader())
+        brick = ShaderNode(BrickShader())
+        brick.get_output_socket(0).connect_to(out.get_input_socket(0))
+
+        py, _ = out.render(W, H)
+        gl = self.renderer.render_graph(out)
+
+        assert gl.shape == py.shape
+        funcs.assert_abs_mean_diff(py.detach().numpy(), gl.numpy(), tol=PIXEL_TOLERANCE)
+
+    def test_non_square_glsl_matches_python(self):
+        out = ShaderNode(MaterialOutputShader())
+        brick = ShaderNode(BrickShader())
+        brick.get_output_socket(0).connect_to(out.get_input_socket(0))
+        renderer = OffscreenRenderer(W, H // 2)
+
+        try:
+            gl = renderer.render_graph(out)
+        finally:
+            renderer.close()
+        py, _ = out.render(H // 2, W)
+
+        assert gl.shape == (W, H // 2, 3), "Renders should be column major, with the width as the first dimension!"
+        assert gl.shape == py.shape
+        funcs.assert_abs_mean_diff(py.detach().numpy(), gl.numpy(), tol=PIXEL_TOLERANCE)
+
+    def test_render_batch(self):
+        program = program_from_graph(ShaderNode(MaterialOutputShader()))
+        images = self.renderer.render_batch(program, [{"shader": (1., 0., 0.)}, {"shader": (0., 0., 1.)}])
+
+        assert images.shape == (2, W, H, 3)
+        assert np.allclose(images[0], (1., 0., 0.)) and np.allclose(images[1], (0., 0., 1.))
@@ -0,0 +1,66 @@
+import pytest
+
+from dipter.opengl.uniform_batch import UniformBatch
+
+
+class _RecordingProgram(dict):
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def __setitem__(self, key, value):
+        if key.startswith("unknown"):
+            raise IndexError("Unknown uniform {}".format(key))  # As glumpy does
+        self.writes.append(key)
+        super().__setitem__(key, value)
+
+
+def test_only_changed_uniforms_are_uploaded():
+    program = _RecordingProgram()
+    batch = UniformBatch(program)
+
+    batch.set("a", 1.0)
+    batch.set("b", (0.1, 0.2, 0.3))
+    assert batch.flush() == 2
+
+    batch.set("a", 1.0)
+    batch.set("b", (0.1, 0.2, 0.4))
+    batch.set("b", (0.1, 0.2, 0.5))
+    assert batch.flush() == 1, "Unchanged uniforms should not be uploaded!"
+    assert program.writes == ["a", "b", "b"], "Several updates between flushes should be coalesced into one upload!"
+    assert list(program["b"]) == [0.1, 0.2, 0.5]
+
+
+def test_new_program_gets_all_uniforms():
+    batch = UniformBatch(_RecordingProgram())
+    batch.set("a", 1.0)
+    batch.flush()
+
+    program = _RecordingProgram()
+    batch.set_program(program)
+    batch.set("a", 1.0)
+    assert batch.flush() == 1
+    assert program.writes == ["a"]
+
+
+def test_queued_values_are_dropped_for_new_program():
+    batch = UniformBatch(_RecordingProgram())
+    batch.set("unknown_in_new_program", 1.0)
+
+    program = _RecordingProgram()
+    batch.set_program(program)
+    batch.set("a", 1.0)
+    assert batch.flush() == 1 and program.writes == ["a"], "Values queued for the old Program should not be uploaded to the new one!"
+
+
+def test_unknown_uniform_does_not_block_later_flushes():
+    program = _RecordingProgram()
+    batch = UniformBatch(program)
+    batch.set("unknown", 1.0)
+    batch.set("a", 1.0)
+
+    with pytest.raises(IndexError):
+        batch.flush()
+
+    assert batch.flush() == 1 and program.writes == ["a"]
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+from PIL import Image
+
+from dipter.optimization.batch_matching import ResultStore, _parse_args, create_jobs, find_targets, run_batch
+from tests.stuff_for_testing.matching import matching_settings, save_rgb_material
+
+
+def test_batch_results_are_stored_and_resumed(tmp_path):
+    material = str(tmp_path / "rgb.json")
+    save_rgb_material(material)
+
+    target_dir = tmp_path / "targets"
+    target_dir.mkdir()
+    for name, color in [("red.png", (255, 0, 0)), ("blue.png", (0, 0, 255))]:
+        Image.new("RGB", (8, 8), color).save(str(target_dir / name))
+    (target_dir / "notes.txt").write_text("not an image")
+
+    targets = find_targets(str(target_dir))
+    assert [os.path.basename(t) for t in targets] == ["blue.png", "red.png"]
+
+    store = ResultStore(str(tmp_path / "results.jsonl"))
+    jobs = create_jobs([material, str(tmp_path / "missing.json")], targets, matching_settings(max_iter=5))
+    assert run_batch(jobs, store, workers=2) == 4
+
+    results = store.load()
+    assert len(results) == 4
+    assert sum("error" in r for r in results) == 2, "Jobs with a missing material should fail without stopping the batch!"
+    assert all(len(r["loss_hist"]) == r["iterations"] for r in results if "error" not in r)
+
+    assert run_batch(jobs, store, workers=1) == 2, "Only the failed jobs should be run again!"
+
+
+def test_batch_rejects_checkpoint_options():
+    assert _parse_args(["rgb.json", "--targets", "targets", "--store", "results.jsonl"]).materials == ["rgb.json"]
+    for option in [["--checkpoint", "checkpoint.hdf5"], ["--resume", "checkpoint.hdf5"]]:
+        with pytest.raises(SystemExit):
+            _parse_args(["rgb.json", "--targets", "targets", "--store", "results.jsonl", *option])
@@ -0,0 +1,34 @@
+import h5py
+import numpy as np
+from torch import optim
+
+from dipter.optimization.texture_matching import GradientDescentSettings, TextureMatching, load_checkpoint
+from tests.stuff_for_testing.matching import matching_settings, rgb_material, solid_target
+
+TARGET = solid_target(8)
+
+
+def _settings(checkpoint_path: str) -> GradientDescentSettings:
+    return matching_settings(max_iter=20, checkpoint_path=checkpoint_path, checkpoint_interval=5)
+
+
+def test_resumed_matching_continues_where_it_stopped(tmp_path):
+    _, expected_hist, _ = TextureMatching(TARGET, rgb_material(), _settings("")).run()
+
+    checkpoint_path = str(tmp_path / "checkpoint.hdf5")
+    matching = TextureMatching(TARGET, rgb_material(), _settings(checkpoint_path))
+    matching.iteration_done_callback = lambda props: matching.stop() if props['iter'] == 11 else None
+    matching.run()
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    assert checkpoint["iteration"] == 12 and len(checkpoint["loss_hist"]) == 12
+
+    settings = GradientDescentSettings()
+    settings.load_from_hdf5(h5py.File(checkpoint_path, "r"))
+    assert settings.optimizer is optim.Adam and settings.max_iter == 20 and settings.checkpoint_interval == 5
+    assert settings.checkpoint_path == "" and not settings.resume, "Options of a single run should not be loaded!"
+    settings.checkpoint_path = checkpoint_path
+    settings.resume = True
+
+    _, loss_hist, _ = TextureMatching(TARGET, rgb_material(), settings).run()
+    np.testing.assert_allclose(loss_hist, expected_hist, rtol=1e-5)
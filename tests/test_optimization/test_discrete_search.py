@@ -0,0 +1,53 @@
+import torch
+
+from dipter.node_graph.data_type import DataType
+from dipter.node_graph.node import ShaderNode
+from dipter.node_graph.parameter import Parameter
+from dipter.optimization.texture_matching import TextureMatching, discrete_assignments
+from dipter.shaders.shader_io import ShaderInputParameter
+from dipter.shaders.shaders.cloud_shader import CloudShader
+from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
+from tests.stuff_for_testing.matching import matching_settings
+
+
+def _operation(value: float) -> Parameter:
+    si = ShaderInputParameter("Operation", "operation", DataType.Int_Choice, (0, 3), 0, force_scalar=True)
+    return Parameter(si, torch.tensor([value]))
+
+
+def test_discrete_assignments_enumerates_or_samples():
+    params = {"op1": _operation(2.), "op2": _operation(1.)}
+
+    assignments = discrete_assignments(params, 16)
+    assert len(assignments) == 16
+    assert {(float(a["op1"][0]), float(a["op2"][0])) for a in assignments} == {(i, j) for i in range(4) for j in range(4)}
+
+    assignments = discrete_assignments(params, 5, seed=0)
+    keys = [(float(a["op1"][0]), float(a["op2"][0])) for a in assignments]
+    assert len(set(keys)) == 5 and keys[0] == (2., 1.), "The current values should always be the first assignment!"
+
+
+def test_discrete_search_finds_detail():
+    out = ShaderNode(MaterialOutputShader())
+    cloud = ShaderNode(CloudShader())
+    cloud.get_output_socket(1).connect_to(out.get_input_socket(0))
+    cloud.get_input_socket("scale").set_value(torch.tensor(3.))
+    cloud.get_input_socket("detail").set_value(torch.tensor(2.))
+    target, _ = out.render(16, 16)
+    target = target.detach()
+    cloud.get_input_socket("detail").set_value(torch.tensor(4.))
+
+    settings = matching_settings(16, optimizer_args={"lr": 0.001}, max_iter=8, halving_interval=2, discrete_candidates=16)
+
+    rounds = []
+    matching = TextureMatching(target, out, settings, iteration_done_callback=lambda props: rounds.append(props['num_candidates']))
+    params, loss_hist, info = matching.run()
+
+    assert rounds == [11, 5, 2, 1], "The worst half of the candidates should be discarded after every round!"
+    assert len(loss_hist) == 4 and info["candidate_losses"].shape == (11,)
+    detail = [k for k in params if params[k].dtype() == DataType.Int][0]
+    assert float(info["min_params"][detail]) == 2.
+    assert info["min_loss"] < 1e-4
+
+    matching.restore_params()
+    assert float(params[detail].get_value()) == 4., "Restoring should go back to the values from before the search!"
@@ -0,0 +1,71 @@
+import numpy as np
+import torch
+
+from dipter.node_graph.data_type import DataType
+from dipter.node_graph.parameter import Parameter
+from dipter.optimization import losses
+from dipter.optimization.gradient_free import SearchSpace, CMAES, NelderMead, RandomSearch, GraphEvaluator, ProcessEvaluator
+from dipter.optimization.texture_matching import TextureMatching
+from dipter.shaders.shader_io import ShaderInputParameter
+from tests.stuff_for_testing.matching import matching_settings, rgb_material, solid_target
+
+MINIMUM = np.array((0.2, 0.7, 0.4))
+
+
+def test_search_space_rounds_integers():
+    params = {
+        "detail": Parameter(ShaderInputParameter("Detail", "detail", DataType.Int, (0, 10), 4., force_scalar=True), torch.tensor([4.])),
+        "color": Parameter(ShaderInputParameter("Color", "color", DataType.Vec3_RGB, (0, 1), 0.), torch.tensor([0.1, 0.5, 0.9])),
+    }
+    space = SearchSpace(params)
+
+    x = space.encode()
+    np.testing.assert_allclose(x, [0.4, 0.1, 0.5, 0.9], atol=1e-6)
+    values = space.decode(np.array([0.37, 0.25, -0.5, 1.5]))
+    assert values["detail"].shape == (1,) and values["color"].shape == (3,)
+    np.testing.assert_allclose(values["detail"], [4.])
+    np.testing.assert_allclose(values["color"], [0.25, 0., 1.])
+    np.testing.assert_allclose(space.steps(), [0.1, 0., 0., 0.])
+
+
+def test_optimizers_minimize_quadratic():
+    for optimizer in [CMAES(np.full(3, 0.5), seed=0), NelderMead(np.full(3, 0.5)), RandomSearch(np.full(3, 0.5), seed=0)]:
+        best, best_loss = None, np.inf
+        for _ in range(150):
+            xs = optimizer.ask()
+            loss = np.sum((xs - MINIMUM) ** 2, axis=1)
+            optimizer.tell(xs, loss)
+            if loss.min() < best_loss:
+                best, best_loss = xs[np.argmin(loss)], loss.min()
+
+        np.testing.assert_allclose(best, MINIMUM, atol=0.02, err_msg="{} did not find the minimum!".format(type(optimizer).__name__))
+
+
+def test_texture_matching_with_cmaes():
+    out = rgb_material()
+    target = solid_target(8)
+    settings = matching_settings(optimizer=CMAES, optimizer_args={"seed": 0}, max_iter=60)
+
+    matching = TextureMatching(target, out, settings)
+    params, loss_hist, info = matching.run()
+
+    assert len(loss_hist) == settings.max_iter and info["min_loss"] == loss_hist.min()
+    assert info["min_loss"] < loss_hist[0]
+    img, _ = out.render(8, 8, retain_graph=True)
+    torch.testing.assert_allclose(img[0, 0], target[0, 0], atol=0.05, rtol=0.)
+
+
+def test_process_evaluator_matches_graph_evaluator():
+    out = rgb_material()
+    target = solid_target(8)
+    _, params = out.render(8, 8)
+    key = list(params)[0]
+    candidates = [{key: np.array(c, dtype=np.float32)} for c in [(0.5, 0.25, 0.75), (0., 1., 0.), (0.3, 0.3, 0.3)]]
+
+    expected = GraphEvaluator(out, params, target, losses.XSELoss(), 8, 8)(candidates)
+    evaluate = ProcessEvaluator(out, params, target, losses.XSELoss, {}, 8, 8, workers=2)
+    try:
+        np.testing.assert_allclose(evaluate(candidates), expected, rtol=1e-5)
+        np.testing.assert_allclose(evaluate(candidates[::-1]), expected[::-1], rtol=1e-5)
+    finally:
+        evaluate.close()
@@ -0,0 +1,46 @@
+import numpy as np
+import torch
+
+from dipter.node_graph.node import ShaderNode
+from dipter.optimization.loss_surface import LossSurface, SurfaceAxis
+from dipter.optimization.losses import XSELoss
+from dipter.shaders.shaders.cloud_shader import CloudShader
+from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
+
+
+def _cloud_surface(memory_budget: int) -> LossSurface:
+    out = ShaderNode(MaterialOutputShader())
+    ShaderNode(CloudShader()).get_output_socket(1).connect_to(out.get_input_socket(0))
+    target, params = out.render(8, 8, retain_graph=True)
+    for key, p in params.items():
+        p.set_modified_arg(key)
+
+    detail = [p for k, p in params.items() if k.startswith("detail")][0]
+    scale = [p for k, p in params.items() if k.startswith("scale")][0]
+    axis1 = SurfaceAxis(detail, -1, np.array([1., 3.]))
+    axis2 = SurfaceAxis(scale, -1, np.array([2., 4., 6.]))
+    return LossSurface(out, target.detach(), 8, 8, XSELoss(), axis1, axis2, memory_budget=memory_budget)
+
+
+def test_scalar_inputs_are_rendered_point_by_point():
+    surface = _cloud_surface(memory_budget=2 * 8 * 8 * 3 * 4 * 16)  # Two renders per chunk
+    detail_value = surface._axis1.param.get_value()
+    chunks = []
+    surface.chunk_done.connect(lambda start, losses: chunks.append((start, len(losses))))
+
+    losses = surface.run()
+
+    assert chunks == [(0, 2), (2, 2), (4, 2)]
+    assert losses.shape == (2, 3) and not np.isnan(losses).any(), "Inputs forced to be scalars should be rendered one at a time!"
+    np.testing.assert_allclose(surface._axis1.param.get_value(), detail_value, err_msg="Values of the axes should be restored!")
+
+
+def test_finished_is_emitted_when_the_calculation_fails():
+    surface = _cloud_surface(memory_budget=1)
+    surface._loss_func = lambda x, target: torch.tensor(0.)  # Has no forward_batch
+    finished = []
+    surface.finished.connect(finished.append)
+
+    surface.run()
+
+    assert len(finished) == 1 and np.isnan(finished[0]).all(), "A failed calculation should still report that it finished!"
@@ -0,0 +1,113 @@
+import pytest
+import torch
+from torchvision import transforms as T
+
+from dipter.optimization import losses
+from dipter.optimization.losses import XSELoss, SquaredBinLoss, NeuralLoss
+
+
+def test_forward_batch_matches_forward():
+    x = torch.rand(4, 20, 20, 3)
+    target = torch.rand(20, 20, 3)
+
+    for loss_func in [XSELoss(reduction="mean"), XSELoss(reduction="sum"), SquaredBinLoss(bin_size=10)]:
+        expected = torch.stack([loss_func(img, target) for img in x])
+        torch.testing.assert_allclose(loss_func.forward_batch(x, target), expected)
+
+
+def _small_feature_layers():
+    torch.manual_seed(0)
+    return (torch.nn.Conv2d(3, 4, 3), torch.nn.ReLU(), torch.nn.AvgPool2d(2), torch.nn.Conv2d(4, 4, 3), torch.nn.ReLU(),
+            torch.nn.Conv2d(4, 4, 3))
+
+
+def test_neural_loss_caches_target_grams(monkeypatch):
+    layers = _small_feature_layers()
+    monkeypatch.setattr(losses, "vgg19_feature_layers", lambda: layers)
+    loss_func = NeuralLoss(layers=[1, 4], layer_weights=[0.5, 2.])
+    assert len(loss_func.modulelist) == 5, "Layers after the deepest requested layer should not be evaluated!"
+
+    calls = []
+    layers[0].register_forward_hook(lambda mod, inp, out: calls.append(inp[0].shape[0]))
+    x = torch.rand(224, 224, 3)
+    target = torch.rand(224, 224, 3)
+    loss_func(x, target)
+    loss_func(torch.rand(224, 224, 3), target)
+    assert calls == [1, 1, 1], "Target should only be passed through the network once!"
+
+    target.mul_(0.5)
+    loss_func(x, target)
+    assert len(calls) == 5, "Target Grams should be computed again if the target changes!"
+
+
+def test_neural_loss_matches_reference(monkeypatch):
+    layers = _small_feature_layers()
+    monkeypatch.setattr(losses, "vgg19_feature_layers", lambda: layers)
+    loss_func = NeuralLoss(layers=[1, 4], layer_weights=[0.5, 2.])
+    x = torch.rand(224, 224, 3)
+    target = torch.rand(224, 224, 3)
+
+    def reference(img):
+        out = T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])(img.permute(2, 1, 0)).unsqueeze(0)
+        features = []
+        for i, layer in enumerate(layers[:5]):
+            out = layer(out)
+            if i in [1, 4]:
+                features.append(out.view(out.shape[1], -1))
+        return features
+
+    expected = 0
+    for F1, F2, w in zip(reference(x), reference(target), [0.5, 2.]):
+        N, M = F1.shape
+        expected += w * torch.sum((F1 @ F1.t() - F2 @ F2.t()) ** 2) / (4. * N ** 2 * M ** 2)
+
+    torch.testing.assert_allclose(loss_func(x, target), expected)
+    torch.testing.assert_allclose(loss_func.forward_batch(torch.stack([x, target]), target), torch.stack([expected, torch.tensor(0.)]))
+
+
+def test_neural_loss_fast_modes_match_float32(monkeypatch):
+    layers = _small_feature_layers()
+    monkeypatch.setattr(losses, "vgg19_feature_layers", lambda: layers)
+    x = torch.rand(224, 224, 3)
+    target = torch.rand(224, 224, 3)
+    expected = NeuralLoss(layers=[1, 4])(x, target)
+
+    modes = [dict(channels_last=True), dict(feature_extractor="trace")]
+    if hasattr(getattr(torch, "cpu", None), "amp"):
+        modes += [dict(precision="bfloat16"), dict(precision="bfloat16", channels_last=True, feature_extractor="trace")]
+
+    for kwargs in modes:
+        loss = NeuralLoss(layers=[1, 4], **kwargs)(x, target)
+        assert loss.dtype == torch.float32
+        torch.testing.assert_allclose(loss, expected, rtol=0.05, atol=0., msg="NeuralLoss with {} is not accurate enough!".format(kwargs))
+
+
+def test_neural_loss_channels_last_does_not_change_shared_layers(monkeypatch):
+    layers = _small_feature_layers()
+    monkeypatch.setattr(losses, "vgg19_feature_layers", lambda: layers)
+
+    NeuralLoss(layers=[1, 4], channels_last=True)
+
+    assert layers[0].weight.is_contiguous(), "Layers shared by all NeuralLoss instances should not be converted to channels last!"
+
+
+def test_neural_loss_conversions_do_not_change_shared_layers(monkeypatch):
+    layers = _small_feature_layers()
+    monkeypatch.setattr(losses, "vgg19_feature_layers", lambda: layers)
+    for layer in layers:
+        layer.eval()
+
+    loss_func = NeuralLoss(layers=[1, 4]).double()
+    loss_func.train()
+
+    assert layers[0].weight.dtype == torch.float32 and not layers[0].training, "Layers shared by all NeuralLoss instances should not change!"
+    x = torch.rand(224, 224, 3, dtype=torch.float64)
+    loss_func(x, x.clone())  # Fails if the layers of this instance were not converted
+
+
+def test_neural_loss_rejects_unavailable_modes(monkeypatch):
+    monkeypatch.setattr(losses, "vgg19_feature_layers", _small_feature_layers)
+    monkeypatch.delattr(torch, "compile", raising=False)
+
+    with pytest.raises(ValueError):
+        NeuralLoss(layers=[1], feature_extractor="compile")
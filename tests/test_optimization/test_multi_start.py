@@ -0,0 +1,32 @@
+import torch
+
+from dipter.optimization.texture_matching import TextureMatching
+from tests.stuff_for_testing.matching import matching_settings, rgb_material, solid_target
+
+
+def test_multi_start_halves_starts_and_returns_best():
+    out = rgb_material()
+    settings = matching_settings(max_iter=40, num_starts=8, halving_interval=2)
+
+    num_starts = []
+    matching = TextureMatching(solid_target(8), out, settings, iteration_done_callback=lambda props: num_starts.append(props['num_starts']))
+    params, loss_hist, info = matching.run()
+
+    assert num_starts[:8] == [8, 8, 4, 4, 2, 2, 1, 1], "The worst half of the starting points should be discarded every 2 iterations!"
+    assert len(loss_hist) == settings.max_iter and info["start_losses"].shape == (8,)
+    assert info["min_loss"] == info["start_losses"].min()
+    values = torch.stack([params[k].tensor().detach().reshape(-1)[0] for k in info["min_params"]])
+    torch.testing.assert_allclose(values.sort().values, torch.tensor((0.25, 0.5, 0.75)), atol=0.05, rtol=0.)
+
+
+def test_multi_start_keeps_starts_within_limits():
+    target = solid_target(8, (1.5, -0.5, 0.5))  # Can only be reached by going outside the limits of the color
+    settings = matching_settings(optimizer_args={"lr": 0.2}, max_iter=20, num_starts=4, halving_interval=0)
+
+    iterations = []
+    matching = TextureMatching(target, rgb_material(), settings, iteration_done_callback=lambda props: iterations.append(props['params']))
+    params, _, _ = matching.run()
+
+    for values in iterations + [{k: p.get_value() for k, p in params.items()}]:
+        for k, value in values.items():
+            assert params[k].get_min() <= value.min() and value.max() <= params[k].get_max(), "Starting points should be kept within limits!"
@@ -0,0 +1,139 @@
+import torch
+
+from dipter.node_graph.data_type import DataType
+from dipter.node_graph.parameter import Parameter
+from dipter.optimization.optimizers import AdamL, SGDL, RMSpropL, LBFGSL
+from dipter.shaders.shader_io import ShaderInputParameter
+
+
+def _parameter(value, limits=(0., 1.), dtype=DataType.Float) -> Parameter:
+    t = torch.tensor(value, dtype=torch.float32, requires_grad=True)
+    return Parameter(ShaderInputParameter("", "arg", dtype, limits, value), t)
+
+
+def _quadratic_loss(tensors):
+    return sum(torch.sum((t - 0.3) ** 2) for t in tensors)
+
+
+def test_adaml_matches_adam_within_limits(capsys):
+    params = [_parameter([0.5]), _parameter([0.1, 0.9, 0.6], dtype=DataType.Vec3_Float), _parameter([0.7])]
+    reference = [p.tensor().detach().clone().requires_grad_() for p in params]
+    adaml = AdamL(params, lr=0.01)
+    adam = torch.optim.Adam(reference, lr=0.01)
+
+    for _ in range(5):
+        for opt, tensors in [(adaml, [p.tensor() for p in params]), (adam, reference)]:
+            opt.zero_grad()
+            _quadratic_loss(tensors).backward()
+            opt.step()
+
+    for p, t in zip(params, reference):
+        torch.testing.assert_allclose(p.tensor(), t)
+    assert capsys.readouterr().out == "", "Optimizer should not write to stdout!"
+
+
+def test_adaml_keeps_parameters_in_one_buffer():
+    params = [_parameter([0.5]), _parameter([0.1, 0.9, 0.6], dtype=DataType.Vec3_Float)]
+    adaml = AdamL(params, lr=0.1)
+
+    def step():
+        adaml.zero_grad()
+        _quadratic_loss([p.tensor() for p in params]).backward()
+        adaml.step()
+        return adaml._flat_groups[id(adaml.param_groups[0])].buffer
+
+    buffer = step()
+    assert step() is buffer, "The buffer should persist between steps!"
+    torch.testing.assert_allclose(buffer, torch.cat([p.tensor().detach() for p in params]))
+
+    params[0].set_value(torch.tensor([0.2]))
+    new_buffer = step()
+    assert new_buffer is not buffer and params[0].tensor().item() > 0.2, "Values set between steps should be optimized from!"
+    torch.testing.assert_allclose(new_buffer, torch.cat([p.tensor().detach() for p in params]))
+
+
+def test_adaml_skips_parameters_without_gradients():
+    used, unused = _parameter([0.5]), _parameter([0.5])
+    adaml = AdamL([used, unused], lr=0.1)
+    _quadratic_loss([used.tensor()]).backward()
+    adaml.step()
+
+    assert used.tensor().item() < 0.5
+    assert unused.tensor().item() == 0.5
+
+
+def test_adaml_reverses_gradient_outside_limits():
+    inside, outside = _parameter([0.5]), _parameter([1.5])
+    adaml = AdamL([inside, outside], lr=0.1)
+    (inside.tensor() + outside.tensor()).sum().backward()
+    adaml.step()
+
+    assert inside.tensor().item() < 0.5
+    assert outside.tensor().item() > 1.5, "The gradient of a Parameter outside its limits should be reversed!"
+
+
+def _bounded_quadratic_loss(tensors):
+    # Minimum at 1.3, outside the limits [0, 1] of the Parameters, so the optimizers should stop at the upper limit
+    return sum(torch.sum((t - torch.tensor([1.3, 0.2, 0.6][:t.numel()])) ** 2) for t in tensors)
+
+
+def test_limit_aware_optimizers_stay_within_limits():
+    for optimizer_class, kwargs in [(SGDL, dict(lr=0.1, momentum=0.5)), (RMSpropL, dict(lr=0.01)), (LBFGSL, dict())]:
+        params = [_parameter([0.5]), _parameter([0.1, 0.9, 0.6], dtype=DataType.Vec3_Float)]
+        tensors = [p.tensor() for p in params]
+        optimizer = optimizer_class(params, **kwargs)
+
+        def closure():
+            optimizer.zero_grad()
+            loss = _bounded_quadratic_loss(tensors)
+            loss.backward()
+            return loss
+
+        for _ in range(100):
+            optimizer.step(closure)
+
+        assert all(torch.all((t >= 0.) & (t <= 1.)) for t in tensors), "{} moved a Parameter out of its limits!".format(optimizer_class)
+        torch.testing.assert_allclose(params[0].tensor(), torch.tensor([1.]), atol=1e-3, rtol=0.)
+        torch.testing.assert_allclose(params[1].tensor(), torch.tensor([1., 0.2, 0.6]), atol=5e-2, rtol=0.)
+
+
+def test_lbfgsl_converges_in_few_evaluations():
+    params = [_parameter([0.5]), _parameter([0.1, 0.9, 0.6], dtype=DataType.Vec3_Float)]
+    tensors = [p.tensor() for p in params]
+    optimizer = LBFGSL(params)
+    evaluations = []
+
+    def closure():
+        optimizer.zero_grad()
+        loss = _quadratic_loss(tensors)
+        loss.backward()
+        evaluations.append(loss.item())
+        return loss
+
+    for _ in range(3):
+        optimizer.step(closure)
+
+    assert min(evaluations) < 1e-6
+    assert len(evaluations) <= 30
+
+
+def test_lbfgsl_restores_accepted_point_when_line_search_fails():
+    params = [_parameter([0.5]), _parameter([0.1, 0.9, 0.6], dtype=DataType.Vec3_Float)]
+    tensors = [p.tensor() for p in params]
+    optimizer = LBFGSL(params)
+    evaluations = []
+
+    def closure():
+        optimizer.zero_grad()
+        loss = _quadratic_loss(tensors) + (100. if evaluations else 0.)  # Every trial point is worse than the starting point
+        loss.backward()
+        evaluations.append(loss.item())
+        return loss
+
+    optimizer.step(closure)
+
+    torch.testing.assert_allclose(tensors[0], torch.tensor([0.5]))
+    torch.testing.assert_allclose(tensors[1], torch.tensor([0.1, 0.9, 0.6]))
+    torch.testing.assert_allclose(tensors[1].grad, 2 * (torch.tensor([0.1, 0.9, 0.6]) - 0.3), msg="The gradient of the accepted point should be restored!")
+    assert len(evaluations) == 1 + optimizer.defaults['line_search_steps']
+    assert not optimizer.state["group_0"]['old_stps'], "A failed line search should not add to the history!"
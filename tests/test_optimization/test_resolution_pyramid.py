@@ -0,0 +1,49 @@
+import torch
+
+from dipter.node_graph.node import ShaderNode
+from dipter.optimization import losses
+from dipter.optimization.texture_matching import GradientDescentSettings, TextureMatching
+from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
+from tests.stuff_for_testing.matching import matching_settings, rgb_material, solid_target
+
+
+def test_resolution_increases_each_level():
+    settings = matching_settings(32, max_iter=10, pyramid_levels=3)
+
+    sizes = []
+    matching = TextureMatching(solid_target(32), rgb_material(), settings, iteration_done_callback=lambda props: sizes.append(props['render_size']))
+    assert matching._resolution_schedule() == [(8, 8, 0), (16, 16, 3), (32, 32, 6)]
+
+    _, loss_hist, _ = matching.run()
+
+    assert sizes == [(8, 8)] * 3 + [(16, 16)] * 3 + [(32, 32)] * 4
+    assert loss_hist[-1] < loss_hist[0], "Optimizer state should carry over between levels!"
+
+
+def test_schedule_never_has_more_levels_than_iterations():
+    settings = GradientDescentSettings()
+    settings.render_width = settings.render_height = 32
+    settings.max_iter = 2
+    settings.pyramid_levels = 4
+
+    matching = TextureMatching(torch.zeros(32, 32, 3), ShaderNode(MaterialOutputShader()), settings)
+
+    assert matching._resolution_schedule() == [(16, 16, 0), (32, 32, 1)], "The last level should always be at the full render size!"
+
+
+class _FixedSizeLoss(losses.XSELoss):
+    INPUT_SIZE = (32, 32)
+
+    def _loss(self, x, target):
+        assert list(x.shape) == list(target.shape) == [32, 32, 3], "Lower levels should be resized to the input size of the loss!"
+        return super()._loss(x, target)
+
+
+def test_lower_levels_are_resized_for_fixed_size_losses():
+    settings = matching_settings(32, loss_func=_FixedSizeLoss, max_iter=6, pyramid_levels=3)
+
+    sizes = []
+    matching = TextureMatching(solid_target(32), rgb_material(), settings, iteration_done_callback=lambda props: sizes.append(props['render_size']))
+    matching.run()
+
+    assert sizes == [(8, 8)] * 2 + [(16, 16)] * 2 + [(32, 32)] * 2
@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+from PIL import Image
+
+from dipter.misc import material_serializer
+from dipter.optimization.texture_matching import main
+from tests.stuff_for_testing.matching import TARGET_COLOR, save_rgb_material
+
+
+def test_cli_matches_solid_color(tmp_path):
+    material = str(tmp_path / "rgb.json")
+    target = str(tmp_path / "target.png")
+    output = str(tmp_path / "result.json")
+    matched = str(tmp_path / "matched.json")
+    save_rgb_material(material)
+    Image.new("RGB", (16, 16), tuple(int(c * 255) for c in TARGET_COLOR)).save(target)
+
+    main([material, target, "-o", output, "--save-material", matched, "--loss", "XSELoss", "--optimizer", "Adam",
+          "--optimizer-args", '{"lr": 0.05}', "--size", "16", "16", "--max-iter", "100", "--early-stopping-thresh", "0"])
+
+    with open(output, "r", encoding="utf-8") as f:
+        result = json.load(f)
+
+    assert result["iterations"] == len(result["loss_hist"])
+    assert result["min_loss"] < result["loss_hist"][0]
+    values = sorted(np.ravel(v)[0] for v in result["min_params"].values())
+    np.testing.assert_allclose(values, sorted(TARGET_COLOR), atol=0.05)
+
+    out, _ = material_serializer.load_material(matched)
+    img, _ = out.render(16, 16)
+    np.testing.assert_allclose(img[0, 0].detach().numpy(), TARGET_COLOR, atol=0.05)
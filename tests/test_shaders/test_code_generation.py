@@ -0,0 +1,47 @@
+from dipter.node_graph.node import ShaderNode
+from dipter.shaders.shaders.brick_shader import BrickShader
+from dipter.shaders.shaders.material_output_shader import MaterialOutputShader
+from dipter.shaders.shaders.rgb_shader import RGBShader
+
+
+def _count_resets(node: ShaderNode) -> list:
+    calls = []
+    code = node.get_shader().get_code()
+    reset = code.reset
+
+    def counting_reset(node_num):
+        calls.append(node_num)
+        reset(node_num)
+
+    code.reset = counting_reset
+    return calls
+
+
+def test_unchanged_graph_is_not_generated_again():
+    out = ShaderNode(MaterialOutputShader())
+    brick = ShaderNode(BrickShader())
+    brick.get_output_socket(0).connect_to(out.get_input_socket(0))
+    shader = out.get_shader()
+
+    first = shader.generate_fragment_code(out)
+    resets = _count_resets(brick)
+    second = shader.generate_fragment_code(out)
+
+    assert second is first, "Generated code should be reused when the node graph has not changed!"
+    assert resets == [], "Unchanged subgraphs should not be reset!"
+
+
+def test_changed_graph_is_generated_again():
+    out = ShaderNode(MaterialOutputShader())
+    brick = ShaderNode(BrickShader())
+    rgb = ShaderNode(RGBShader())
+    brick.get_output_socket(0).connect_to(out.get_input_socket(0))
+    shader = out.get_shader()
+
+    brick_code = shader.generate_fragment_code(out)
+    brick.get_output_socket(0).disconnect_from(out.get_input_socket(0))
+    rgb.get_output_socket(0).connect_to(out.get_input_socket(0))
+    rgb_code = shader.generate_fragment_code(out)
+
+    assert rgb_code != brick_code
+    assert "rgb_shader_rgb" in rgb_code and "brick_shader_brick_shade" not in rgb_code
@@ -0,0 +1,20 @@
+from dipter.shaders.program_cache import ProgramCache
+
+VERTEX_CODE = "void main() { gl_Position = vec4(0.0); }"
+FRAGMENT_CODE = "out vec4 color; void main() {{ color = vec4({}); }}"
+
+
+def test_program_cache_hits_and_evicts():
+    cache = ProgramCache(maxsize=1)
+
+    _, _, p1 = cache.get(VERTEX_CODE, FRAGMENT_CODE.format(0.0), "430")
+    _, _, p2 = cache.get(VERTEX_CODE, FRAGMENT_CODE.format(0.0), "430")
+    assert p1 is p2, "Program compiled from the same source should be reused!"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache.get(VERTEX_CODE, FRAGMENT_CODE.format(1.0), "430")
+    assert len(cache) == 1, "Least recently used Program should be evicted!"
+
+    _, _, p3 = cache.get(VERTEX_CODE, FRAGMENT_CODE.format(0.0), "430")
+    assert p3 is not p1
+    assert (cache.hits, cache.misses) == (1, 3)
@@ -0,0 +1,36 @@
+import threading
+
+from dipter.node_graph.node import ShaderNode
+from dipter.shaders import render_context
+from dipter.shaders.render_context import RenderContext
+from dipter.shaders.shader_super import Shader
+from dipter.shaders.shaders.brick_shader import BrickShader
+
+
+def test_context_is_restored_after_exit():
+    Shader.set_render_size(10, 20)
+
+    with RenderContext(30, 40) as context:
+        assert render_context.current() is context
+        assert Shader.render_size() == (40, 30)
+
+    assert Shader.render_size() == (20, 10)
+
+
+def test_threads_do_not_share_render_size():
+    results = {}
+
+    def render(width, height):
+        node = ShaderNode(BrickShader())
+        for _ in range(5):
+            img, _ = node.render(width, height)
+            results.setdefault((width, height), []).append(list(img.shape))
+
+    threads = [threading.Thread(target=render, args=size) for size in [(16, 8), (8, 32)]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results[(16, 8)] == [[8, 16, 3]] * 5
+    assert results[(8, 32)] == [[32, 8, 3]] * 5
@@ -0,0 +1,25 @@
+import os
+
+from dipter.shaders.parsing import parsing
+from dipter.shaders.shaders.brick_shader import BrickShader
+
+
+def test_read_source_lines_is_invalidated_by_mtime(tmp_path):
+    path = tmp_path / "lib.glsl"
+    path.write_text("float a;\n")
+
+    lines = parsing.read_source_lines(path)
+    lines.append("modified by caller\n")
+    assert parsing.read_source_lines(path) == ["float a;\n"], "Cached lines should not be modified by callers!"
+
+    path.write_text("float b;\n")
+    os.utime(str(path), (0, 12345))
+    assert parsing.read_source_lines(path) == ["float b;\n"], "Changed files should be read again!"
+
+
+def test_shader_instances_do_not_share_parsed_code():
+    s1, s2 = BrickShader(), BrickShader()
+
+    assert s1.get_parsed_code() is not s2.get_parsed_code()
+    assert s1.get_parsed_code().primary_function is not s2.get_parsed_code().primary_function
+    assert s1.get_parsed_code().primary_function.function_name == s2.get_parsed_code().primary_function.function_name